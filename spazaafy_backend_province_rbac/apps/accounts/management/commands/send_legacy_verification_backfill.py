@@ -1,14 +1,29 @@
+import time
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
 from django.conf import settings
 from django.core.mail import EmailMessage
-from apps.accounts.models import EmailVerificationToken, User
+from django.db import transaction
+from apps.accounts.models import EmailVerificationToken, User, VERIFY_EMAIL_TEMPLATE_ID
+from apps.core.jobs import map_concurrently
+from apps.core.mail_dispatch import get_dispatcher
+from apps.core.models import CommandCheckpoint
+
+CHECKPOINT_NAME = 'send_legacy_verification_backfill'
+
 
 class Command(BaseCommand):
     help = 'One-off script: Sends a fresh verification link to OLD unverified accounts and marks them as reminded.'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users per chunk (one UPDATE per chunk)')
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'BULK_EMAIL_WORKERS', 8))
+        parser.add_argument('--rate', type=float, default=getattr(settings, 'BULK_EMAIL_RATE', 20),
+                            help='Max emails per second (0 = unlimited)')
+        parser.add_argument('--reset', action='store_true', help='Ignore the saved cursor and start from the first user')
+
+    def handle(self, *args, **options):
         now = timezone.now()
         cutoff_date = now - timedelta(days=7)
 
@@ -20,55 +35,117 @@ class Command(BaseCommand):
             is_active=False,
             date_joined__lt=cutoff_date,
             reminders_sent_count=0
-        )
+        ).exclude(email='')
+
+        # ✅ Resume from the last finished chunk unless told otherwise
+        checkpoint, created = CommandCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+        if options['reset'] or checkpoint.finished_at:
+            if checkpoint.finished_at and not options['reset']:
+                self.stdout.write(self.style.WARNING(
+                    f"Previous backfill finished at {checkpoint.finished_at:%Y-%m-%d %H:%M}; starting a new pass."
+                ))
+            checkpoint.cursor = ''
+            checkpoint.processed = checkpoint.succeeded = checkpoint.failed = 0
+            checkpoint.finished_at = None
+            checkpoint.save()
+        elif checkpoint.cursor:
+            self.stdout.write(self.style.WARNING(
+                f"Resuming after user id {checkpoint.cursor} ({checkpoint.processed} already processed)."
+            ))
 
-        count = legacy_users.count()
+        last_id = int(checkpoint.cursor or 0)
+        count = legacy_users.filter(id__gt=last_id).count()
         if count == 0:
             self.stdout.write(self.style.SUCCESS("No legacy unverified users found."))
+            checkpoint.finished_at = timezone.now()
+            checkpoint.save(update_fields=['finished_at', 'updated_at'])
             return
 
         self.stdout.write(self.style.WARNING(f"Found {count} legacy users. Sending emails..."))
 
-        for user in legacy_users:
-            try:
-                # 1. Delete old token
-                EmailVerificationToken.objects.filter(user=user).delete()
-                
-                # 2. Create new token (Valid for 24h)
-                new_token_obj = EmailVerificationToken.objects.create(user=user)
-                
-                # 3. Send Email
-                self.send_reminder_email(user, new_token_obj)
-                
-                # 4. Mark as fully reminded
-                # Setting count to 3 ensures the DAILY cron job ignores them 
-                # (since it filters for count < 3)
-                user.reminders_sent_count = 3 
-                user.last_reminder_sent_at = now
-                user.save()
-                
-                self.stdout.write(f"Sent backfill email to {user.email}")
-            
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Failed to email {user.email}: {e}"))
-
-        self.stdout.write(self.style.SUCCESS(f"Backfill complete. Processed {count} users."))
-
-    def send_reminder_email(self, user, token_obj):
+        started = time.monotonic()
+        done = 0
+        while True:
+            # Keyset pagination: each chunk starts after the last id of the previous one
+            rows = list(
+                legacy_users.filter(id__gt=last_id).order_by('id')
+                .values('id', 'email', 'first_name')[:options['chunk_size']]
+            )
+            if not rows:
+                break
+
+            sent_ids, failed = self.process_chunk(rows, options)
+            last_id = rows[-1]['id']
+
+            # 4. Mark as fully reminded, and move the cursor, in one transaction
+            # Setting count to 3 ensures the DAILY cron job ignores them
+            # (since it filters for count < 3)
+            with transaction.atomic():
+                User.objects.filter(id__in=sent_ids).update(
+                    reminders_sent_count=3,
+                    last_reminder_sent_at=now,
+                )
+                checkpoint.cursor = str(last_id)
+                checkpoint.processed += len(rows)
+                checkpoint.succeeded += len(sent_ids)
+                checkpoint.failed += failed
+                checkpoint.save()
+
+            done += len(rows)
+            elapsed = time.monotonic() - started
+            rate = done / elapsed if elapsed > 0 else 0
+            eta = f"{(count - done) / rate:.0f}s" if rate and count > done else "-"
+            self.stdout.write(
+                f"[{done}/{count}] sent {checkpoint.succeeded}, failed {checkpoint.failed} "
+                f"- {rate:.1f} users/s, ETA {eta} (cursor {last_id})"
+            )
+
+        checkpoint.finished_at = timezone.now()
+        checkpoint.save(update_fields=['finished_at', 'updated_at'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfill complete. Processed {done} users in {elapsed:.1f}s "
+            f"({checkpoint.succeeded} sent, {checkpoint.failed} failed in total)."
+        ))
+
+    def process_chunk(self, rows, options):
+        """Fresh tokens for the chunk, then concurrent sends. Returns (sent user ids, failure count)."""
+        ids = [row['id'] for row in rows]
+        with transaction.atomic():
+            # 1. Delete old tokens
+            EmailVerificationToken.objects.filter(user_id__in=ids).delete()
+            # 2. Create new tokens (Valid for 24h)
+            tokens = EmailVerificationToken.objects.bulk_create([EmailVerificationToken(user_id=i) for i in ids])
+        token_by_user = {t.user_id: t.token for t in tokens}
+        for row in rows:
+            row['token'] = token_by_user[row['id']]
+
+        # 3. Send Emails
+        sent_ids, failed = [], 0
+        results = map_concurrently(self.send_reminder_email, rows, workers=options['workers'], rate=options['rate'])
+        for row, _, error in results:
+            if error:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"Failed to email {row['email']}: {error}"))
+            else:
+                sent_ids.append(row['id'])
+        return sent_ids, failed
+
+    def send_reminder_email(self, row):
         frontend_url = settings.FRONTEND_URL.rstrip('/')
-        verification_url = f"{frontend_url}/verify-email/{token_obj.token}"
+        verification_url = f"{frontend_url}/verify-email/{row['token']}"
 
         message = EmailMessage(
             subject="Action Required: Verify your Spazaafy account",
-            to=[user.email],
+            to=[row['email']],
             from_email=settings.DEFAULT_FROM_EMAIL,
         )
 
-        message.template_id = 2 
+        message.template_id = VERIFY_EMAIL_TEMPLATE_ID
 
         message.merge_global_data = {
-            'NAME': user.first_name if user.first_name else "User",
+            'NAME': row['first_name'] if row['first_name'] else "User",
             'LINK': verification_url,
         }
 
-        message.send()
\ No newline at end of file
+        get_dispatcher().call_primary(message.send)
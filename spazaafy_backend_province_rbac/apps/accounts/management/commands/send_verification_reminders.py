@@ -5,91 +5,122 @@ from django.utils import timezone
 from datetime import timedelta
 from django.conf import settings
 from django.core.mail import EmailMessage
+from django.db import transaction
+from django.db.models import Q
 from apps.accounts.models import EmailVerificationToken, User # ✅ Import User model
+from apps.core.jobs import map_concurrently
+from apps.core.mail_dispatch import get_dispatcher
+
+# reminders_sent_count -> (days since joining before it is due, label)
+REMINDER_STAGES = [
+    (1, "1-day"),
+    (3, "3-day"),
+    (7, "7-day"),
+]
+# Prevent sending multiple reminders within a day (e.g. if cron runs multiple times)
+COOLDOWN = timedelta(hours=23)
+
 
 class Command(BaseCommand):
     help = 'Sends reminder emails to unverified users 1, 3, and 7 days after registration.'
 
-    def handle(self, *args, **kwargs):
-        now = timezone.now()
-        
-        # Filter for users who are NOT active and have NOT exceeded 3 reminders
-        # We also check their original date_joined for the 1-day reminder
-        users_to_remind = User.objects.filter(
-            is_active=False, 
-            reminders_sent_count__lt=3 # We want to send 3 reminders max
-        ).order_by('date_joined') # Process oldest first
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Users fetched and updated per batch')
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'BULK_EMAIL_WORKERS', 8))
+        parser.add_argument('--rate', type=float, default=getattr(settings, 'BULK_EMAIL_RATE', 20),
+                            help='Max emails per second (0 = unlimited)')
 
+    def handle(self, *args, **options):
+        now = timezone.now()
+        self.verbosity = options['verbosity']
         count_sent = 0
 
-        for user in users_to_remind:
-            days_since_joined = (now - user.date_joined).days
-            
-            # Conditions for sending reminders
-            send_reminder_now = False
-            reminder_type = None
-
-            if days_since_joined >= 1 and user.reminders_sent_count == 0:
-                send_reminder_now = True
-                reminder_type = "1-day"
-            elif days_since_joined >= 3 and user.reminders_sent_count == 1:
-                send_reminder_now = True
-                reminder_type = "3-day"
-            elif days_since_joined >= 7 and user.reminders_sent_count == 2:
-                send_reminder_now = True
-                reminder_type = "7-day"
-            
-            # Prevent sending multiple reminders within a day (e.g. if cron runs multiple times)
-            if user.last_reminder_sent_at and (now - user.last_reminder_sent_at).total_seconds() < (23 * 3600):
-                 # Skip if a reminder was sent very recently
-                 send_reminder_now = False
-                 self.stdout.write(f"Skipping {user.email}: A reminder was sent less than 23 hours ago.")
-
-            if send_reminder_now:
-                try:
-                    # ✅ 1. Delete any existing token for this user
-                    EmailVerificationToken.objects.filter(user=user).delete()
-                    # ✅ 2. Create a brand new token
-                    new_token_obj = EmailVerificationToken.objects.create(user=user)
-                    
-                    self.send_reminder_email(user, new_token_obj, reminder_type)
-                    
-                    # ✅ 3. Update user's reminder state
-                    user.reminders_sent_count += 1
-                    user.last_reminder_sent_at = now
-                    user.save()
-                    count_sent += 1
-                    self.stdout.write(f"Sent {reminder_type} reminder to {user.email}")
-
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f"Failed to send {reminder_type} reminder email to {user.email}: {e}"))
+        # The stage and cooldown rules are evaluated by the database, so only
+        # users who are actually due are ever loaded.
+        unverified = User.objects.filter(is_active=False).exclude(email='')
+        off_cooldown = Q(last_reminder_sent_at__isnull=True) | Q(last_reminder_sent_at__lte=now - COOLDOWN)
+
+        cooling_down = unverified.filter(reminders_sent_count__lt=len(REMINDER_STAGES)).exclude(off_cooldown).count()
+        if cooling_down:
+            self.stdout.write(f"Skipping {cooling_down} users: a reminder was sent less than 23 hours ago.")
+
+        for stage, (days, reminder_type) in enumerate(REMINDER_STAGES):
+            due = unverified.filter(off_cooldown, reminders_sent_count=stage, date_joined__lte=now - timedelta(days=days))
+            sent, failed = self.run_stage(due, stage, reminder_type, now, options)
+            count_sent += sent
+            self.stdout.write(f"{reminder_type}: sent {sent}, failed {failed}.")
 
         self.stdout.write(self.style.SUCCESS(f"Done. Sent {count_sent} reminder emails."))
 
-    def send_reminder_email(self, user, token_obj, reminder_type):
+    def run_stage(self, due, stage, reminder_type, now, options):
+        """Walks the due users in id order, one chunk at a time."""
+        sent = failed = 0
+        last_id = 0
+        while True:
+            rows = list(
+                due.filter(id__gt=last_id).order_by('id')
+                .values('id', 'email', 'first_name')[:options['chunk_size']]
+            )
+            if not rows:
+                return sent, failed
+            last_id = rows[-1]['id']
+
+            # ✅ Replace every user's token in two queries instead of two per user
+            ids = [row['id'] for row in rows]
+            with transaction.atomic():
+                EmailVerificationToken.objects.filter(user_id__in=ids).delete()
+                tokens = EmailVerificationToken.objects.bulk_create([EmailVerificationToken(user_id=i) for i in ids])
+            token_by_user = {t.user_id: t.token for t in tokens}
+            for row in rows:
+                row['token'] = token_by_user[row['id']]
+
+            sent_ids = []
+            results = map_concurrently(
+                lambda row: self.send_reminder_email(row, reminder_type),
+                rows, workers=options['workers'], rate=options['rate'],
+            )
+            for row, _, error in results:
+                if error:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f"Failed to send {reminder_type} reminder email to {row['email']}: {error}"))
+                else:
+                    sent_ids.append(row['id'])
+                    if self.verbosity > 1:
+                        self.stdout.write(f"Sent {reminder_type} reminder to {row['email']}")
+
+            # ✅ Advance everyone who got the email with one UPDATE
+            User.objects.filter(id__in=sent_ids).update(
+                reminders_sent_count=stage + 1,
+                last_reminder_sent_at=now,
+            )
+            sent += len(sent_ids)
+
+    def send_reminder_email(self, row, reminder_type):
         """
         Sends the account verification reminder email with a new link.
+        Raises if Brevo rejects it (or is known to be down), so the user stays due.
         """
         frontend_url = settings.FRONTEND_URL.rstrip('/')
-        verification_url = f"{frontend_url}/verify-email/{token_obj.token}"
+        verification_url = f"{frontend_url}/verify-email/{row['token']}"
 
         # Customize subject slightly for reminders if desired, or let Brevo template handle it
         subject_prefix = f"ACTION REQUIRED: " if reminder_type == "7-day" else "Reminder: "
-        subject = f"{subject_prefix}Please verify your Spazaafy account" 
+        subject = f"{subject_prefix}Please verify your Spazaafy account"
 
         message = EmailMessage(
             subject=subject,
-            to=[user.email],
+            to=[row['email']],
             from_email=settings.DEFAULT_FROM_EMAIL,
         )
 
         message.template_id = 7 # Assuming this is your account verification template
 
         message.merge_global_data = {
-            'NAME': user.first_name if user.first_name else "User",
+            'NAME': row['first_name'] if row['first_name'] else "User",
             'LINK': verification_url,
             # You could add a REMINDER_COUNT variable to the template if it exists
-            'REMINDER_TEXT': f"This is your {reminder_type} reminder." 
+            'REMINDER_TEXT': f"This is your {reminder_type} reminder."
         }
 
-        message.send()
\ No newline at end of file
+        # Through the shared circuit breaker: fail fast while Brevo is down
+        get_dispatcher().call_primary(message.send)
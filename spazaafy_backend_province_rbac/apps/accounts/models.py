@@ -30,6 +30,9 @@ class User(AbstractUser):
     reminders_sent_count = models.IntegerField(default=0)
     last_reminder_sent_at = models.DateTimeField(null=True, blank=True)
     expo_push_token = models.CharField(max_length=255, blank=True, null=True)
+
+    # Lists that embed user details (e.g. support tickets) use this in their ETags
+    updated_at = models.DateTimeField(auto_now=True, null=True)
     
     # --- ADD THIS METHOD ---
     def get_full_name(self):
@@ -52,6 +55,10 @@ class AdminVerificationCode(models.Model):
         return f"Code for {self.email}"
     
 
+# Brevo template for the "verify your email" message (params: NAME, LINK)
+VERIFY_EMAIL_TEMPLATE_ID = 2
+
+
 class EmailVerificationToken(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
@@ -7,7 +7,7 @@ from django.utils import timezone
 from rest_framework import serializers
 from rest_framework_simplejwt.tokens import RefreshToken
 from apps.shops.models import Province, SpazaShop
-from .models import AdminVerificationCode, EmailVerificationToken
+from .models import AdminVerificationCode, EmailVerificationToken, VERIFY_EMAIL_TEMPLATE_ID
 from django.conf import settings
 from django.core.mail import EmailMessage
 from apps.hr.models import Employee
@@ -147,7 +147,7 @@ class RegisterSerializer(serializers.Serializer):
                 to=[user.email],
                 from_email=settings.DEFAULT_FROM_EMAIL,
             )
-            message.template_id = 2 
+            message.template_id = VERIFY_EMAIL_TEMPLATE_ID
             message.merge_global_data = {
                 'NAME': user.first_name if user.first_name else "User",
                 'LINK': verification_url,
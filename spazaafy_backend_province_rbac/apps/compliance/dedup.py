@@ -0,0 +1,96 @@
+# apps/compliance/dedup.py
+"""
+Content-hash deduplication of uploaded documents.
+
+Multipart uploads are SHA-256'd by HashingUploadHandler as they stream in.
+Direct-to-S3 uploads are hashed by the client and checked by S3: the hash
+is signed into the presigned POST, and confirm reads the checksum S3
+verified back with one HEAD (uploads.verified_upload); uploads from clients
+that could not hash are stored unhashed and never shared. When the shop
+already has a document with the same hash, the new Document row points at
+that stored object instead of keeping a second copy. Rows share objects only within one shop, so a file never
+moves between shops' docs/shop_<id>/ folders.
+
+cleanup_documents only deletes an object once no remaining document uses it.
+"""
+import hashlib
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db.models import Count, Max, Sum
+from .models import Document, DocumentStatus
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Passes every chunk on unchanged and hashes it on the way, so the file is
+    not read a second time. Results go to request.upload_sha256[field_name].
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not hasattr(self.request, 'upload_sha256'):
+            self.request.upload_sha256 = {}
+        self.request.upload_sha256[self.field_name] = self.digest.hexdigest()
+        return None  # The next handler builds the file
+
+
+def sha256_of(uploaded_file):
+    """Hash of an already received file (when the handler could not run, e.g. the body was parsed early)."""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def find_blob(shop_id, sha256):
+    """The shop's oldest document stored under this hash, or None."""
+    if not sha256:
+        return None
+    return Document.objects.filter(shop_id=shop_id, sha256=sha256).exclude(file='').order_by('id').first()
+
+
+def find_pending_copy(shop_id, doc_type, sha256):
+    """A document already waiting for review with the same file and type (a retried or repeated upload)."""
+    if not sha256:
+        return None
+    return Document.objects.filter(
+        shop_id=shop_id, type=doc_type, sha256=sha256, status=DocumentStatus.PENDING,
+    ).order_by('id').first()
+
+
+def storage_report():
+    """
+    Bytes referenced by documents vs. bytes actually stored, from the
+    hashed documents (older rows without a hash are only counted).
+    """
+    hashed = Document.objects.exclude(sha256='').exclude(file_size=None)
+    totals = hashed.aggregate(documents=Count('id'), referenced=Sum('file_size'))
+    objects = hashed.values('file').annotate(size=Max('file_size'), refs=Count('id'))
+    stored = shared = 0
+    for row in objects.order_by().iterator():
+        stored += row['size'] or 0
+        shared += row['refs'] > 1
+    # Same shop and content but separate objects (uploaded before hashing, or concurrently)
+    duplicates = hashed.values('shop_id', 'sha256').annotate(
+        objects=Count('file', distinct=True), size=Max('file_size'),
+    ).filter(objects__gt=1)
+    duplicate_bytes = sum((row['objects'] - 1) * (row['size'] or 0) for row in duplicates.order_by().iterator())
+
+    referenced = totals['referenced'] or 0
+    return {
+        'documents': Document.objects.count(),
+        'hashed_documents': totals['documents'],
+        'stored_objects': objects.count(),
+        'shared_objects': shared,
+        'referenced_bytes': referenced,
+        'stored_bytes': stored,
+        'saved_bytes': referenced - stored,
+        'duplicate_bytes_not_shared': duplicate_bytes,
+    }
@@ -1,57 +1,172 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
 from django.db.models import Q
 from apps.compliance.models import Document, DocumentStatus
+from apps.core.jobs import map_concurrently
+
+# S3 DeleteObjects accepts at most 1000 keys per request
+MAX_KEYS_PER_DELETE = 1000
+
+
+def _uses_s3(storage):
+    try:
+        from storages.backends.s3boto3 import S3Boto3Storage
+    except ImportError:
+        return False
+    return isinstance(storage, S3Boto3Storage)
+
+
+def _s3_sizes(client, bucket, keys):
+    """{key: size} for the keys that still exist, from one listing per shop folder (not one HEAD per key)."""
+    sizes = {}
+    wanted = set(keys)
+    paginator = client.get_paginator('list_objects_v2')
+    for prefix in sorted({key.rsplit('/', 1)[0] + '/' for key in wanted}):
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if obj['Key'] in wanted:
+                    sizes[obj['Key']] = obj['Size']
+    return sizes
+
+
+def _kept_keys(keys, doomed_ids, batch_size):
+    """Files in `keys` that a document outside `doomed_ids` still points at (deduplicated uploads share files)."""
+    keys, kept = sorted(keys), set()
+    for start in range(0, len(keys), batch_size):
+        kept.update(
+            Document.objects.filter(file__in=keys[start:start + batch_size])
+            .exclude(id__in=doomed_ids).values_list('file', flat=True)
+        )
+    return kept
+
 
 class Command(BaseCommand):
     help = 'Deletes rejected documents (30 days old) and expired documents (31 days past expiry) from S3 and Database'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted (and its size) without deleting.")
+        parser.add_argument('--chunk-size', type=int, default=MAX_KEYS_PER_DELETE,
+                            help=f"Files per S3 delete_objects call (at most {MAX_KEYS_PER_DELETE}).")
+        parser.add_argument('--workers', type=int, default=4, help="Chunks deleted in parallel.")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        chunk_size = max(1, min(options['chunk_size'], MAX_KEYS_PER_DELETE))
         now = timezone.now()
-        
+
         # 1. Logic for Rejected Docs (30 days since last update)
         rejected_cutoff = now - timedelta(days=30)
-        
+
         # 2. Logic for Expired Docs (31 days past expiry date)
         # We use .date() because expiry_date is a DateField
         expired_cutoff = now.date() - timedelta(days=31)
 
         # 3. Find documents matching EITHER condition
-        docs_to_delete = Document.objects.filter(
+        rows = list(Document.objects.filter(
             Q(status=DocumentStatus.REJECTED, updated_at__lt=rejected_cutoff) |
             Q(expiry_date__isnull=False, expiry_date__lt=expired_cutoff)
-        ).distinct()
+        ).order_by('id').values_list('id', 'file', 'status', 'updated_at', 'expiry_date', 'file_size'))
 
-        count = docs_to_delete.count()
-
-        if count == 0:
+        if not rows:
             self.stdout.write(self.style.SUCCESS("No old rejected or expired documents found to delete."))
             return
 
-        self.stdout.write(self.style.WARNING(f"Found {count} documents to cleanup..."))
-
-        for doc in docs_to_delete:
-            try:
-                # Determine reason for logging
-                doc_id = doc.id
-                file_name = doc.file.name if doc.file else "No File"
-                
-                reason = "Unknown"
-                if doc.status == DocumentStatus.REJECTED and doc.updated_at < rejected_cutoff:
-                    reason = "REJECTED (>30 days)"
-                elif doc.expiry_date and doc.expiry_date < expired_cutoff:
-                    reason = f"EXPIRED (on {doc.expiry_date})"
-
-                # Delete the file from S3 explicitly
-                if doc.file:
-                    doc.file.delete(save=False)
-                
-                # Delete the database record
-                doc.delete()
-                
-                self.stdout.write(f"Deleted [{reason}] ID: {doc_id} - File: {file_name}")
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Error deleting document {doc.id}: {str(e)}"))
-
-        self.stdout.write(self.style.SUCCESS(f"Cleanup complete. Successfully deleted {count} documents."))
\ No newline at end of file
+        self.stdout.write(self.style.WARNING(
+            f"Found {len(rows)} documents to cleanup...{' (dry run, nothing will be deleted)' if dry_run else ''}"
+        ))
+
+        storage = Document._meta.get_field('file').storage
+        s3 = _uses_s3(storage)
+        if s3:
+            from apps.compliance.uploads import s3_client
+            client, bucket = s3_client(), settings.AWS_STORAGE_BUCKET_NAME
+
+        def reason_for(status, updated_at, expiry_date):
+            if status == DocumentStatus.REJECTED and updated_at < rejected_cutoff:
+                return "REJECTED (>30 days)"
+            return f"EXPIRED (on {expiry_date})"
+
+        # Decide once, for the whole candidate set, which files go: a file still used by a
+        # document we are keeping stays, and a file shared by several doomed documents is
+        # deleted exactly once, by the chunk holding the first of them.
+        kept_keys = _kept_keys({row[1] for row in rows if row[1]}, [row[0] for row in rows], chunk_size)
+        owner = {}
+        for row in rows:
+            if row[1] and row[1] not in kept_keys:
+                owner.setdefault(row[1], row)
+
+        def chunks():
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                yield chunk, {row[1]: row[5] for row in chunk if row[1] and owner.get(row[1]) is row}
+
+        def remove_files(item):
+            """
+            (bytes freed, keys that could not be deleted) for one chunk. Sizes come from
+            Document.file_size; rows from before it was recorded are looked up in storage.
+            """
+            chunk, sizes = item
+            if not sizes:
+                return 0, set()
+            if s3:
+                unknown = [key for key, size in sizes.items() if size is None]
+                if unknown:
+                    sizes.update(dict.fromkeys(unknown, 0))  # Already gone from the bucket
+                    sizes.update(_s3_sizes(client, bucket, unknown))
+                failed = set()
+                if not dry_run:
+                    response = client.delete_objects(
+                        Bucket=bucket,
+                        Delete={'Objects': [{'Key': key} for key in sorted(sizes)], 'Quiet': True},
+                    )
+                    for error in response.get('Errors', []):
+                        failed.add(error['Key'])
+                        print(f"Could not delete {error['Key']}: {error.get('Code')} {error.get('Message', '')}")
+                return sum(size for key, size in sizes.items() if key not in failed), failed
+
+            # Other storages (e.g. local disk in development): one call per file
+            freed, failed = 0, set()
+            for key, size in sizes.items():
+                try:
+                    if storage.exists(key):
+                        freed += size if size is not None else storage.size(key)
+                        if not dry_run:
+                            storage.delete(key)
+                except Exception as e:
+                    failed.add(key)
+                    print(f"Could not delete {key}: {e}")
+            return freed, failed
+
+        deleted = kept = freed = 0
+        verbose = options['verbosity'] > 1
+        for (chunk, _), result, error in map_concurrently(remove_files, chunks(), workers=max(1, options['workers'])):
+            if error:
+                kept += len(chunk)
+                self.stdout.write(self.style.ERROR(
+                    f"Error deleting documents {chunk[0][0]}-{chunk[-1][0]}: {error}"
+                ))
+                continue
+            chunk_freed, failed = result
+            done = [row for row in chunk if row[1] not in failed]
+            kept += len(chunk) - len(done)
+            freed += chunk_freed
+            if not dry_run and done:
+                # One DELETE per chunk (post_delete still clears verified bits on the shops)
+                Document.objects.filter(id__in=[row[0] for row in done]).delete()
+            deleted += len(done)
+            if verbose:
+                for doc_id, file_name, status, updated_at, expiry_date, _ in done:
+                    self.stdout.write(
+                        f"{'Would delete' if dry_run else 'Deleted'} [{reason_for(status, updated_at, expiry_date)}] "
+                        f"ID: {doc_id} - File: {file_name or 'No File'}"
+                    )
+
+        size = f"{freed / (1024 * 1024):.1f} MB ({freed} bytes)"
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f"Dry run: would delete {deleted} documents and reclaim {size}."))
+            return
+        if kept:
+            self.stdout.write(self.style.ERROR(f"{kept} documents could not be deleted and were kept for the next run."))
+        self.stdout.write(self.style.SUCCESS(f"Cleanup complete. Successfully deleted {deleted} documents, reclaimed {size}."))
@@ -0,0 +1,54 @@
+import hashlib
+from django.core.management.base import BaseCommand
+from apps.compliance.dedup import storage_report
+from apps.compliance.models import Document
+
+
+class Command(BaseCommand):
+    help = 'Reports storage used by compliance documents and saved by content-hash deduplication'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true',
+                            help="First hash documents uploaded before hashing (reads each file once from storage).")
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.backfill(options['batch_size'])
+
+        report = storage_report()
+        mb = lambda n: f"{n / (1024 * 1024):.1f} MB"
+        self.stdout.write(f"Documents:            {report['documents']} ({report['hashed_documents']} hashed)")
+        self.stdout.write(f"Stored objects:       {report['stored_objects']} ({report['shared_objects']} shared by several documents)")
+        self.stdout.write(f"Referenced:           {mb(report['referenced_bytes'])}")
+        self.stdout.write(f"Stored:               {mb(report['stored_bytes'])}")
+        self.stdout.write(self.style.SUCCESS(f"Saved by sharing:     {mb(report['saved_bytes'])} ({report['saved_bytes']} bytes)"))
+        if report['duplicate_bytes_not_shared']:
+            self.stdout.write(self.style.WARNING(
+                f"Identical files stored separately: {mb(report['duplicate_bytes_not_shared'])}"
+            ))
+
+    def backfill(self, batch_size):
+        todo = Document.objects.filter(sha256='').exclude(file='').only('id', 'file')
+        batch, done, missing = [], 0, 0
+        for doc in todo.iterator(chunk_size=batch_size):
+            digest, size = hashlib.sha256(), 0
+            try:
+                with doc.file.open('rb') as f:
+                    for chunk in f.chunks():
+                        digest.update(chunk)
+                        size += len(chunk)
+            except (FileNotFoundError, OSError) as e:
+                missing += 1
+                self.stdout.write(self.style.ERROR(f"Could not read document {doc.id} ({doc.file.name}): {e}"))
+                continue
+            doc.sha256, doc.file_size = digest.hexdigest(), size
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                Document.objects.bulk_update(batch, ['sha256', 'file_size'])
+                done += len(batch)
+                batch = []
+        if batch:
+            Document.objects.bulk_update(batch, ['sha256', 'file_size'])
+            done += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Hashed {done} documents ({missing} unreadable)."))
@@ -0,0 +1,60 @@
+# apps/compliance/management/commands/recompute_shop_verification.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from apps.compliance.models import refresh_review_priorities, verified_document_masks
+from apps.shops.models import SpazaShop, REQUIRED_DOCUMENTS_MASK
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds SpazaShop.verified_documents (and the verified flag derived from
+    it) for every shop from one DISTINCT (shop, type) query over verified
+    documents, then re-ranks pending documents (Document.review_priority)
+    from the new masks. Needed after bulk .update()s of documents, which skip
+    Document.save().
+    """
+    help = 'Recomputes every shop\'s verified-document bitmask and verified flag'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without saving')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        masks = verified_document_masks()
+
+        now = timezone.now()
+        changed, verified_changed = [], 0
+        shops = SpazaShop.objects.order_by('id').values_list('id', 'verified_documents', 'verified')
+        for shop_id, current_mask, current_verified in shops.iterator(chunk_size=5000):
+            mask = masks.get(shop_id, 0)
+            verified = mask & REQUIRED_DOCUMENTS_MASK == REQUIRED_DOCUMENTS_MASK
+            if mask != current_mask or verified != current_verified:
+                verified_changed += verified != current_verified
+                changed.append(SpazaShop(id=shop_id, verified_documents=mask, verified=verified, updated_at=now))
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f"[dry run] {len(changed)} shops would change ({verified_changed} verified flags)."
+            ))
+            return
+
+        with transaction.atomic():
+            SpazaShop.objects.bulk_update(
+                changed, ['verified_documents', 'verified', 'updated_at'], batch_size=options['batch_size']
+            )
+            refresh_review_priorities()
+        if changed:
+            # bulk_update() sends no signals. Invalidate what the post_save receivers
+            # would have; this reaches web workers when the caches are shared,
+            # otherwise they catch up at their TTLs.
+            from apps.shops.cache import shop_cache, shop_group
+            from apps.shops.clusters import invalidate_clusters
+            invalidate_clusters()
+            shop_cache.invalidate('list', *[shop_group(shop.id) for shop in changed])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed {len(masks)} shops with verified documents; "
+            f"updated {len(changed)} shops ({verified_changed} verified flags changed)."
+        ))
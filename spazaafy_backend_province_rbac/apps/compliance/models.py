@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
-from apps.shops.models import SpazaShop
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from apps.shops.models import SpazaShop, DOCUMENT_TYPE_BITS, REQUIRED_DOC_TYPES
 from django.utils import timezone
 
 class DocumentType(models.TextChoices):
@@ -39,6 +41,14 @@ class Document(models.Model):
 
     rejection_reason = models.TextField(blank=True, help_text="Reason for rejection provided by admin")
 
+    # Content hash of the file; documents of one shop with the same hash share one stored object
+    sha256 = models.CharField(max_length=64, blank=True, editable=False)
+    file_size = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+
+    # Verification queue order for PENDING documents (see review_priority()), stored so
+    # the queue reads it off an index. Kept in step with the shop's verified_documents.
+    review_priority = models.PositiveSmallIntegerField(default=0, editable=False)
+
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     updated_at = models.DateTimeField(auto_now=True) 
@@ -46,15 +56,105 @@ class Document(models.Model):
     verified_at = models.DateTimeField(null=True, blank=True)
     verified_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='verified_documents')
 
-    class Meta: ordering=['-uploaded_at']
+    class Meta:
+        ordering=['-uploaded_at']
+        indexes = [
+            # Admin verification queue: PENDING documents in review order (DocumentViewSet.queue)
+            models.Index(fields=['status', 'review_priority', 'uploaded_at', 'id'], name='document_review_queue_idx'),
+            # Duplicate-upload lookups (dedup.find_blob)
+            models.Index(fields=['shop', 'sha256'], name='document_shop_sha256_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_verification = (instance.__dict__.get('type'), instance.__dict__.get('status'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # ✅ Keep SpazaShop.verified_documents in step, in the same transaction.
+        # Only changes into or out of VERIFIED (or of a verified doc's type) touch the shop.
+        previous_type, previous_status = getattr(self, '_loaded_verification', (None, None))
+        if self.status == DocumentStatus.PENDING and (previous_type, previous_status) != (self.type, self.status):
+            shop = self.shop if Document.shop.is_cached(self) else \
+                SpazaShop.objects.only('verified_documents').get(pk=self.shop_id)
+            self.review_priority = review_priority(self.type, shop.verified_documents)
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'review_priority'}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if DocumentStatus.VERIFIED in (previous_status, self.status) and \
+                    (previous_type, previous_status) != (self.type, self.status):
+                shop = self.shop if Document.shop.is_cached(self) else None
+                SpazaShop.sync_document_types(self.shop_id, {self.type, previous_type} - {None}, instance=shop)
+        self._loaded_verification = (self.type, self.status)
 
     def mark_verified(self, user):
+        # save() updates the shop's bitmask and verified flag
         self.status = DocumentStatus.VERIFIED; self.verified_at = timezone.now(); self.verified_by = user; self.save()
-        required = {"COR_REG","TAX","COA"}
-        types = set(self.shop.documents.filter(status=DocumentStatus.VERIFIED).values_list('type', flat=True))
-        if required.issubset(types):
-            self.shop.verified = True; self.shop.save()
 
     @property
     def shop_name(self):
-        return self.shop.name if self.shop else None
\ No newline at end of file
+        return self.shop.name if self.shop else None
+
+
+def verified_document_masks(shop_ids=None):
+    """{shop_id: verified_documents mask} from one DISTINCT (shop, type) query over VERIFIED documents."""
+    rows = Document.objects.filter(status=DocumentStatus.VERIFIED)
+    if shop_ids is not None:
+        rows = rows.filter(shop_id__in=shop_ids)
+    masks = {}
+    for shop_id, doc_type in rows.values_list('shop_id', 'type').distinct().iterator(chunk_size=5000):
+        masks[shop_id] = masks.get(shop_id, 0) | DOCUMENT_TYPE_BITS.get(doc_type, 0)
+    return masks
+
+
+def missing_required_count(verified_documents):
+    """How many required document types are not yet set on a verified_documents mask."""
+    return sum(1 for t in REQUIRED_DOC_TYPES if not verified_documents & DOCUMENT_TYPE_BITS[t])
+
+
+def review_priority(doc_type, verified_documents):
+    """
+    Queue position of a PENDING document, lowest first: shops closest to
+    verification (fewest required types missing), then required types.
+    """
+    return missing_required_count(verified_documents) * 2 + (0 if doc_type in REQUIRED_DOC_TYPES else 1)
+
+
+def _set_review_priorities(pending, missing):
+    for required, value in ((True, missing * 2), (False, missing * 2 + 1)):
+        rows = pending.filter(type__in=REQUIRED_DOC_TYPES) if required else pending.exclude(type__in=REQUIRED_DOC_TYPES)
+        rows.exclude(review_priority=value).update(review_priority=value)
+
+
+def refresh_review_priorities(shop_ids=None):
+    """
+    Re-derives review_priority of PENDING documents from their shops' current
+    masks, e.g. after a bulk_update() of SpazaShop.verified_documents. At most
+    two UPDATEs per missing-required count, only touching rows that change.
+    """
+    shops = SpazaShop.objects.all() if shop_ids is None else SpazaShop.objects.filter(id__in=shop_ids)
+    masks_by_missing = {}
+    for mask in shops.order_by().values_list('verified_documents', flat=True).distinct():
+        masks_by_missing.setdefault(missing_required_count(mask), []).append(mask)
+    pending = Document.objects.filter(status=DocumentStatus.PENDING)
+    if shop_ids is not None:
+        pending = pending.filter(shop_id__in=shop_ids)
+    for missing, masks in masks_by_missing.items():
+        _set_review_priorities(pending.filter(shop__verified_documents__in=masks), missing)
+
+
+@receiver(post_save, sender=SpazaShop)
+def refresh_shop_review_priorities(sender, instance, created=False, update_fields=None, **kwargs):
+    # ✅ A shop's mask changed (sync_document_types, bulk review): re-rank its pending documents
+    if created or (update_fields is not None and 'verified_documents' not in update_fields):
+        return
+    pending = Document.objects.filter(shop_id=instance.pk, status=DocumentStatus.PENDING)
+    _set_review_priorities(pending, missing_required_count(instance.verified_documents))
+
+
+@receiver(post_delete, sender=Document)
+def clear_verified_document_bit(sender, instance, **kwargs):
+    if instance.status == DocumentStatus.VERIFIED:
+        SpazaShop.sync_document_types(instance.shop_id, {instance.type})
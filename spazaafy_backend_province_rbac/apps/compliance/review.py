@@ -0,0 +1,151 @@
+# apps/compliance/review.py
+"""
+Bulk verify/reject for the admin review screen (DocumentViewSet.bulk_review).
+
+All status changes are written with one bulk_update inside a transaction.
+Each affected shop is then recomputed once (one DISTINCT query for all of
+them) instead of once per document. Push notifications and rejection
+emails are only handed out after the commit: pushes go to the batching
+push dispatcher, and emails to a background job that sends them
+concurrently through the mail dispatcher (Brevo, then backup SMTP).
+"""
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.utils import timezone
+from apps.core.jobs import enqueue, map_concurrently
+from apps.core.mail_dispatch import get_dispatcher
+from apps.core.utils import send_expo_push_notification
+from apps.shops.models import SpazaShop
+from .models import Document, DocumentStatus, verified_document_masks
+
+VERIFY, REJECT = 'verify', 'reject'
+MAX_DECISIONS = 500
+
+
+def rejection_email(doc, rejection_reason):
+    shop_owner = doc.shop.owner
+    subject = f"Action Required: Document Rejected for {doc.shop.name}"
+    body = f"""
+                Dear {shop_owner.first_name},
+
+                Your document submission for "{doc.get_type_display()}" has been REJECTED by our verification team.
+
+                Reason for rejection:
+                --------------------------------------------------
+                {rejection_reason}
+                --------------------------------------------------
+
+                Please log in to your dashboard to upload a corrected version.
+
+                Regards,
+                Spazaafy Admin Team
+                """
+    return EmailMessage(
+        subject=subject,
+        body=body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[shop_owner.email]
+    )
+
+
+def _apply(doc, decision, reviewer, now):
+    if decision['action'] == VERIFY:
+        doc.status = DocumentStatus.VERIFIED
+        doc.verified_at = now
+        doc.notes = decision.get('notes') or 'Admin approved.'
+        doc.rejection_reason = ""
+        if decision.get('expiry_date'):
+            doc.expiry_date = decision['expiry_date']
+    else:
+        doc.status = DocumentStatus.REJECTED
+        doc.notes = decision.get('notes') or 'Admin rejected.'
+        doc.rejection_reason = decision.get('rejection_reason', '')
+    doc.verified_by = reviewer
+    doc.updated_at = now  # bulk_update() skips auto_now; cleanup_documents ages rejections by it
+
+
+def _recompute_shops(shop_ids):
+    """Locks the shops, re-derives their masks and saves the ones that changed. Returns that count."""
+    shops = list(SpazaShop.objects.select_for_update().filter(id__in=shop_ids).order_by('id'))
+    masks = verified_document_masks(shop_ids)
+    changed = 0
+    for shop in shops:
+        mask = masks.get(shop.id, 0)
+        if mask != shop.verified_documents:
+            shop.verified_documents = mask
+            shop.verified = shop.has_required_documents
+            # save() (not update()) so the cache/index/cluster signals run
+            shop.save(update_fields=['verified_documents', 'verified', 'updated_at'])
+            changed += 1
+    return changed
+
+
+def _notify(docs_and_decisions):
+    emails = []
+    for doc, decision in docs_and_decisions:
+        owner = doc.shop.owner
+        if decision['action'] == VERIFY:
+            send_expo_push_notification(
+                user=owner,
+                title="Document Verified",
+                body=f"Your {doc.get_type_display()} has been verified!"
+            )
+        else:
+            send_expo_push_notification(
+                user=owner,
+                title="Action Required: Document Rejected",
+                body=f"Your {doc.get_type_display()} was rejected. Reason: {doc.rejection_reason}"
+            )
+            if doc.rejection_reason and owner.email:
+                emails.append(rejection_email(doc, doc.rejection_reason))
+    if emails:
+        enqueue(send_rejection_emails, emails)
+
+
+def send_rejection_emails(messages):
+    results = map_concurrently(
+        get_dispatcher().send, messages,
+        workers=getattr(settings, 'BULK_EMAIL_WORKERS', 8), rate=getattr(settings, 'BULK_EMAIL_RATE', 20),
+    )
+    for message, result, error in results:
+        if error or result.status != 'SENT':
+            print(f"Failed to send rejection email to {message.to[0]}: {error or result.error}")
+        else:
+            print(f"Rejection email sent to {message.to[0]} via {result.provider}")
+
+
+def bulk_review(queryset, decisions, reviewer):
+    """
+    Applies [{id, action, notes?, rejection_reason?, expiry_date?}] to the
+    documents of `queryset` (already scoped to the reviewer).
+    Returns {'verified', 'rejected', 'shops_updated', 'errors': [{id, error}]}.
+    """
+    by_id = {d['id']: d for d in decisions}
+    docs = {doc.id: doc for doc in queryset.filter(id__in=by_id).select_related('shop__owner')}
+    errors = [{'id': doc_id, 'error': 'Not found.'} for doc_id in by_id if doc_id not in docs]
+
+    now = timezone.now()
+    applied = []
+    for doc_id, doc in docs.items():
+        decision = by_id[doc_id]
+        _apply(doc, decision, reviewer, now)
+        applied.append((doc, decision))
+
+    shops_updated = 0
+    if applied:
+        with transaction.atomic():
+            Document.objects.bulk_update(
+                [doc for doc, _ in applied],
+                ['status', 'verified_at', 'verified_by', 'notes', 'rejection_reason', 'expiry_date', 'updated_at'],
+                batch_size=200,
+            )
+            shops_updated = _recompute_shops({doc.shop_id for doc, _ in applied})
+            transaction.on_commit(lambda: _notify(applied))
+
+    return {
+        'verified': sum(1 for _, d in applied if d['action'] == VERIFY),
+        'rejected': sum(1 for _, d in applied if d['action'] == REJECT),
+        'shops_updated': shops_updated,
+        'errors': errors,
+    }
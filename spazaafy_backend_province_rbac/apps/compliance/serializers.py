@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Document
+from .models import Document, DocumentType
+from .review import MAX_DECISIONS
 
 class DocumentSerializer(serializers.ModelSerializer):
     name = serializers.CharField(source='get_type_display', read_only=True)
@@ -27,4 +28,52 @@ class DocumentSerializer(serializers.ModelSerializer):
             'upload_lat', 'upload_lng', 'upload_accuracy', 'rejection_reason'
         ]
         read_only_fields = ['shop', 'status', 'uploaded_at', 'verified_at', 'verified_by']
-        extra_kwargs = {'file': {'write_only': True}}
\ No newline at end of file
+        extra_kwargs = {'file': {'write_only': True}}
+
+
+class DocumentQueueSerializer(DocumentSerializer):
+    """A queue row: the document plus what the reviewer needs about the shop."""
+    owner_name = serializers.CharField(source='shop.owner.get_full_name', read_only=True)
+    owner_email = serializers.EmailField(source='shop.owner.email', read_only=True)
+    province = serializers.CharField(source='shop.province.name', read_only=True)
+    missing_required = serializers.IntegerField(read_only=True)
+
+    class Meta(DocumentSerializer.Meta):
+        fields = DocumentSerializer.Meta.fields + ['owner_name', 'owner_email', 'province', 'missing_required']
+
+
+class DocumentDecisionSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=['verify', 'reject'])
+    notes = serializers.CharField(required=False, allow_blank=True)
+    rejection_reason = serializers.CharField(required=False, allow_blank=True)
+    expiry_date = serializers.DateField(required=False, allow_null=True)
+
+
+class BulkReviewSerializer(serializers.Serializer):
+    decisions = DocumentDecisionSerializer(many=True, allow_empty=False, max_length=MAX_DECISIONS)
+
+
+class DocumentUploadRequestSerializer(serializers.Serializer):
+    """Step 1 of a direct-to-S3 upload (see uploads.py)."""
+    type = serializers.ChoiceField(choices=DocumentType.choices)
+    filename = serializers.CharField(max_length=255)
+    # Client-side SHA-256 of the file (hex); lets a repeated upload skip sending the bytes
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False)
+
+
+class DocumentUploadConfirmSerializer(serializers.Serializer):
+    """Step 3: the file is in S3; create the Document."""
+    upload_token = serializers.CharField()
+    upload_lat = serializers.FloatField(
+        required=True,
+        allow_null=False,
+        error_messages={'required': 'Location data is missing. Please enable GPS.'}
+    )
+    upload_lng = serializers.FloatField(
+        required=True,
+        allow_null=False,
+        error_messages={'required': 'Location data is missing. Please enable GPS.'}
+    )
+    upload_accuracy = serializers.FloatField(required=False, allow_null=True)
+    expiry_date = serializers.DateField(required=False, allow_null=True)
@@ -0,0 +1,297 @@
+import base64
+import email
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+import requests
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from apps.accounts.models import User
+from apps.compliance import uploads
+from apps.compliance.models import Document
+from apps.core.models import Province
+from apps.shops.models import SpazaShop
+
+BUCKET = 'bucket'
+
+
+class FakeS3:
+    """
+    Path-style S3 stand-in for presigned POST uploads: enforces the policy's
+    content-length-range and x-amz-checksum-* conditions like S3 does, and
+    answers HEAD (with the stored checksum under ChecksumMode) and DELETE.
+    """
+
+    def __init__(self):
+        self.objects = {}    # key -> bytes
+        self.checksums = {}  # key -> base64 SHA-256 that S3 verified
+        self.calls = []      # (method, key)
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def key(self):
+                path = unquote(urlparse(self.path).path).lstrip('/')
+                return path.split('/', 1)[1] if '/' in path else ''
+
+            def reply(self, status, body=b'', headers=None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                if 'Content-Length' not in (headers or {}):
+                    self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                key = self.key()
+                fake.calls.append(('HEAD', key))
+                if key not in fake.objects:
+                    return self.reply(404)
+                headers = {'Content-Length': str(len(fake.objects[key])), 'ETag': '"etag"'}
+                if self.headers.get('x-amz-checksum-mode') == 'ENABLED' and key in fake.checksums:
+                    headers['x-amz-checksum-sha256'] = fake.checksums[key]
+                self.reply(200, headers=headers)
+
+            def do_GET(self):
+                fake.calls.append(('GET', self.key()))
+                self.reply(403)
+
+            def do_DELETE(self):
+                key = self.key()
+                fake.calls.append(('DELETE', key))
+                fake.objects.pop(key, None)
+                fake.checksums.pop(key, None)
+                self.reply(204)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                form = email.message_from_bytes(
+                    b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + body
+                )
+                fields, data = {}, None
+                for part in form.get_payload():
+                    name = part.get_param('name', header='content-disposition')
+                    if name == 'file':
+                        data = part.get_payload(decode=True)
+                    else:
+                        fields[name] = part.get_payload(decode=True).decode()
+                fake.calls.append(('POST', fields.get('key')))
+                status = fake.check_policy(fields, data)
+                if status != 204:
+                    return self.reply(status)
+                fake.objects[fields['key']] = data
+                if 'x-amz-checksum-sha256' in fields:
+                    fake.checksums[fields['key']] = fields['x-amz-checksum-sha256']
+                self.reply(204)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def check_policy(self, fields, data):
+        if 'policy' not in fields:
+            return 403
+        conditions = json.loads(base64.b64decode(fields['policy']))['conditions']
+        signed = {}
+        for condition in conditions:
+            if isinstance(condition, list) and condition[0] == 'content-length-range':
+                if not condition[1] <= len(data) <= condition[2]:
+                    return 400  # EntityTooLarge / EntityTooSmall
+            elif isinstance(condition, dict):
+                signed.update(condition)
+        for name, value in fields.items():
+            if name.startswith('x-amz-checksum') and signed.get(name) != value:
+                return 403  # Field not covered by the policy
+        checksum = fields.get('x-amz-checksum-sha256')
+        if checksum and base64.b64encode(hashlib.sha256(data).digest()).decode() != checksum:
+            return 400  # BadDigest
+        return 204
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class DirectUploadTests(TestCase):
+    """presign_upload -> POST to S3 -> confirm_upload, against a local S3 stand-in."""
+
+    PDF = b'%PDF-1.4 ' + b'x' * 2000
+
+    def setUp(self):
+        self.s3 = FakeS3()
+        self.addCleanup(self.s3.stop)
+        override = override_settings(
+            AWS_S3_ENDPOINT_URL=self.s3.url, AWS_S3_ADDRESSING_STYLE='path', AWS_S3_REGION_NAME='us-east-1',
+            AWS_STORAGE_BUCKET_NAME=BUCKET, AWS_ACCESS_KEY_ID='test', AWS_SECRET_ACCESS_KEY='test',
+            DOCUMENT_UPLOAD_MAX_BYTES=5000,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        uploads._client = None  # Rebuilt against the stand-in
+        self.addCleanup(setattr, uploads, '_client', None)
+        cache.clear()
+
+        province = Province.objects.create(name='Gauteng')
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', role='OWNER')
+        self.shop = SpazaShop.objects.create(owner=self.owner, province=province, name='Corner Shop')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def presign(self, data=None, doc_type='TAX', send_hash=True):
+        body = {'type': doc_type, 'filename': 'tax.pdf'}
+        if send_hash:
+            body['sha256'] = hashlib.sha256(self.PDF if data is None else data).hexdigest()
+        return self.client.post('/api/compliance/documents/presign_upload/', body, format='json')
+
+    def upload(self, presigned, data):
+        return requests.post(presigned['url'], data=presigned['fields'], files={'file': ('tax.pdf', data)})
+
+    def confirm(self, token):
+        return self.client.post('/api/compliance/documents/confirm_upload/', {
+            'upload_token': token, 'upload_lat': -26.2, 'upload_lng': 28.0,
+        }, format='json')
+
+    def test_presign_signs_key_size_and_checksum(self):
+        response = self.presign()
+
+        self.assertEqual(response.status_code, 200)
+        presigned = response.json()
+        self.assertTrue(presigned['key'].startswith(f"docs/shop_{self.shop.id}/"))
+        self.assertEqual(presigned['max_bytes'], 5000)
+        checksum = base64.b64encode(hashlib.sha256(self.PDF).digest()).decode()
+        self.assertEqual(presigned['fields']['x-amz-checksum-sha256'], checksum)
+        conditions = json.loads(base64.b64decode(presigned['fields']['policy']))['conditions']
+        self.assertIn(['content-length-range', 1, 5000], conditions)
+        self.assertIn({'x-amz-checksum-sha256': checksum}, conditions)
+
+    def test_upload_and_confirm_creates_document(self):
+        presigned = self.presign().json()
+        self.assertEqual(self.upload(presigned, self.PDF).status_code, 204)
+
+        response = self.confirm(presigned['upload_token'])
+
+        self.assertEqual(response.status_code, 201)
+        doc = Document.objects.get(pk=response.json()['id'])
+        self.assertEqual(doc.file.name, presigned['key'])
+        self.assertEqual(doc.sha256, hashlib.sha256(self.PDF).hexdigest())
+        self.assertEqual(doc.file_size, len(self.PDF))
+        # One HEAD; the bytes never come back through the web worker
+        self.assertNotIn(('GET', presigned['key']), self.s3.calls)
+        self.assertIn(('HEAD', presigned['key']), self.s3.calls)
+
+        retry = self.confirm(presigned['upload_token'])
+        self.assertEqual((retry.status_code, retry.json()['id']), (200, doc.id))
+        self.assertEqual(Document.objects.count(), 1)
+
+    def test_file_not_matching_the_hash_is_rejected(self):
+        presigned = self.presign().json()
+
+        self.assertEqual(self.upload(presigned, b'%PDF-1.4 something else').status_code, 400)
+        response = self.confirm(presigned['upload_token'])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Document.objects.exists())
+
+    def test_object_without_verified_checksum_is_rejected(self):
+        presigned = self.presign().json()
+        self.s3.objects[presigned['key']] = self.PDF  # Stored without going through the signed POST
+
+        response = self.confirm(presigned['upload_token'])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('could not be verified', response.json()['detail'])
+        self.assertFalse(Document.objects.exists())
+
+    def test_too_large_file_is_rejected(self):
+        big = b'%PDF-1.4 ' + b'x' * 6000
+        presigned = self.presign(big).json()
+
+        self.assertEqual(self.upload(presigned, big).status_code, 400)
+        self.assertEqual(self.confirm(presigned['upload_token']).status_code, 400)
+
+        # Even if it got into the bucket, confirm checks the size again
+        self.s3.objects[presigned['key']] = big
+        response = self.confirm(presigned['upload_token'])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('too large', response.json()['detail'])
+        self.assertFalse(Document.objects.exists())
+
+    def test_unknown_document_type_is_rejected(self):
+        response = self.presign(doc_type='PASSPORT')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('type', response.json())
+        self.assertEqual(self.s3.calls, [])
+
+    def test_upload_without_hash_is_stored_unhashed(self):
+        presigned = self.presign(send_hash=False).json()
+        self.assertNotIn('x-amz-checksum-sha256', presigned['fields'])
+        self.upload(presigned, self.PDF)
+
+        response = self.confirm(presigned['upload_token'])
+
+        self.assertEqual(response.status_code, 201)
+        doc = Document.objects.get()
+        self.assertEqual((doc.sha256, doc.file_size), ('', len(self.PDF)))
+
+    def test_repeated_file_reuses_the_stored_object(self):
+        first = self.presign().json()
+        self.upload(first, self.PDF)
+        self.confirm(first['upload_token'])
+
+        second = self.presign(doc_type='COA').json()
+        self.assertTrue(second['duplicate'])
+        response = self.confirm(second['upload_token'])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            sorted(Document.objects.values_list('type', 'file')),
+            [('COA', first['key']), ('TAX', first['key'])],
+        )
+        self.assertEqual(len(self.s3.objects), 1)
+
+    def test_token_for_another_shop_is_refused(self):
+        presigned = self.presign().json()
+        self.upload(presigned, self.PDF)
+        other = User.objects.create_user(username='other', email='other@example.com', role='OWNER')
+        self.client.force_authenticate(other)
+
+        response = self.confirm(presigned['upload_token'])
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Document.objects.exists())
+
+
+class ReviewQueueTests(TestCase):
+    """The queue reads the stored review_priority, which follows the shop's verified documents."""
+
+    def setUp(self):
+        province = Province.objects.create(name='Gauteng')
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', role='ADMIN', is_staff=True)
+        owner = User.objects.create_user(username='owner', email='owner@example.com', role='OWNER')
+        self.shop = SpazaShop.objects.create(owner=owner, province=province, name='Corner Shop')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def queue(self):
+        return [(row['type'], row['missing_required']) for row in
+                self.client.get('/api/compliance/documents/queue/').json()['results']]
+
+    def test_verifying_a_required_document_reranks_the_shop(self):
+        other = Document.objects.create(shop=self.shop, type='OTHER', file='other.pdf')
+        coa = Document.objects.create(shop=self.shop, type='COA', file='coa.pdf')
+        tax = Document.objects.create(shop=self.shop, type='TAX', file='tax.pdf')
+        self.assertEqual((other.review_priority, coa.review_priority), (7, 6))
+        self.assertEqual(self.queue(), [('COA', 3), ('TAX', 3), ('OTHER', 3)])
+
+        tax.mark_verified(self.admin)
+
+        self.assertEqual(self.queue(), [('COA', 2), ('OTHER', 2)])
+        self.assertEqual(Document.objects.get(pk=other.pk).review_priority, 5)
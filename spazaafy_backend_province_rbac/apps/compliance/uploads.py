@@ -0,0 +1,145 @@
+# apps/compliance/uploads.py
+"""
+Direct-to-S3 document uploads, so web workers never carry file bytes.
+
+1. presign: the owner gets a presigned POST for one fresh key under
+   docs/shop_<id>/ (same prefix as Document.file's upload_to), limited to
+   DOCUMENT_UPLOAD_MAX_BYTES, plus a signed upload token naming that key.
+   When the client sends the file's SHA-256, it is signed into the POST as
+   x-amz-checksum-sha256, so S3 itself rejects a file that does not match.
+2. The client POSTs the file straight to S3.
+3. confirm: the token is checked, one HEAD makes sure the object is really
+   there (and not too big) and returns the checksum S3 verified, and only
+   then is the Document row created. A copy of a file the shop already has
+   is deleted again and the row points at the existing object (see dedup.py).
+
+AWS_S3_ENDPOINT_URL points all of this (and django-storages) at an
+S3-compatible stand-in such as MinIO for local development.
+"""
+import base64
+import os
+import re
+import threading
+import uuid
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core import signing
+
+TOKEN_SALT = 'compliance.document-upload'
+_client = None
+_client_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    pass
+
+
+def s3_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = boto3.client(
+                's3',
+                region_name=settings.AWS_S3_REGION_NAME,
+                endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', None),
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                config=Config(
+                    signature_version='s3v4',
+                    s3={'addressing_style': getattr(settings, 'AWS_S3_ADDRESSING_STYLE', None) or 'auto'},
+                ),
+            )
+        return _client
+
+
+def upload_key(shop_id, filename):
+    """docs/shop_<id>/<random>-<cleaned name>: unique, so uploads never overwrite each other."""
+    base, ext = os.path.splitext(os.path.basename(filename or 'document'))
+    base = re.sub(r'[^A-Za-z0-9._-]+', '_', base).strip('._')[:80] or 'document'
+    ext = re.sub(r'[^A-Za-z0-9.]+', '', ext)[:10]
+    return f"docs/shop_{shop_id}/{uuid.uuid4().hex[:12]}-{base}{ext}"
+
+
+def upload_token(key, shop_id, doc_type, reuse=None, sha256=None):
+    """
+    Signed {'key', 'shop', 'type'}; `reuse` is the id of the document whose stored
+    file the upload is a copy of, `sha256` the checksum signed into the presigned POST.
+    """
+    payload = {'key': key, 'shop': shop_id, 'type': doc_type}
+    if reuse:
+        payload['reuse'] = reuse
+    if sha256:
+        payload['sha256'] = sha256
+    return signing.dumps(payload, salt=TOKEN_SALT)
+
+
+def presign_upload(shop_id, doc_type, filename, sha256=None):
+    """{'url', 'fields', 'key', 'upload_token', 'max_bytes', 'expires_in'} for the client."""
+    key = upload_key(shop_id, filename)
+    max_bytes = settings.DOCUMENT_UPLOAD_MAX_BYTES
+    expires_in = settings.DOCUMENT_UPLOAD_URL_EXPIRES
+    fields = {}
+    if sha256:
+        # Signed, so S3 only accepts the POST when the file matches the hash
+        fields = {
+            'x-amz-checksum-algorithm': 'SHA256',
+            'x-amz-checksum-sha256': base64.b64encode(bytes.fromhex(sha256)).decode(),
+        }
+    post = s3_client().generate_presigned_post(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=key,
+        Fields=fields,
+        Conditions=[['content-length-range', 1, max_bytes]] + [{name: value} for name, value in fields.items()],
+        ExpiresIn=expires_in,
+    )
+    token = upload_token(key, shop_id, doc_type, sha256=sha256)
+    return {
+        'url': post['url'],
+        'fields': post['fields'],
+        'key': key,
+        'upload_token': token,
+        'max_bytes': max_bytes,
+        'expires_in': expires_in,
+    }
+
+
+def read_upload_token(token):
+    """The {'key', 'shop', 'type', 'reuse'?} a token was issued for. Raises UploadError if forged or stale."""
+    # Confirming may take a while after a slow upload on mobile data
+    max_age = settings.DOCUMENT_UPLOAD_URL_EXPIRES + 3600
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=max_age)
+    except signing.SignatureExpired:
+        raise UploadError("This upload has expired; please upload the file again.")
+    except signing.BadSignature:
+        raise UploadError("Invalid upload token.")
+
+
+def verified_upload(key, sha256=None):
+    """
+    (sha256 hex digest, size in bytes) of the uploaded object, from one HEAD; the
+    bytes never pass through the worker. The digest is the checksum S3 verified on
+    upload (must match the signed `sha256`), or '' for an upload presigned without one.
+    Raises UploadError if the object isn't in the bucket, is too big or can't be verified.
+    """
+    try:
+        head = s3_client().head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key, ChecksumMode='ENABLED')
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            raise UploadError("The file has not been uploaded yet.")
+        raise
+    size = head['ContentLength']
+    if size > settings.DOCUMENT_UPLOAD_MAX_BYTES:
+        raise UploadError("The uploaded file is too large.")
+    if not sha256:
+        return '', size
+    checksum = head.get('ChecksumSHA256') or ''
+    if base64.b64decode(checksum).hex() != sha256:
+        raise UploadError("The uploaded file could not be verified; please upload it again.")
+    return sha256, size
+
+
+def delete_upload(key):
+    s3_client().delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
@@ -1,11 +1,15 @@
-import csv
-from django.http import HttpResponse
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Document, DocumentStatus
-from .serializers import DocumentSerializer
+from .models import Document, DocumentStatus, DocumentType
+from apps.core.pagination import keyset_page, InvalidCursor
+from django.db.models import F
+from .serializers import DocumentSerializer, DocumentQueueSerializer, BulkReviewSerializer, DocumentUploadRequestSerializer, DocumentUploadConfirmSerializer
+from .uploads import UploadError, delete_upload, presign_upload, read_upload_token, upload_token, verified_upload
+from .dedup import HashingUploadHandler, find_blob, find_pending_copy, sha256_of, storage_report
+from .review import bulk_review, rejection_email
 from apps.core.permissions import ProvinceScopedMixin
+from apps.core.exports import stream_csv, choice_label
 from django.utils import timezone
 from apps.shops.models import SpazaShop
 from rest_framework.exceptions import PermissionDenied
@@ -13,10 +17,10 @@ import sys
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser 
 import traceback
 from django.core.files.storage import default_storage
+from django.core.cache import cache
 from django.conf import settings
 import os
 import boto3, botocore
-from django.core.mail import EmailMessage
 from apps.core.utils import send_expo_push_notification
 
 class DocumentViewSet(ProvinceScopedMixin, viewsets.ModelViewSet):
@@ -31,6 +35,11 @@ class DocumentViewSet(ProvinceScopedMixin, viewsets.ModelViewSet):
         if user.is_staff and getattr(user, 'role', None) == 'ADMIN':
             return self.scope_by_province(qs, user)
         return qs.filter(shop__owner=user)
+
+    def create(self, request, *args, **kwargs):
+        # ✅ Hash the file while the multipart body streams in (see dedup.py)
+        request._request.upload_handlers.insert(0, HashingUploadHandler(request._request))
+        return super().create(request, *args, **kwargs)
     
     def perform_create(self, serializer):
         """
@@ -72,15 +81,161 @@ class DocumentViewSet(ProvinceScopedMixin, viewsets.ModelViewSet):
         else:
              print("--- DOCUMENT UPLOAD: No location data provided. ---", file=sys.stderr)
 
+        # ✅ Same file again for this shop: reuse the stored object instead of writing a copy
+        upload = serializer.validated_data['file']
+        sha256 = getattr(self.request, 'upload_sha256', {}).get('file') or sha256_of(upload)
+        pending = find_pending_copy(shop.id, serializer.validated_data['type'], sha256)
+        if pending:
+            print(f"--- DOCUMENT UPLOAD: Identical to pending document {pending.id}; nothing stored ---", file=sys.stderr)
+            serializer.instance = pending
+            return
+        extra = {'sha256': sha256, 'file_size': upload.size}
+        blob = find_blob(shop.id, sha256)
+        if blob:
+            print(f"--- DOCUMENT UPLOAD: Identical to document {blob.id}; reusing {blob.file.name} ---", file=sys.stderr)
+            extra['file'] = blob.file.name
+
         try:
             # The serializer automatically maps validated_data to model fields, 
             # so upload_lat/lng will be saved automatically here.
-            serializer.save(shop=shop)
+            serializer.save(shop=shop, **extra)
         except Exception:
             traceback.print_exc()
             raise
         print("--- DOCUMENT UPLOAD: serializer.save() completed successfully! ---", file=sys.stderr)
 
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def queue(self, request):
+        """
+        Endpoint: /api/compliance/documents/queue/?cursor=&page_size=50&type=TAX
+        PENDING documents in review order: shops closest to verification first
+        (fewest required types still unverified), then required types, then
+        oldest upload. Keyset-paginated; follow next_cursor for the next page.
+        """
+        try:
+            page_size = min(max(int(request.query_params.get('page_size', 50)), 1), 200)
+        except ValueError:
+            return Response({'detail': 'page_size must be a number'}, status=400)
+
+        # review_priority is stored and indexed with (status, uploaded_at, id), so
+        # the keyset order below is read straight off document_review_queue_idx
+        pending = (
+            self.get_queryset()
+            .filter(status=DocumentStatus.PENDING)
+            .select_related('shop__owner', 'shop__province')
+            .annotate(missing_required=F('review_priority') / 2)
+        )
+        if request.query_params.get('type'):
+            pending = pending.filter(type=request.query_params['type'])
+
+        cursor = request.query_params.get('cursor')
+        try:
+            docs, next_cursor = keyset_page(
+                pending, ['review_priority', 'uploaded_at', 'id'], cursor, page_size,
+            )
+        except InvalidCursor:
+            return Response({'detail': 'Invalid cursor'}, status=400)
+
+        data = {
+            'results': DocumentQueueSerializer(docs, many=True).data,
+            'next_cursor': next_cursor,
+        }
+        if not cursor:
+            data['pending_count'] = pending.count()  # First page only
+        return Response(data)
+
+    # ✅ Direct-to-S3 uploads: the file goes from the client to S3, never through a worker
+    @action(detail=False, methods=['post'])
+    def presign_upload(self, request):
+        """
+        Endpoint: POST /api/compliance/documents/presign_upload/ {type, filename}
+        Returns a presigned POST (url + fields) for one key under docs/shop_<id>/.
+        With the file's sha256 (optional), S3 only accepts the upload if it matches,
+        and a file the shop already uploaded returns {duplicate: true, upload_token}
+        instead: skip the upload and confirm. That shortcut only ever points at this
+        shop's own stored objects, whose hashes were verified when they were stored.
+        """
+        serializer = DocumentUploadRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        shop = SpazaShop.objects.filter(owner=request.user).first()
+        if not shop:
+            raise PermissionDenied("You do not own a shop and cannot upload documents.")
+        sha256 = data.get('sha256', '').lower()
+        blob = find_blob(shop.id, sha256)
+        if blob:
+            return Response({
+                'duplicate': True,
+                'key': blob.file.name,
+                'upload_token': upload_token(blob.file.name, shop.id, data['type'], reuse=blob.id),
+            })
+        return Response(presign_upload(shop.id, data['type'], data['filename'], sha256=sha256))
+
+    @action(detail=False, methods=['post'])
+    def confirm_upload(self, request):
+        """
+        Endpoint: POST /api/compliance/documents/confirm_upload/
+        {upload_token, upload_lat, upload_lng, upload_accuracy?, expiry_date?}
+        Checks the object in S3 (one HEAD), then creates the Document. A copy of a file
+        the shop already has is deleted and the document uses the stored one.
+        """
+        serializer = DocumentUploadConfirmSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            upload = read_upload_token(data['upload_token'])
+        except UploadError as e:
+            return Response({'detail': str(e)}, status=400)
+
+        shop = SpazaShop.objects.filter(pk=upload['shop'], owner=request.user).first()
+        if not shop:
+            raise PermissionDenied("This upload belongs to another shop.")
+
+        if upload.get('reuse'):
+            # presign_upload matched the client's hash: no new object was uploaded
+            blob = Document.objects.filter(pk=upload['reuse'], shop=shop, file=upload['key']).first()
+            if not blob:
+                return Response({'detail': "The earlier copy of this file is gone; please upload it again."}, status=400)
+            key, sha256, size = blob.file.name, blob.sha256, blob.file_size
+        else:
+            # Confirming twice (e.g. a retried request) returns the same document,
+            # also when the first confirm already deleted the object as a duplicate
+            confirmed = cache.get(f"compliance:upload:{upload['key']}")
+            existing = Document.objects.filter(shop=shop, pk=confirmed).first() if confirmed else \
+                Document.objects.filter(shop=shop, file=upload['key']).first()
+            if existing:
+                return Response(DocumentSerializer(existing).data)
+
+            try:
+                sha256, size = verified_upload(upload['key'], upload.get('sha256'))
+            except UploadError as e:
+                return Response({'detail': str(e)}, status=400)
+            key = upload['key']
+            blob = find_blob(shop.id, sha256)
+            if blob:
+                delete_upload(key)
+                key = blob.file.name
+
+        pending = find_pending_copy(shop.id, upload['type'], sha256)
+        if pending:
+            doc = pending
+        else:
+            doc = Document(
+                shop=shop,
+                type=upload['type'],
+                upload_lat=data['upload_lat'],
+                upload_lng=data['upload_lng'],
+                upload_accuracy=data.get('upload_accuracy'),
+                expiry_date=data.get('expiry_date'),
+                sha256=sha256,
+                file_size=size,
+            )
+            doc.file.name = key  # Already in the bucket; nothing to upload
+            doc.save()
+        if not upload.get('reuse'):
+            cache.set(f"compliance:upload:{upload['key']}", doc.id, settings.DOCUMENT_UPLOAD_URL_EXPIRES + 3600)
+        return Response(DocumentSerializer(doc).data, status=200 if pending else 201)
+
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
     def verify(self, request, pk=None):
         doc = self.get_object()
@@ -139,29 +294,7 @@ class DocumentViewSet(ProvinceScopedMixin, viewsets.ModelViewSet):
         if rejection_reason and doc.shop.owner.email:
             try:
                 shop_owner = doc.shop.owner
-                subject = f"Action Required: Document Rejected for {doc.shop.name}"
-                body = f"""
-                Dear {shop_owner.first_name},
-
-                Your document submission for "{doc.get_type_display()}" has been REJECTED by our verification team.
-
-                Reason for rejection:
-                --------------------------------------------------
-                {rejection_reason}
-                --------------------------------------------------
-
-                Please log in to your dashboard to upload a corrected version.
-
-                Regards,
-                Spazaafy Admin Team
-                """
-
-                email = EmailMessage(
-                    subject=subject,
-                    body=body,
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    to=[shop_owner.email]
-                )
+                email = rejection_email(doc, rejection_reason)
                 email.send()
                 print(f"Rejection email sent to {shop_owner.email}")
             except Exception as e:
@@ -169,15 +302,33 @@ class DocumentViewSet(ProvinceScopedMixin, viewsets.ModelViewSet):
             
         return Response(DocumentSerializer(doc).data)
     
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def bulk_review(self, request):
+        """
+        Endpoint: POST /api/compliance/documents/bulk_review/
+        {"decisions": [{"id": 1, "action": "verify", "expiry_date": "2027-01-31"},
+                       {"id": 2, "action": "reject", "rejection_reason": "Blurry"}]}
+        One transaction for all status changes; each affected shop is rechecked once.
+        """
+        serializer = BulkReviewSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = bulk_review(self.get_queryset(), serializer.validated_data['decisions'], request.user)
+        return Response(result)
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def storage_report(self, request):
+        """Endpoint: GET /api/compliance/documents/storage_report/ (bytes saved by shared objects)"""
+        return Response(storage_report())
+
     @action(detail=False, methods=['get'])
     def export_csv(self, request):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="documents.csv"'
-        writer = csv.writer(response)
-        writer.writerow(['ID', 'Shop Name', 'Document Type', 'Status', 'Submitted At', 'Expiry Date'])
-        for doc in self.get_queryset():
-            writer.writerow([
-                doc.id, doc.shop.name, doc.get_type_display(),
-                doc.get_status_display(), doc.uploaded_at, doc.expiry_date
-            ])
-        return response
\ No newline at end of file
+        # ✅ Streamed from one values() query (shop name via JOIN)
+        return stream_csv(
+            self.get_queryset(), 'documents.csv',
+            ['ID', 'Shop Name', 'Document Type', 'Status', 'Submitted At', 'Expiry Date'],
+            ['id', 'shop__name', 'type', 'status', 'uploaded_at', 'expiry_date'],
+            row=lambda doc: [
+                doc['id'], doc['shop__name'], choice_label(DocumentType, doc['type']),
+                choice_label(DocumentStatus, doc['status']), doc['uploaded_at'], doc['expiry_date'],
+            ],
+        )
\ No newline at end of file
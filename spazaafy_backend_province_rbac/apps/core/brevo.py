@@ -0,0 +1,169 @@
+# apps/core/brevo.py
+"""
+Batch transport for Brevo's transactional API (POST /v3/smtp/email).
+
+Anymail sends one API request per message. Brevo also accepts a single
+request carrying `messageVersions`: one shared subject/body (or templateId)
+plus up to BREVO_BATCH_SIZE recipients, each with their own `params`.
+Content refers to them as {{ params.NAME }}. The response lists one
+messageId per version, in order, and we map those back onto recipients.
+
+Brevo runs its template engine over the whole subject and body, so text we
+did not write (campaign content, job titles, names) is passed through
+quote_text()/quote_html() and never read as a tag.
+
+BREVO_API_URL can point at a local fake server for testing.
+"""
+import re
+import threading
+from collections import namedtuple
+import requests
+from django.conf import settings
+from django.utils.html import escape, linebreaks
+
+# What the caller passes in: email, display name, merge params (dict)
+BatchRecipient = namedtuple('BatchRecipient', ['email', 'name', 'params'])
+# What comes back for every recipient: status is 'SENT' or 'FAILED'
+BatchResult = namedtuple('BatchResult', ['email', 'status', 'message_id', 'error'])
+
+PARAM_PATTERN = re.compile(r"\{\{\s*params\.(\w+)\s*\}\}")
+# Start of a Brevo tag: {{ ... }}, {% ... %} or {# ... #}
+TAG_OPENER = re.compile(r"\{(?=[{%#])")
+
+
+def render_params(content, params):
+    """Local equivalent of Brevo's {{ params.X }} substitution (used by fallbacks)."""
+    if not content:
+        return content
+    return PARAM_PATTERN.sub(lambda m: str(params.get(m.group(1), '')), content)
+
+
+def quote_text(text):
+    """Plain text that Brevo prints as-is (a zero-width space breaks up {{, {% and {#)."""
+    return TAG_OPENER.sub('{\u200b', text) if text else text
+
+
+def quote_html(html):
+    """HTML that Brevo prints as-is: braces become entities, which render the same."""
+    return html.replace('{', '&#123;').replace('}', '&#125;') if html else html
+
+
+def batch_bodies(text):
+    """
+    (text, html) batch content for a plain-text body that uses {{ params.X }} tags.
+    Only those tags stay live. In the HTML version, everything else is escaped
+    and the tags point at X_HTML, the escaped param (see html_params()).
+    """
+    text_parts, html_parts, pos = [], [], 0
+    for match in PARAM_PATTERN.finditer(text):
+        segment = text[pos:match.start()]
+        text_parts += [quote_text(segment), match.group(0)]
+        html_parts += [quote_html(escape(segment)), '{{ params.%s_HTML }}' % match.group(1)]
+        pos = match.end()
+    text_parts.append(quote_text(text[pos:]))
+    html_parts.append(quote_html(escape(text[pos:])))
+    return ''.join(text_parts), linebreaks(''.join(html_parts))
+
+
+def html_params(params):
+    """params plus an HTML-escaped X_HTML copy of each, for bodies built by batch_bodies()."""
+    params = dict(params or {})
+    params.update({f"{key}_HTML": escape(str(value)) for key, value in list(params.items())})
+    return params
+
+
+class BrevoBatchError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        # None for network errors/timeouts (see mail_dispatch.is_provider_outage)
+        self.status_code = status_code
+
+
+class BrevoBatchTransport:
+    def __init__(self, api_key=None, api_url=None, batch_size=None, timeout=None):
+        self.api_key = api_key or settings.ANYMAIL.get('BREVO_API_KEY')
+        self.api_url = (api_url or getattr(settings, 'BREVO_API_URL', 'https://api.brevo.com/v3')).rstrip('/')
+        self.batch_size = batch_size or getattr(settings, 'BREVO_BATCH_SIZE', 1000)
+        self.timeout = timeout or getattr(settings, 'BREVO_TIMEOUT', 30)
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        # Keep-alive session per worker thread instead of a new TLS handshake per call
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({
+                'api-key': self.api_key or '',
+                'accept': 'application/json',
+                'content-type': 'application/json',
+            })
+            self._local.session = session
+        return session
+
+    @classmethod
+    def is_configured(cls):
+        return bool(getattr(settings, 'BREVO_BATCH_SEND', False) and settings.ANYMAIL.get('BREVO_API_KEY'))
+
+    def chunks(self, recipients):
+        for i in range(0, len(recipients), self.batch_size):
+            yield recipients[i:i + self.batch_size]
+
+    def post_chunk(self, payload, chunk):
+        """
+        Sends one API request for `chunk`. Raises BrevoBatchError if the whole
+        request failed, so callers can decide how to fall back.
+        """
+        payload = dict(payload)
+        payload['messageVersions'] = [
+            {
+                'to': [{'email': r.email, 'name': r.name} if r.name else {'email': r.email}],
+                'params': r.params or {},
+            }
+            for r in chunk
+        ]
+        try:
+            response = self.session.post(f"{self.api_url}/smtp/email", json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise BrevoBatchError(f"Brevo request failed: {e}") from e
+
+        if response.status_code >= 300:
+            raise BrevoBatchError(f"Brevo returned {response.status_code}: {response.text[:300]}", response.status_code)
+
+        try:
+            message_ids = response.json().get('messageIds') or []
+        except ValueError:
+            message_ids = []
+
+        results = []
+        for i, r in enumerate(chunk):
+            message_id = message_ids[i] if i < len(message_ids) else None
+            results.append(BatchResult(r.email, 'SENT', message_id, None))
+        return results
+
+    def build_payload(self, subject=None, html_content=None, text_content=None, template_id=None, sender=None):
+        payload = {'sender': sender or {'email': settings.DEFAULT_FROM_EMAIL}}
+        if template_id:
+            payload['templateId'] = int(template_id)
+        if subject:
+            payload['subject'] = quote_text(subject)
+        if html_content:
+            payload['htmlContent'] = html_content
+        if text_content:
+            payload['textContent'] = text_content
+        return payload
+
+    def send_batch(self, recipients, **content):
+        """
+        Sends to every recipient, `batch_size` per API request.
+        `content` is passed to build_payload(). Returns one BatchResult per recipient;
+        recipients in a failed request come back as FAILED with the error.
+        """
+        payload = self.build_payload(**content)
+        results = []
+        for chunk in self.chunks(list(recipients)):
+            try:
+                results.extend(self.post_chunk(payload, chunk))
+            except BrevoBatchError as e:
+                results.extend(BatchResult(r.email, 'FAILED', None, str(e)) for r in chunk)
+        return results
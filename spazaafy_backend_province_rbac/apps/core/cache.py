@@ -0,0 +1,152 @@
+# apps/core/cache.py
+"""
+Read-through cache for serialised API responses.
+
+Entries live in named groups (e.g. 'list', 'shop:12'). Each group has a
+random generation token stored next to the entries, and every key includes it:
+    <namespace>:<group>:<generation>:<hash of the query parameters>
+Invalidating a group deletes its token; the next read draws a new one, so
+all of its entries (for every combination of query parameters) stop being
+read at once and age out.
+
+The backend is anything with Django's cache get/set/get_or_set/delete API:
+`LocalLRUCache` (per process, bounded, the default) or any alias from
+settings.CACHES for a cache shared between workers (e.g. Redis).
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from django.core.cache import caches
+
+_MISSING = object()
+
+
+class LocalLRUCache:
+    """Thread-safe in-process LRU with per-entry expiry (subset of Django's cache API)."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, default, timeout=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            # Another thread may set it first; both values are valid fresh tokens
+            self.set(key, default, timeout)
+            value = default
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ReadThroughCache:
+    def __init__(self, namespace, backend, timeout):
+        self.namespace = namespace
+        self.backend = backend
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def _generation(self, group):
+        # A missing (evicted/expired) token gets a new random one, never an old value,
+        # so entries written under an invalidated generation can't come back.
+        return self.backend.get_or_set(f"{self.namespace}:gen:{group}", uuid.uuid4().hex[:12], None)
+
+    def key(self, group, params):
+        items = sorted((k, v) for k in params for v in params.getlist(k)) if hasattr(params, 'getlist') \
+            else sorted(params.items())
+        digest = hashlib.sha1(repr(items).encode()).hexdigest()[:16]
+        return f"{self.namespace}:{group}:{self._generation(group)}:{digest}"
+
+    def get_or_compute(self, group, params, compute):
+        """Cached value for (group, params), calling compute() and storing it on a miss."""
+        key = self.key(group, params)
+        value = self.backend.get(key, _MISSING)
+        with self._stats_lock:
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is _MISSING:
+            value = compute()
+            self.backend.set(key, value, self.timeout)
+        return value
+
+    def get_or_compute_many(self, group, params_list, compute):
+        """
+        get_or_compute() for several params of one group. compute(missing_params)
+        gets only the misses, in order, and returns their values in that order.
+        Returns the values for params_list, in order.
+        """
+        keys = [self.key(group, params) for params in params_list]
+        values = [self.backend.get(key, _MISSING) for key in keys]
+        missing = [i for i, value in enumerate(values) if value is _MISSING]
+        with self._stats_lock:
+            self.misses += len(missing)
+            self.hits += len(values) - len(missing)
+        if missing:
+            for i, value in zip(missing, compute([params_list[i] for i in missing])):
+                values[i] = value
+                self.backend.set(keys[i], value, self.timeout)
+        return values
+
+    def invalidate(self, *groups):
+        for group in groups:
+            self.backend.delete(f"{self.namespace}:gen:{group}")
+
+    def stats(self):
+        """Counters are per process, even with a shared backend."""
+        total = self.hits + self.misses
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else None,
+            'backend': type(self.backend).__name__,
+        }
+        if isinstance(self.backend, LocalLRUCache):
+            stats['entries'] = len(self.backend)
+            stats['max_entries'] = self.backend.max_entries
+        return stats
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.hits = self.misses = 0
+
+
+def build_cache(namespace, backend='local', timeout=300, max_entries=512):
+    """`backend` is 'local' for an in-process LRU, or an alias from settings.CACHES."""
+    store = LocalLRUCache(max_entries) if backend == 'local' else caches[backend]
+    return ReadThroughCache(namespace, store, timeout)
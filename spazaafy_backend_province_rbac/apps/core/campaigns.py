@@ -0,0 +1,477 @@
+# apps/core/campaigns.py
+"""
+CRM campaign sending.
+
+`CRMViewSet.send_email` only creates a CampaignSendJob and queues
+`run_campaign_send()`. Everything in this module runs off the request thread:
+the job thread walks the recipients and fans the individual sends out to the
+shared worker pool (apps/core/jobs.py), updating the job's progress counters
+as results come back. When Brevo batch sending is configured, each worker task
+is one API call for up to BREVO_BATCH_SIZE recipients (apps/core/brevo.py).
+
+Runs are resumable: EmailLog rows are keyed on (template, recipient, run), a
+rerun of the same job skips recipients that already have a SENT row and
+overwrites the FAILED ones. Results are written within a few seconds of
+coming back (and on every exit path), and the job's counters only move
+together with the rows, so a crash loses at most that window.
+
+Only one worker sends for a job at a time: a worker claims the job with a
+conditional QUEUED -> RUNNING update, and its attempt number is its lease.
+A forced resume starts a new attempt; the old worker notices within
+JOB_LEASE_CHECK_SECONDS, stops sending and writes what it already sent,
+and the new attempt waits that long (twice) before reading who is left.
+"""
+from collections import defaultdict, namedtuple
+from concurrent.futures import wait, FIRST_COMPLETED
+import time
+from itertools import islice
+from urllib.parse import urljoin
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.html import escape, strip_tags, linebreaks
+from apps.accounts.models import User
+from .brevo import BatchRecipient, BrevoBatchError, BrevoBatchTransport, quote_html, quote_text
+from .jobs import run_in_pool
+from .mail_dispatch import get_dispatcher, ProviderUnavailable
+from .models import CampaignSendJob, EmailLog, EmailTemplateStats
+
+# How often a running send checks that a forced resume has not taken the job over
+JOB_LEASE_CHECK_SECONDS = 5
+
+
+class JobSuperseded(Exception):
+    """The job was resumed by another worker; this one stops sending."""
+
+
+# Request key -> (User.role, label stored on EmailLog.target_group)
+RECIPIENT_GROUPS = {
+    'consumers': ('CONSUMER', 'Consumer'),
+    'owners': ('OWNER', 'Spaza Shop'),
+    'employees': ('EMPLOYEE', 'Employee'),
+    'admin': ('ADMIN', 'Admin/Internal'),
+}
+
+# Write buffered EmailLog rows (and the job's counters) after this many results
+# or this many seconds, whichever comes first
+EMAIL_LOG_FLUSH_EVERY = 100
+EMAIL_LOG_FLUSH_SECONDS = 2
+
+LOGO_URL = "https://spazaafy-frontend-wired.onrender.com/media/spazaafy-logo-no-background.png"
+GRADIENT_STYLE = "background: linear-gradient(90deg, #ff3131 0%, #4ac351 100%);"
+BUTTON_STYLE = "background: linear-gradient(90deg, #ff3131 0%, #4ac351 100%); color: white; padding: 14px 32px; text-decoration: none; border-radius: 50px; font-weight: bold; font-size: 16px; display: inline-block; box-shadow: 0 4px 15px rgba(255, 49, 49, 0.2);"
+LINK_COLOR = "#ff3131"
+
+
+# One row per recipient, as streamed from the database
+Recipient = namedtuple('Recipient', ['id', 'email', 'first_name', 'group'])
+
+
+def recipient_queryset(recipient_groups):
+    """Active users with an email address in any of the requested groups."""
+    roles = [role for key, (role, _) in RECIPIENT_GROUPS.items() if key in recipient_groups]
+    return User.objects.filter(role__in=roles, is_active=True).exclude(email='')
+
+
+def count_recipients(recipient_groups):
+    return recipient_queryset(recipient_groups).aggregate(
+        n=Count(Lower('email'), distinct=True)
+    )['n']
+
+
+def resolve_recipients(recipient_groups, chunk_size=2000, skip_sent_in_run=None):
+    """
+    Streams Recipient tuples for the requested groups with a single
+    `role__in` query over just the columns we need. Rows come through a
+    server-side cursor ordered by email, so duplicate addresses are adjacent
+    and can be dropped without remembering what was already seen.
+
+    With `skip_sent_in_run`, recipients that already have a SENT EmailLog row
+    for that run are left out. The check is an EXISTS subquery in the same
+    query, not a lookup per user. It is applied after de-duplication so a
+    resumed run picks the same address owner as the first pass did.
+    """
+    labels = {role: label for role, label in RECIPIENT_GROUPS.values()}
+    qs = recipient_queryset(recipient_groups).annotate(email_key=Lower('email'))
+    fields = ['id', 'email', 'first_name', 'role', 'email_key']
+    if skip_sent_in_run:
+        qs = qs.annotate(already_sent=Exists(EmailLog.objects.filter(
+            run_id=skip_sent_in_run, recipient_id=OuterRef('pk'), status='SENT'
+        )))
+        fields.append('already_sent')
+    rows = qs.order_by('email_key', 'id').values_list(*fields).iterator(chunk_size=chunk_size)
+
+    last_key = None
+    for user_id, email, first_name, role, email_key, *already_sent in rows:
+        if email_key == last_key:
+            continue
+        last_key = email_key
+        if already_sent and already_sent[0]:
+            continue
+        yield Recipient(user_id, email, first_name, labels[role])
+
+
+def build_campaign_html(template, greeting, base_url):
+    # 1. Image
+    image_html = ""
+    if template.hero_image:
+        img_url = template.hero_image.url
+        if not img_url.startswith('http'):
+            img_url = urljoin(base_url, img_url)
+
+        image_html = f"""
+        <div style="margin: 20px 0 30px 0; text-align: center;">
+            <img src="{img_url}" alt="Update"
+                style="width: 100%; max-width: 100%; border-radius: 12px; box-shadow: 0 8px 20px rgba(0,0,0,0.08); display: block;" />
+        </div>
+        """
+
+    # 2. Buttons
+    buttons_html = ""
+    if template.links:
+        for link in template.links:
+            url = link.get('url', '#')
+            label = link.get('label', 'View')
+            l_type = link.get('type', 'button')
+
+            if l_type == 'button':
+                buttons_html += f'<div style="margin-top: 30px;"><a href="{url}" style="{BUTTON_STYLE}">{label}</a></div>'
+            else:
+                buttons_html += f'<p style="margin-top:20px;"><a href="{url}" style="color:{LINK_COLOR}; text-decoration:underline; font-weight:500;">{label} &rarr;</a></p>'
+
+    # 3. Content
+    formatted_content = linebreaks(template.content)
+
+    return f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>{template.subject}</title>
+    </head>
+    <body style="font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Helvetica, Arial, sans-serif; background-color: #f9fafb; margin: 0; padding: 40px 0; color: #111827;">
+        <div style="max-width: 600px; margin: 0 auto; background: #ffffff; border-radius: 16px; overflow: hidden; box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.05), 0 2px 4px -1px rgba(0, 0, 0, 0.03);">
+            <!-- Top Gradient -->
+            <div style="height: 8px; width: 100%; {GRADIENT_STYLE}"></div>
+            <div style="padding: 40px;">
+                <!-- Logo -->
+                <div style="text-align: center; margin-bottom: 30px;">
+                    <img src="{LOGO_URL}" alt="Spazaafy" width="140" style="display: inline-block;" />
+                </div>
+                <!-- Greeting -->
+                <p style="text-align: center; font-size: 18px; font-weight: 600; margin: 0 0 10px 0; color: #4b5563;">
+                    {greeting}
+                </p>
+                <!-- Headline -->
+                <h1 style="font-size: 24px; font-weight: 800; text-align: center; margin: 0 0 10px 0; color: #111827;">
+                    {template.subject}
+                </h1>
+                <!-- Image -->
+                {image_html}
+                <!-- Body -->
+                <div style="font-size: 16px; line-height: 1.6; color: #4b5563; text-align: center;">
+                    {formatted_content}
+                </div>
+                <!-- Buttons -->
+                <div style="text-align: center;">
+                    {buttons_html}
+                </div>
+            </div>
+            <!-- Footer -->
+            <div style="padding: 30px; text-align: center; background-color: #ffffff; border-top: 1px solid #f3f4f6;">
+                <p style="font-size: 12px; color: #9ca3af; margin: 0;">
+                    You received this email because you are a registered user of Spazaafy.
+                </p>
+                <p style="font-size: 12px; color: #9ca3af; margin-top: 10px;">
+                    &copy; {timezone.now().year} Spazaafy Platform. All rights reserved.
+                </p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+
+
+def deliver_campaign_email(subject, recipient_email, text_content, html_content):
+    """
+    Sends one HTML campaign email via the shared dispatcher (Brevo, then
+    console/backup SMTP). Returns (status, error_message).
+    """
+    def build():
+        msg = EmailMultiAlternatives(
+            subject=subject, body=text_content,
+            from_email=settings.DEFAULT_FROM_EMAIL, to=[recipient_email]
+        )
+        msg.attach_alternative(html_content, "text/html")
+        return msg
+
+    # Separate fallback instance: the backup path rewrites subject/sender
+    result = get_dispatcher().send(build(), fallback=build())
+    if result.status != 'SENT':
+        print(f"⚠️ CRM Email Failed for {recipient_email}: {result.error}")
+    return result.status, result.error
+
+
+class CampaignRenderer:
+    """
+    Builds the campaign shell (image, buttons, formatted body, plain-text part)
+    once per send. Only the greeting differs between recipients, so rendering
+    a recipient is a couple of string concatenations.
+    """
+    GREETING_SLOT = "%%SPAZAAFY_GREETING%%"
+
+    def __init__(self, template, base_url):
+        shell = build_campaign_html(template, self.GREETING_SLOT, base_url)
+        # partition() on the first slot: the greeting sits above the template content
+        self._html_head, _, self._html_tail = shell.partition(self.GREETING_SLOT)
+        self._text_head, _, self._text_tail = strip_tags(shell).partition(self.GREETING_SLOT)
+
+    @staticmethod
+    def greeting_for(first_name):
+        user_name = first_name.strip() if first_name else ""
+        return f"Hi {user_name or 'there'},"
+
+    def render(self, first_name):
+        """Returns (text_content, html_content) for one recipient."""
+        greeting = self.greeting_for(first_name)
+        return (
+            f"{self._text_head}{greeting}{self._text_tail}",
+            f"{self._html_head}{escape(greeting)}{self._html_tail}",
+        )
+
+    def batch_content(self):
+        """
+        (text, html) with Brevo merge tags in place of the greeting, for batch sends.
+        The template's own content is quoted so Brevo can't read tags in it.
+        """
+        return (
+            f"{quote_text(self._text_head)}{{{{ params.GREETING }}}}{quote_text(self._text_tail)}",
+            f"{quote_html(self._html_head)}{{{{ params.GREETING_HTML }}}}{quote_html(self._html_tail)}",
+        )
+
+    def params_for(self, first_name):
+        greeting = self.greeting_for(first_name)
+        return {'NAME': (first_name or '').strip(), 'GREETING': greeting, 'GREETING_HTML': escape(greeting)}
+
+
+class EmailLogBuffer:
+    """
+    Collects EmailLog rows and writes them with bulk_create once `chunk_size`
+    rows are waiting or the oldest has waited `max_age` seconds.
+    Rows are upserted on (template, recipient, run), so a resumed run replaces
+    its earlier FAILED row instead of adding a second one.
+    Each flush also moves the EmailTemplateStats counters by what changed and,
+    with `job_id`, the job's sent/failed counters, in the same transaction:
+    progress never counts a result that isn't in EmailLog yet.
+    Owned by the job thread only, so it needs no locking.
+    """
+    def __init__(self, chunk_size=None, max_age=None, job_id=None):
+        self.chunk_size = chunk_size or getattr(settings, 'EMAIL_LOG_FLUSH_EVERY', EMAIL_LOG_FLUSH_EVERY)
+        self.max_age = max_age if max_age is not None else getattr(settings, 'EMAIL_LOG_FLUSH_SECONDS', EMAIL_LOG_FLUSH_SECONDS)
+        self.job_id = job_id
+        self._rows = []
+        self._oldest = None
+
+    def add(self, **fields):
+        if not self._rows:
+            self._oldest = time.monotonic()
+        self._rows.append(EmailLog(**fields))
+        if len(self._rows) >= self.chunk_size:
+            self.flush()
+
+    def flush_if_due(self):
+        if self._rows and time.monotonic() - self._oldest >= self.max_age:
+            self.flush()
+
+    def _previous_statuses(self):
+        """Status of rows this flush will overwrite, keyed like the unique constraint."""
+        previous = {}
+        by_run = defaultdict(list)
+        for row in self._rows:
+            if row.run_id and row.recipient_id:
+                by_run[row.run_id].append(row.recipient_id)
+        for run_id, recipient_ids in by_run.items():
+            existing = EmailLog.objects.filter(run_id=run_id, recipient_id__in=recipient_ids).values_list(
+                'template_id', 'recipient_id', 'run_id', 'status'
+            )
+            for template_id, recipient_id, run, status_code in existing:
+                previous[(template_id, recipient_id, run)] = status_code
+        return previous
+
+    def _stat_deltas(self, previous):
+        deltas = defaultdict(lambda: {'total': 0, 'sent': 0, 'failed': 0})
+        for row in self._rows:
+            delta = deltas[(row.template_id, row.target_group)]
+            old = previous.get((row.template_id, row.recipient_id, row.run_id))
+            if old is None:
+                delta['total'] += 1
+            elif old == row.status:
+                continue
+            else:
+                delta[old.lower()] -= 1
+            delta[row.status.lower()] += 1
+        return deltas
+
+    def flush(self):
+        if self._rows:
+            with transaction.atomic():
+                previous = self._previous_statuses()
+                deltas = self._stat_deltas(previous)
+                EmailLog.objects.bulk_create(
+                    self._rows, batch_size=self.chunk_size,
+                    update_conflicts=True,
+                    unique_fields=['template', 'recipient', 'run'],
+                    update_fields=['status', 'error_message', 'provider_message_id', 'sent_at'],
+                )
+                EmailTemplateStats.apply_deltas(deltas)
+                if self.job_id:
+                    # A row that was already SENT (e.g. by a superseded attempt) isn't sent again
+                    _flush_progress(
+                        self.job_id,
+                        sum(1 for row in self._rows if row.status == 'SENT'
+                            and previous.get((row.template_id, row.recipient_id, row.run_id)) != 'SENT'),
+                        sum(1 for row in self._rows if row.status != 'SENT'),
+                    )
+            self._rows = []
+
+
+def _send_to_recipient(renderer, subject, email, first_name):
+    text_content, html_content = renderer.render(first_name)
+    return deliver_campaign_email(subject, email, text_content, html_content)
+
+
+def _send_chunk(renderer, subject, chunk):
+    """Per-recipient sends for one chunk of Recipient tuples."""
+    results = []
+    for r in chunk:
+        status_code, error_message = _send_to_recipient(renderer, subject, r.email, r.first_name)
+        results.append((status_code, error_message, None))
+    return results
+
+
+def _send_chunk_batched(transport, payload, renderer, subject, chunk):
+    """One Brevo API call for the whole chunk; per-recipient fallback if that call fails."""
+    recipients = [
+        BatchRecipient(r.email, (r.first_name or '').strip(), renderer.params_for(r.first_name))
+        for r in chunk
+    ]
+    try:
+        results = get_dispatcher().call_primary(transport.post_chunk, payload, recipients)
+        return [(r.status, r.error, r.message_id) for r in results]
+    except (BrevoBatchError, ProviderUnavailable) as e:
+        print(f"⚠️ [CRM] Brevo batch of {len(chunk)} failed, sending individually: {e}")
+        return _send_chunk(renderer, subject, chunk)
+
+
+def _flush_progress(job_id, sent, failed):
+    if sent or failed:
+        CampaignSendJob.objects.filter(pk=job_id).update(
+            sent_count=F('sent_count') + sent,
+            failed_count=F('failed_count') + failed,
+        )
+
+
+def run_campaign_send(job_id, base_url, takeover=False):
+    """
+    Background entry point. Resolves recipients for the job, sends through the
+    worker pool and keeps the job's counters current for `send_status`.
+    Also used to resume a job: recipients already SENT in this run are skipped.
+    Does nothing unless it can claim the job (QUEUED -> RUNNING).
+    `takeover`: the job was taken from a RUNNING attempt (forced resume) that may still be alive.
+    """
+    claimed = CampaignSendJob.objects.filter(pk=job_id, status='QUEUED').update(
+        status='RUNNING', attempts=F('attempts') + 1, failed_count=0,
+        error_message=None, started_at=timezone.now(), finished_at=None,
+    )
+    if not claimed:
+        print(f"[CRM] Job {job_id} is not queued (already claimed by another worker); not sending.")
+        return
+    job = CampaignSendJob.objects.select_related('template').get(pk=job_id)
+    template = job.template
+    # Later status writes only apply while this attempt still owns the job
+    this_attempt = CampaignSendJob.objects.filter(pk=job.id, attempts=job.attempts)
+    lease_checked_at = time.monotonic()
+
+    def check_lease():
+        nonlocal lease_checked_at
+        if time.monotonic() - lease_checked_at >= JOB_LEASE_CHECK_SECONDS:
+            lease_checked_at = time.monotonic()
+            if not this_attempt.exists():
+                raise JobSuperseded()
+
+    try:
+        if takeover:
+            # Let a still-running old attempt notice and log what it already sent
+            time.sleep(2 * JOB_LEASE_CHECK_SECONDS)
+        job.total = count_recipients(job.recipient_groups)
+        # Earlier passes of this run count as done; their failures are retried
+        job.sent_count = job.logs.filter(status='SENT').count()
+        this_attempt.update(total=job.total, sent_count=job.sent_count)
+        if job.sent_count:
+            print(f"🔁 [CRM] Resuming job {job.id}: {job.sent_count} already sent, skipping them.")
+
+        renderer = CampaignRenderer(template, base_url)
+        logs = EmailLogBuffer(job_id=job.id)
+        pending = {}
+
+        if BrevoBatchTransport.is_configured():
+            # One API call per chunk of up to BREVO_BATCH_SIZE recipients
+            transport = BrevoBatchTransport()
+            text_content, html_content = renderer.batch_content()
+            payload = transport.build_payload(subject=template.subject, html_content=html_content, text_content=text_content)
+            chunk_size = transport.batch_size
+            task = lambda chunk: run_in_pool(_send_chunk_batched, transport, payload, renderer, template.subject, chunk)
+        else:
+            chunk_size = 1
+            task = lambda chunk: run_in_pool(_send_chunk, renderer, template.subject, chunk)
+        max_in_flight = getattr(settings, 'BACKGROUND_WORKERS', 8) * (1 if chunk_size > 1 else 4)
+
+        def collect(until_in_flight):
+            """Logs results as they come back until at most `until_in_flight` sends are pending."""
+            while len(pending) > until_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED, timeout=logs.max_age)
+                log_results(done)
+                logs.flush_if_due()
+
+        def log_results(done):
+            for future in done:
+                chunk = pending.pop(future)
+                try:
+                    results = future.result()
+                except Exception as e:
+                    results = [('FAILED', f"Send task crashed: {e}", None)] * len(chunk)
+                for r, (status_code, error_message, message_id) in zip(chunk, results):
+                    logs.add(
+                        template=template, recipient_id=r.id, recipient_email=r.email,
+                        target_group=r.group, status=status_code, error_message=error_message,
+                        provider_message_id=message_id, run_id=job.id
+                    )
+
+        try:
+            recipients = resolve_recipients(job.recipient_groups, skip_sent_in_run=job.id)
+            while True:
+                chunk = list(islice(recipients, chunk_size))
+                if not chunk:
+                    break
+                check_lease()
+                pending[task(chunk)] = chunk
+                collect(until_in_flight=max_in_flight - 1)
+        finally:
+            # Whatever was already sent gets logged, even if the loop failed,
+            # so a resumed run doesn't email those recipients again
+            collect(until_in_flight=0)
+            logs.flush()
+
+        this_attempt.update(status='COMPLETED', finished_at=timezone.now())
+        job.refresh_from_db()
+        print(f"✅ [CRM] Job {job.id}: processed {job.processed} emails. {job.sent_count} sent successfully.")
+
+    except JobSuperseded:
+        print(f"[CRM] Job {job.id} was resumed by another worker; this attempt stopped.")
+    except Exception as e:
+        print(f"CRITICAL CRM ERROR: {e}")
+        this_attempt.update(status='FAILED', error_message=str(e), finished_at=timezone.now())
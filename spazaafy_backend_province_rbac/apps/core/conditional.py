@@ -0,0 +1,118 @@
+# apps/core/conditional.py
+"""
+ETag / Last-Modified support for read-heavy endpoints.
+
+Validators come from one aggregate query (count and max(updated_at) by
+default), never from the serialised payload, so an unchanged resource is
+answered with 304 Not Modified before any serialisation happens. The ETag
+also covers the path, query string and user, because the same URL returns
+different rows to different users.
+
+Last-Modified (and so If-Modified-Since) is only sent for single objects:
+deleting a row from a collection doesn't move max(updated_at), but it does
+change the count inside the ETag.
+
+When the body comes from a cache (_cached_conditional), the validators are
+cached with it, so the ETag always describes the body actually sent.
+"""
+import hashlib
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def make_etag(request, *parts):
+    user_id = request.user.pk if request.user.is_authenticated else 'anon'
+    seed = repr((request.get_full_path(), user_id) + parts)
+    return '"%s"' % hashlib.sha1(seed.encode()).hexdigest()[:32]
+
+
+def queryset_validators(queryset, field='updated_at'):
+    """(count, latest `field` value) of the queryset in one query."""
+    stats = queryset.order_by().aggregate(count=Count('pk'), latest=Max(field))
+    return stats['count'], stats['latest']
+
+
+def conditional_response(request, build, etag_parts, last_modified=None):
+    """
+    304 if the client's If-None-Match / If-Modified-Since still matches,
+    otherwise build() the response and attach the validators to it.
+    """
+    etag = make_etag(request, *etag_parts)
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    response = not_modified or build()
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        # Always revalidate; responses that depend on the caller stay out of shared caches
+        if request.user.is_authenticated:
+            patch_cache_control(response, no_cache=True, private=True)
+        else:
+            patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag/Last-Modified and 304 handling to `list` (and `retrieve`) of a
+    DRF viewset. Override get_validators() when the payload depends on more
+    than count and max(updated_at) of the filtered queryset.
+    """
+    conditional_actions = ('list', 'retrieve')
+    validator_field = 'updated_at'
+
+    def get_validators(self, queryset):
+        """Returns (etag_parts tuple, last_modified datetime or None)."""
+        count, latest = queryset_validators(queryset, self.validator_field)
+        return (count, latest.isoformat() if latest else None), latest
+
+    def _current_validators(self):
+        """(etag_parts, last_modified) for the request, or None for a malformed id."""
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            if self.action == 'retrieve':
+                lookup = self.lookup_url_kwarg or self.lookup_field
+                queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup]})
+            etag_parts, last_modified = self.get_validators(queryset)
+        except (TypeError, ValueError, ValidationError):
+            return None
+        return etag_parts, (last_modified if self.action == 'retrieve' else None)
+
+    def _conditional(self, build):
+        validators = self._current_validators()
+        if validators is None:
+            return build()  # Malformed id: let the normal path answer 404
+        return conditional_response(self.request, build, *validators)
+
+    def _cached_conditional(self, cache, group, compute):
+        """
+        _conditional() for a body served from a ReadThroughCache. The validators
+        are read before the body and cached with it: a worker whose cached body
+        is older than the database answers with that body's (older) ETag, never
+        with a fresh ETag that a client would then keep getting 304s for.
+        """
+        def compute_entry():
+            return self._current_validators(), compute()
+
+        validators, data = cache.get_or_compute(group, self.request.query_params, compute_entry)
+        build = lambda: Response(data)
+        if validators is None:
+            return build()
+        return conditional_response(self.request, build, *validators)
+
+    def list(self, request, *args, **kwargs):
+        build = lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        if 'list' not in self.conditional_actions:
+            return build()
+        return self._conditional(build)
+
+    def retrieve(self, request, *args, **kwargs):
+        build = lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        if 'retrieve' not in self.conditional_actions:
+            return build()
+        return self._conditional(build)
@@ -0,0 +1,112 @@
+# apps/core/jobs.py
+"""
+Small in-process background job runner.
+
+Jobs are executed on a dedicated thread so the HTTP request can return
+immediately. Work inside a job can be fanned out to the shared worker pool
+with `run_in_pool()`. Each task closes its stale DB connections when done,
+because threads do not go through Django's request/response cycle.
+
+`map_concurrently()` is for management commands that send a lot of mail:
+a private pool of `workers` threads, optionally held to `rate` calls per second.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from django.conf import settings
+from django.db import close_old_connections
+
+_lock = threading.Lock()
+_job_executor = None
+_worker_pool = None
+
+
+def _get_job_executor():
+    global _job_executor
+    with _lock:
+        if _job_executor is None:
+            _job_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BACKGROUND_JOB_CONCURRENCY', 2),
+                thread_name_prefix='bg-job',
+            )
+        return _job_executor
+
+
+def get_worker_pool():
+    global _worker_pool
+    with _lock:
+        if _worker_pool is None:
+            _worker_pool = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BACKGROUND_WORKERS', 8),
+                thread_name_prefix='bg-worker',
+            )
+        return _worker_pool
+
+
+def _with_db_cleanup(fn, *args, **kwargs):
+    close_old_connections()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def enqueue(fn, *args, **kwargs):
+    """Schedule `fn(*args, **kwargs)` to run in the background. Returns a Future."""
+    return _get_job_executor().submit(_with_db_cleanup, fn, *args, **kwargs)
+
+
+def run_in_pool(fn, *args, **kwargs):
+    """Submit a unit of work to the shared worker pool. Returns a Future."""
+    return get_worker_pool().submit(_with_db_cleanup, fn, *args, **kwargs)
+
+
+class RateLimiter:
+    """Spaces calls out to at most `rate` per second across all threads."""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def map_concurrently(fn, items, workers=8, rate=None):
+    """
+    Calls fn(item) for every item on `workers` threads and yields
+    (item, result, error) as calls finish (error is None on success).
+    At most 2 x workers calls are in flight, so `items` can be a lazy iterator.
+    """
+    limiter = RateLimiter(rate)
+
+    def call(item):
+        limiter.wait()
+        return _with_db_cleanup(fn, item)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bulk-send') as pool:
+        pending = {}
+
+        def drain(done):
+            for future in done:
+                item = pending.pop(future)
+                try:
+                    yield item, future.result(), None
+                except Exception as e:
+                    yield item, None, e
+
+        for item in items:
+            pending[pool.submit(call, item)] = item
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from drain(done)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from drain(done)
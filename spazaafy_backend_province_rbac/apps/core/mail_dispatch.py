@@ -0,0 +1,263 @@
+# apps/core/mail_dispatch.py
+"""
+Shared mail dispatch layer used by send_email_with_fallback and CRM sends.
+
+- Circuit breaker: after EMAIL_BREAKER_THRESHOLD consecutive Brevo failures the
+  primary is skipped for EMAIL_BREAKER_COOLDOWN seconds, then one trial call is
+  let through (half-open). An outage costs a lock check instead of a timeout.
+  Only outages count (network errors, 429, 5xx): a 4xx for a bad payload or
+  recipient means Brevo is up, and says nothing about the next message.
+- Backup SMTP (Gmail) uses one pooled connection that stays open between
+  messages and is reopened on disconnect.
+- Per-provider counters (sent/failed/skipped, latency) for the CRM dashboard.
+"""
+import smtplib
+import threading
+import time
+from collections import namedtuple
+from django.conf import settings
+from django.core.mail import get_connection
+from anymail.exceptions import AnymailInvalidAddress, AnymailRecipientsRefused
+
+DispatchResult = namedtuple('DispatchResult', ['status', 'provider', 'error'])
+
+
+class ProviderUnavailable(Exception):
+    """Raised instead of calling a provider whose circuit is open."""
+
+
+def is_provider_outage(error):
+    """True for errors that mean the provider is down, False for a rejected request."""
+    if isinstance(error, (AnymailInvalidAddress, AnymailRecipientsRefused)):
+        return False
+    status = getattr(error, 'status_code', None)
+    return status is None or status == 429 or status >= 500
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'CLOSED', 'OPEN', 'HALF_OPEN'
+
+    def __init__(self, failure_threshold, cooldown_seconds):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown_seconds:
+                self.state = self.HALF_OPEN
+            # Half-open: only one caller probes the provider at a time
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"🔌 [Email] Circuit opened after {self.failures} failures; skipping primary for {self.cooldown_seconds}s.")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class ProviderStats:
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.skipped = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def record(self, ok, latency, error=None):
+        with self._lock:
+            if ok:
+                self.sent += 1
+            else:
+                self.failed += 1
+                self.last_error = str(error)[:300] if error else None
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    def record_skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    def snapshot(self):
+        with self._lock:
+            calls = self.sent + self.failed
+            return {
+                'sent': self.sent,
+                'failed': self.failed,
+                'skipped': self.skipped,
+                'avg_latency_ms': round(self.total_latency / calls * 1000, 1) if calls else 0,
+                'max_latency_ms': round(self.max_latency * 1000, 1),
+                'last_error': self.last_error,
+            }
+
+
+class MailDispatcher:
+    PRIMARY = 'brevo'
+    BACKUP = 'backup_smtp'
+    CONSOLE = 'console'
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(
+            failure_threshold=getattr(settings, 'EMAIL_BREAKER_THRESHOLD', 3),
+            cooldown_seconds=getattr(settings, 'EMAIL_BREAKER_COOLDOWN', 60),
+        )
+        self.stats = {name: ProviderStats() for name in (self.PRIMARY, self.BACKUP, self.CONSOLE)}
+        self._backup_conn = None
+        self._backup_lock = threading.Lock()
+
+    # --- Primary (Brevo) ---
+
+    def call_primary(self, fn, *args, **kwargs):
+        """
+        Runs `fn` against the primary provider behind the breaker.
+        Used for single messages and for Brevo batch requests alike.
+        """
+        if getattr(settings, 'FORCE_EMAIL_FALLBACK', False):
+            raise ProviderUnavailable("Forced Fallback (Brevo Down)")
+        if not self.breaker.allow():
+            self.stats[self.PRIMARY].record_skip()
+            raise ProviderUnavailable("Primary provider circuit is open")
+
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.stats[self.PRIMARY].record(False, time.monotonic() - start, e)
+            if is_provider_outage(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()  # It answered; only this request was bad
+            raise
+        self.stats[self.PRIMARY].record(True, time.monotonic() - start)
+        self.breaker.record_success()
+        return result
+
+    # --- Backup (pooled SMTP) ---
+
+    def _open_backup(self):
+        conn = get_connection(
+            backend='django.core.mail.backends.smtp.EmailBackend',
+            host=getattr(settings, 'EMAIL_BACKUP_HOST', 'smtp.gmail.com'),
+            port=getattr(settings, 'EMAIL_BACKUP_PORT', 587),
+            username=settings.EMAIL_BACKUP_USER,
+            password=settings.EMAIL_BACKUP_PASSWORD,
+            use_tls=True,
+            timeout=getattr(settings, 'EMAIL_BACKUP_TIMEOUT', 20),
+        )
+        conn.open()
+        return conn
+
+    def send_backup(self, message):
+        """Sends over the shared SMTP connection, reconnecting once if it went stale."""
+        backup_user = getattr(settings, 'EMAIL_BACKUP_USER', None)
+        if not backup_user or not getattr(settings, 'EMAIL_BACKUP_PASSWORD', None):
+            raise ProviderUnavailable("No backup SMTP credentials configured")
+
+        message.from_email = backup_user
+        start = time.monotonic()
+        with self._backup_lock:
+            for attempt in (1, 2):
+                try:
+                    if self._backup_conn is None:
+                        self._backup_conn = self._open_backup()
+                    message.connection = self._backup_conn
+                    # fail_silently=False surfaces SMTP errors instead of returning 0
+                    self._backup_conn.send_messages([message])
+                    break
+                except (smtplib.SMTPServerDisconnected, smtplib.SMTPSenderRefused, OSError) as e:
+                    self.close_backup(locked=True)
+                    if attempt == 2:
+                        self.stats[self.BACKUP].record(False, time.monotonic() - start, e)
+                        raise
+                except Exception as e:
+                    self.stats[self.BACKUP].record(False, time.monotonic() - start, e)
+                    raise
+        self.stats[self.BACKUP].record(True, time.monotonic() - start)
+
+    def close_backup(self, locked=False):
+        def _close():
+            if self._backup_conn is not None:
+                try:
+                    self._backup_conn.close()
+                except Exception:
+                    pass
+                self._backup_conn = None
+        if locked:
+            _close()
+        else:
+            with self._backup_lock:
+                _close()
+
+    # --- Full chain ---
+
+    def send(self, message, fallback=None):
+        """
+        Primary -> console (USE_CONSOLE_ON_FAIL) or backup SMTP.
+        `fallback` is the message to use if the primary fails (defaults to `message`);
+        its subject gets a [Backup] prefix on the SMTP path.
+        Returns DispatchResult(status 'SENT'/'FAILED', provider, error).
+        """
+        try:
+            self.call_primary(message.send)
+            return DispatchResult('SENT', self.PRIMARY, None)
+        except Exception as e:
+            primary_error = e
+
+        fallback = fallback or message
+        if getattr(settings, 'USE_CONSOLE_ON_FAIL', False):
+            print("\n" + "="*50)
+            print(f"⚠️  FALLBACK EMAIL LOG (Provider Down: {primary_error})  ⚠️")
+            print(f"To: {fallback.to}")
+            print(f"Subject: {fallback.subject}")
+            print("-" * 20)
+            print(fallback.body)
+            print("="*50 + "\n")
+            self.stats[self.CONSOLE].record(True, 0.0)
+            return DispatchResult('SENT', self.CONSOLE, None)
+
+        try:
+            fallback.subject = f"[Backup] {fallback.subject}"
+            self.send_backup(fallback)
+            return DispatchResult('SENT', self.BACKUP, None)
+        except Exception as backup_error:
+            return DispatchResult('FAILED', None, f"Primary: {primary_error} | Backup: {backup_error}")
+
+    def snapshot(self):
+        return {
+            'primary_circuit': self.breaker.state,
+            'providers': {name: s.snapshot() for name, s in self.stats.items()},
+        }
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """Process-wide dispatcher, so breaker state and the SMTP connection are shared."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = MailDispatcher()
+        return _dispatcher
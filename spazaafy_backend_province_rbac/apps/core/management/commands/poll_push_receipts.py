@@ -0,0 +1,36 @@
+# spazaafy_backend_province_rbac/apps/core/management/commands/poll_push_receipts.py
+
+from django.core.management.base import BaseCommand
+from apps.core.push import poll_receipts, push_delivery_stats
+
+
+class Command(BaseCommand):
+    """
+    Fetches Expo push receipts for recently sent tickets and clears push tokens
+    of devices Expo reports as DeviceNotRegistered.
+    Meant to run from cron, e.g. every 30 minutes.
+    """
+    help = 'Polls Expo push receipts and prunes dead push tokens'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age-minutes', type=int, default=15,
+                            help='Skip tickets younger than this (Expo needs time to hand off)')
+        parser.add_argument('--max-age-hours', type=int, default=24,
+                            help='Skip tickets older than this (Expo drops receipts after a day)')
+
+    def handle(self, *args, **options):
+        summary = poll_receipts(
+            min_age_minutes=options['min_age_minutes'],
+            max_age_hours=options['max_age_hours'],
+        )
+        self.stdout.write(
+            f"Checked {summary['checked']} receipts: {summary['ok']} delivered, {summary['errors']} errors, "
+            f"{summary['pending']} not ready yet, {summary['request_failures']} failed requests."
+        )
+        self.stdout.write(self.style.SUCCESS(f"Cleared {summary['tokens_pruned']} dead push token(s)."))
+
+        stats = push_delivery_stats()
+        self.stdout.write(
+            f"All tickets: delivery rate {stats['delivery_rate']}%, error rate {stats['error_rate']}%, "
+            f"{stats['awaiting_receipt']} awaiting receipt."
+        )
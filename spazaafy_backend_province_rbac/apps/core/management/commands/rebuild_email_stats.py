@@ -0,0 +1,24 @@
+# spazaafy_backend_province_rbac/apps/core/management/commands/rebuild_email_stats.py
+
+from django.core.management.base import BaseCommand
+from apps.core.models import EmailTemplateStats
+
+
+class Command(BaseCommand):
+    """
+    Recounts the EmailTemplateStats counters from EmailLog.
+    Not needed for existing history (templates are backfilled on first use);
+    run it any time the counters look off.
+    """
+    help = 'Rebuilds per-template email analytics counters from EmailLog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--template', action='append', dest='templates',
+                            help='Only rebuild this template id (repeatable)')
+
+    def handle(self, *args, **options):
+        templates = options.get('templates')
+        EmailTemplateStats.rebuild(template_ids=templates)
+        scope = f"{len(templates)} template(s)" if templates else "all templates"
+        count = EmailTemplateStats.objects.count()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt email stats for {scope} ({count} counter rows).'))
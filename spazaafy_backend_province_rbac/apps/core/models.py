@@ -1,6 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 import uuid
 
 def validate_file_size(value):
@@ -67,11 +68,210 @@ class EmailLog(models.Model):
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
     error_message = models.TextField(blank=True, null=True)
+    # Brevo messageId, so bounces/webhooks can be matched back to this row
+    provider_message_id = models.CharField(max_length=255, blank=True, null=True)
+    # The campaign run this row belongs to; a resumed run rewrites its FAILED rows in place
+    run = models.ForeignKey('CampaignSendJob', on_delete=models.SET_NULL, null=True, blank=True, related_name='logs')
     sent_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['template', 'recipient', 'run'], name='unique_emaillog_per_run'),
+        ]
+        indexes = [
+            # Keyset pagination of a template's recent logs (template_analytics)
+            models.Index(fields=['template', '-sent_at', '-id'], name='emaillog_template_recent_idx'),
+        ]
+
     def __str__(self):
         return f"{self.recipient_email} - {self.status}"
-    
+
+
+class EmailTemplateStats(models.Model):
+    """
+    Running totals of EmailLog rows per template and target group.
+    Kept current by EmailLogBuffer (apps/core/campaigns.py) as logs are written,
+    so template_analytics reads a handful of rows instead of counting logs.
+    A template's counters are first built from a full count of its EmailLog
+    (on its first read or first new log, whichever comes first), so history
+    from before the counters existed is included; once a template has any
+    counter row, its counters are complete. Repair with `manage.py rebuild_email_stats`.
+    """
+    template = models.ForeignKey(EmailTemplate, on_delete=models.CASCADE, related_name='stats')
+    target_group = models.CharField(max_length=50)
+    total = models.PositiveIntegerField(default=0)
+    sent = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['template', 'target_group'], name='unique_template_stats_group'),
+        ]
+
+    def __str__(self):
+        return f"{self.template.name} / {self.target_group}: {self.sent}/{self.total}"
+
+    @classmethod
+    def apply_deltas(cls, deltas):
+        """
+        `deltas` maps (template_id, target_group) -> {'total': n, 'sent': n, 'failed': n}.
+        One UPDATE per group with F() expressions, creating the row the first time.
+        Call after the logs are written: templates without counters yet are
+        counted from EmailLog instead (see backfill()).
+        """
+        fresh = cls.backfill({template_id for template_id, _ in deltas})
+        for (template_id, target_group), delta in deltas.items():
+            if template_id in fresh or not any(delta.values()):
+                continue
+            cls.objects.get_or_create(template_id=template_id, target_group=target_group)
+            cls.objects.filter(template_id=template_id, target_group=target_group).update(
+                **{field: models.F(field) + n for field, n in delta.items() if n},
+                updated_at=timezone.now(),
+            )
+
+    @classmethod
+    def _lock_templates(cls, template_ids=None):
+        """
+        Locks the EmailTemplate rows (inside a transaction) so only one recount of a
+        template runs at a time, and a concurrent flush waits for it before deciding
+        whether its deltas still need applying.
+        """
+        templates = EmailTemplate.objects.select_for_update().order_by('id')
+        if template_ids is not None:
+            templates = templates.filter(id__in=template_ids)
+        return set(templates.values_list('id', flat=True))
+
+    @classmethod
+    def _recount(cls, template_ids):
+        """Replaces the counters of `template_ids` with a count of their EmailLog. Hold the lock."""
+        rows = EmailLog.objects.filter(template_id__in=template_ids).values('template_id', 'target_group').annotate(
+            total=models.Count('id'),
+            sent=models.Count('id', filter=models.Q(status='SENT')),
+            failed=models.Count('id', filter=models.Q(status='FAILED')),
+        )
+        cls.objects.filter(template_id__in=template_ids).delete()
+        cls.objects.bulk_create([cls(**row) for row in rows], batch_size=500)
+
+    @classmethod
+    def rebuild(cls, template_ids=None):
+        """Recounts from EmailLog (repair); all templates when `template_ids` is None."""
+        with transaction.atomic():
+            cls._recount(cls._lock_templates(template_ids))
+
+    @classmethod
+    def backfill(cls, template_ids):
+        """Builds counters for those of `template_ids` that have none yet. Returns their ids."""
+        def counted():
+            return set(cls.objects.filter(template_id__in=template_ids).values_list('template_id', flat=True).distinct())
+
+        if not set(template_ids) - counted():
+            return set()  # Common case: no lock needed
+        with transaction.atomic():
+            # Check again under the lock: a concurrent backfill may have just counted them
+            fresh = cls._lock_templates(set(template_ids) - counted()) - counted()
+            if fresh:
+                cls._recount(fresh)
+        return fresh
+
+
+class CampaignSendJob(models.Model):
+    """
+    One queued run of a template against a set of recipient groups.
+    Progress counters are updated by the background workers in apps/core/jobs.py.
+    The job id is the campaign-run id on EmailLog, so an interrupted run can be
+    resumed without re-emailing anyone already SENT.
+    """
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    template = models.ForeignKey(EmailTemplate, on_delete=models.CASCADE, related_name='send_jobs')
+    recipient_groups = models.JSONField(default=list, blank=True) # e.g. ['consumers', 'owners']
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='QUEUED')
+
+    total = models.PositiveIntegerField(default=0)
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0) # 1 + number of resumes
+    error_message = models.TextField(blank=True, null=True)
+
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.template.name} -> {self.recipient_groups} ({self.status})"
+
+    @property
+    def processed(self):
+        return self.sent_count + self.failed_count
+
+    @property
+    def queued(self):
+        return max(self.total - self.processed, 0)
+
+    @property
+    def throughput(self):
+        """Emails processed per second since the job started."""
+        if not self.started_at or not self.processed:
+            return 0.0
+        end = self.finished_at or timezone.now()
+        elapsed = (end - self.started_at).total_seconds()
+        return round(self.processed / elapsed, 2) if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self):
+        if self.status != 'RUNNING':
+            return 0 if self.status == 'COMPLETED' else None
+        rate = self.throughput
+        return int(self.queued / rate) if rate > 0 else None
+
+
+class PushTicket(models.Model):
+    """
+    Expo's answer for one push message (apps/core/push.py).
+    `ticket_id` is what Expo hands back for accepted messages; it is used later
+    to fetch the delivery receipt (`manage.py poll_push_receipts`).
+    """
+    STATUS_CHOICES = [
+        ('OK', 'Accepted'),
+        ('ERROR', 'Error'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='push_tickets')
+    token = models.CharField(max_length=255)
+    title = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    ticket_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    error = models.CharField(max_length=100, blank=True, null=True) # e.g. DeviceNotRegistered
+    error_message = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Filled in by receipt polling once Expo has handed the message to APNs/FCM
+    receipt_status = models.CharField(max_length=10, choices=STATUS_CHOICES, blank=True, null=True)
+    receipt_error = models.CharField(max_length=100, blank=True, null=True)
+    receipt_checked_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Tickets still waiting for a receipt
+            models.Index(fields=['status', 'receipt_status', 'created_at'], name='pushticket_receipt_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.token} - {self.status}"
+
 
 class ComponentStatus(models.TextChoices):
     OPERATIONAL = 'OPERATIONAL', 'Operational'
@@ -148,4 +348,21 @@ class AccessRevocationRequest(models.Model):
     resolved_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='resolved_revocations', blank=True)
 
     def __str__(self):
-        return f"Revoke {self.target_user.email} ({self.status})"
\ No newline at end of file
+        return f"Revoke {self.target_user.email} ({self.status})"
+
+class CommandCheckpoint(models.Model):
+    """
+    Where a long-running management command got to, so it can be resumed after
+    a crash or deploy instead of starting over (e.g. send_legacy_verification_backfill).
+    """
+    name = models.CharField(max_length=100, unique=True)
+    cursor = models.CharField(max_length=255, blank=True, default='') # last fully processed key
+    processed = models.PositiveIntegerField(default=0)
+    succeeded = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.cursor or 'start'}"
@@ -0,0 +1,93 @@
+# apps/core/pagination.py
+"""
+Keyset ("seek") pagination for large, append-mostly tables.
+
+OFFSET pagination makes the database walk and discard every skipped row, so
+deep pages get slower as a table grows. Here each page ends with an opaque
+cursor holding the ordering values of its last row; the next page asks for
+rows strictly after that tuple, which an index on the same columns answers
+directly. Ordering must end in a unique column (usually the primary key).
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _dump(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, uuid.UUID):
+        return {'uuid': str(value)}
+    return value
+
+
+def _load(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return parse_datetime(value['dt'])
+        if 'uuid' in value:
+            return uuid.UUID(value['uuid'])
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_dump(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return [_load(v) for v in json.loads(base64.urlsafe_b64decode(padded.encode()))]
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def _after(ordering, values):
+    """
+    Q for rows after `values` in `ordering`, e.g. for ['-sent_at', '-id']:
+    sent_at < a OR (sent_at = a AND id < b).
+    """
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{f"{name}__{lookup}": values[i]})
+        for prev_field, prev_value in zip(ordering[:i], values[:i]):
+            step &= Q(**{prev_field.lstrip('-'): prev_value})
+        condition |= step
+    return condition
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=50):
+    """
+    Returns (rows, next_cursor). `queryset` may be a values() queryset;
+    every field in `ordering` is fetched so the cursor can be built from the last row.
+    next_cursor is None on the last page.
+    """
+    ordering = list(ordering)
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(ordering):
+            raise InvalidCursor("Invalid cursor")
+        queryset = queryset.filter(_after(ordering, values))
+
+    # One extra row tells us whether there is a next page
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        get = last.get if isinstance(last, dict) else lambda name: getattr(last, name)
+        next_cursor = encode_cursor([get(f.lstrip('-')) for f in ordering])
+    return rows, next_cursor
@@ -0,0 +1,279 @@
+# apps/core/push.py
+"""
+Expo push dispatcher.
+
+`send_expo_push_notification()` (apps/core/utils.py) only puts a message on an
+in-process queue and returns. A single background thread drains the queue,
+groups up to EXPO_PUSH_BATCH_SIZE messages (Expo's limit is 100) into one
+POST to {EXPO_PUSH_API_URL}/send over a pooled keep-alive session, and stores
+one PushTicket per message with Expo's ticket id or error.
+
+Receipts: `poll_receipts()` (run by `manage.py poll_push_receipts`) asks
+{EXPO_PUSH_API_URL}/getReceipts about accepted tickets in bulk, stores the
+outcome on each ticket and clears tokens Expo reports as DeviceNotRegistered
+with one UPDATE, so uninstalled devices stop getting pushes.
+
+EXPO_PUSH_API_URL can point at a local fake server for testing.
+"""
+import atexit
+import queue
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import timedelta
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Q
+from django.utils import timezone
+from apps.accounts.models import User
+from .models import PushTicket
+
+PushMessage = namedtuple('PushMessage', ['user_id', 'token', 'title', 'body', 'data'])
+
+# Expo's limit for ids per getReceipts request
+RECEIPT_BATCH_SIZE = 1000
+DEAD_TOKEN_ERROR = 'DeviceNotRegistered'
+
+
+class PushDispatcher:
+    def __init__(self, api_url=None, batch_size=None, linger=None, timeout=None):
+        self.api_url = (api_url or getattr(settings, 'EXPO_PUSH_API_URL', 'https://exp.host/--/api/v2/push')).rstrip('/')
+        self.batch_size = min(batch_size or getattr(settings, 'EXPO_PUSH_BATCH_SIZE', 100), 100)
+        # How long the worker waits for more messages to share a request
+        self.linger = linger if linger is not None else getattr(settings, 'EXPO_PUSH_LINGER', 0.5)
+        self.timeout = timeout or getattr(settings, 'EXPO_PUSH_TIMEOUT', 10)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+            session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+            session.headers.update({
+                'accept': 'application/json',
+                'accept-encoding': 'gzip, deflate',
+                'content-type': 'application/json',
+            })
+            access_token = getattr(settings, 'EXPO_ACCESS_TOKEN', None)
+            if access_token:
+                session.headers['Authorization'] = f"Bearer {access_token}"
+            self._session = session
+        return self._session
+
+    def enqueue(self, message):
+        self._ensure_worker()
+        self._queue.put(message)
+
+    def _ensure_worker(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='expo-push', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._send_batch(batch)
+
+    def flush(self):
+        """Sends whatever is still queued from the calling thread (shutdown, tests, commands)."""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._send_batch(batch)
+
+    def post_batch(self, batch):
+        """
+        One Expo request for up to batch_size messages.
+        Returns one (status, ticket_id, error, error_message) per message, in order.
+        """
+        payload = [
+            {'to': m.token, 'title': m.title, 'body': m.body, 'sound': 'default', 'data': m.data or {}}
+            for m in batch
+        ]
+        try:
+            response = self.session.post(f"{self.api_url}/send", json=payload, timeout=self.timeout)
+            body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            return [('ERROR', None, 'RequestFailed', str(e)[:300])] * len(batch)
+
+        if response.status_code >= 300 or body.get('errors'):
+            error = str(body.get('errors') or response.text)[:300]
+            return [('ERROR', None, 'RequestFailed', f"Expo returned {response.status_code}: {error}")] * len(batch)
+
+        results = []
+        tickets = body.get('data') or []
+        for i in range(len(batch)):
+            ticket = tickets[i] if i < len(tickets) else {}
+            if ticket.get('status') == 'ok':
+                results.append(('OK', ticket.get('id'), None, None))
+            else:
+                details = ticket.get('details') or {}
+                results.append(('ERROR', None, details.get('error') or 'Unknown', ticket.get('message')))
+        return results
+
+    def fetch_receipts(self, ticket_ids):
+        """
+        One getReceipts request. Returns {ticket_id: (status, error)} for the ids
+        Expo has a receipt for; ids without one yet are left out.
+        Raises requests.RequestException / ValueError if the request failed.
+        """
+        with self._send_lock:
+            response = self.session.post(
+                f"{self.api_url}/getReceipts", json={'ids': list(ticket_ids)}, timeout=self.timeout
+            )
+        response.raise_for_status()
+        receipts = {}
+        for ticket_id, receipt in (response.json().get('data') or {}).items():
+            if receipt.get('status') == 'ok':
+                receipts[ticket_id] = ('OK', None)
+            else:
+                details = receipt.get('details') or {}
+                receipts[ticket_id] = ('ERROR', details.get('error') or 'Unknown')
+        return receipts
+
+    def _send_batch(self, batch):
+        try:
+            # The session is shared; keep requests from the worker and flush() apart
+            with self._send_lock:
+                results = self.post_batch(batch)
+            PushTicket.objects.bulk_create([
+                PushTicket(
+                    user_id=m.user_id, token=m.token, title=(m.title or '')[:255],
+                    status=status_code, ticket_id=ticket_id, error=error, error_message=error_message
+                )
+                for m, (status_code, ticket_id, error, error_message) in zip(batch, results)
+            ])
+            ok = sum(1 for r in results if r[0] == 'OK')
+            print(f"📲 [Push] Sent batch of {len(batch)}: {ok} accepted, {len(batch) - ok} errors.")
+        except Exception as e:
+            # Never let the worker thread die on a bad batch
+            print(f"Push notification batch failed: {e}")
+        finally:
+            close_old_connections()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def prune_dead_tokens(tokens):
+    """Clears every user holding one of `tokens` with a single UPDATE. Returns rows changed."""
+    tokens = set(t for t in tokens if t)
+    if not tokens:
+        return 0
+    return User.objects.filter(expo_push_token__in=tokens).update(expo_push_token=None)
+
+
+def poll_receipts(min_age_minutes=15, max_age_hours=24, dispatcher=None):
+    """
+    Fetches receipts for accepted tickets between `min_age_minutes` (Expo needs
+    a little time to hand off) and `max_age_hours` old (Expo drops receipts
+    after a day), RECEIPT_BATCH_SIZE ids per request.
+    Tokens reported DeviceNotRegistered, at send time or in a receipt, are pruned.
+    Returns a summary dict.
+    """
+    dispatcher = dispatcher or get_push_dispatcher()
+    now = timezone.now()
+    window = Q(created_at__gte=now - timedelta(hours=max_age_hours), created_at__lte=now - timedelta(minutes=min_age_minutes))
+    summary = {'checked': 0, 'ok': 0, 'errors': 0, 'pending': 0, 'request_failures': 0, 'tokens_pruned': 0}
+    dead_tokens = set(
+        PushTicket.objects.filter(window, status='ERROR', error=DEAD_TOKEN_ERROR).values_list('token', flat=True)
+    )
+
+    waiting = (
+        PushTicket.objects.filter(window, status='OK', receipt_status__isnull=True)
+        .exclude(ticket_id__isnull=True)
+        .order_by('created_at')
+        .values_list('id', 'ticket_id', 'token')
+        .iterator(chunk_size=RECEIPT_BATCH_SIZE)
+    )
+    batch = []
+
+    def check(batch):
+        try:
+            receipts = dispatcher.fetch_receipts([ticket_id for _, ticket_id, _ in batch])
+        except (requests.RequestException, ValueError) as e:
+            print(f"Push receipt request failed: {e}")
+            summary['request_failures'] += 1
+            return
+        checked_at = timezone.now()
+        updates = []
+        for pk, ticket_id, token in batch:
+            if ticket_id not in receipts:
+                summary['pending'] += 1
+                continue
+            status_code, error = receipts[ticket_id]
+            updates.append(PushTicket(pk=pk, receipt_status=status_code, receipt_error=error, receipt_checked_at=checked_at))
+            summary['ok' if status_code == 'OK' else 'errors'] += 1
+            if error == DEAD_TOKEN_ERROR:
+                dead_tokens.add(token)
+        PushTicket.objects.bulk_update(updates, ['receipt_status', 'receipt_error', 'receipt_checked_at'], batch_size=500)
+        summary['checked'] += len(updates)
+
+    for row in waiting:
+        batch.append(row)
+        if len(batch) >= RECEIPT_BATCH_SIZE:
+            check(batch)
+            batch = []
+    if batch:
+        check(batch)
+
+    summary['tokens_pruned'] = prune_dead_tokens(dead_tokens)
+    return summary
+
+
+def push_delivery_stats(since=None):
+    """Ticket and receipt outcomes (with rates) for tickets created since `since`."""
+    tickets = PushTicket.objects.all()
+    if since:
+        tickets = tickets.filter(created_at__gte=since)
+    totals = tickets.aggregate(
+        total=Count('id'),
+        accepted=Count('id', filter=Q(status='OK')),
+        rejected=Count('id', filter=Q(status='ERROR')),
+        delivered=Count('id', filter=Q(receipt_status='OK')),
+        failed=Count('id', filter=Q(receipt_status='ERROR')),
+    )
+    errors = Counter()
+    for field in ('error', 'receipt_error'):
+        for row in tickets.exclude(**{f"{field}__isnull": True}).values(field).annotate(n=Count('id')):
+            errors[row[field]] += row['n']
+
+    resolved = totals['delivered'] + totals['failed']
+    totals['awaiting_receipt'] = totals['accepted'] - resolved
+    totals['delivery_rate'] = round(totals['delivered'] / resolved * 100, 1) if resolved else None
+    totals['error_rate'] = round((totals['rejected'] + totals['failed']) / totals['total'] * 100, 1) if totals['total'] else 0
+    totals['errors_by_type'] = dict(errors.most_common())
+    return totals
+
+
+def get_push_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = PushDispatcher()
+            atexit.register(_dispatcher.flush)
+        return _dispatcher
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Province, Campaign, EmailTemplate, SystemComponent, SystemIncident, AccessLog, AccessRevocationRequest
+from .models import Province, Campaign, EmailTemplate, CampaignSendJob, SystemComponent, SystemIncident, AccessLog, AccessRevocationRequest
 
 class SystemComponentSerializer(serializers.ModelSerializer):
     status_label = serializers.CharField(source='get_status_display', read_only=True)
@@ -44,4 +44,19 @@ class AccessRevocationRequestSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = AccessRevocationRequest
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class CampaignSendJobSerializer(serializers.ModelSerializer):
+    template_name = serializers.CharField(source='template.name', read_only=True)
+    queued = serializers.IntegerField(read_only=True)
+    throughput = serializers.FloatField(read_only=True) # emails / second
+    eta_seconds = serializers.IntegerField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = CampaignSendJob
+        fields = [
+            'id', 'template', 'template_name', 'recipient_groups', 'status',
+            'total', 'queued', 'sent_count', 'failed_count', 'throughput', 'eta_seconds',
+            'attempts', 'error_message', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = fields
@@ -0,0 +1,290 @@
+import json
+import threading
+from datetime import timedelta
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core import mail
+from asgiref.sync import sync_to_async
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from apps.accounts.models import User
+from apps.core import mail_dispatch
+from apps.core.brevo import BatchRecipient, BrevoBatchError, BrevoBatchTransport
+from apps.core.models import Province, PushTicket
+from apps.core.push import PushDispatcher, PushMessage, poll_receipts
+from apps.core.utils import send_batch_email_with_fallback
+from apps.shops.models import SpazaShop
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+class FakeServer:
+    """
+    Local HTTP stand-in for a JSON API. `respond(path, body)` returns
+    (status, body); every request is kept in `requests` as (path, body).
+    """
+
+    def __init__(self, respond):
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['content-length'])))
+                fake.requests.append((self.path, body))
+                status, reply = respond(self.path, body)
+                out = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header('content-type', 'application/json')
+                self.send_header('content-length', str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@override_settings(BREVO_BATCH_SEND=True, ANYMAIL={'BREVO_API_KEY': 'test-key'},
+                   USE_CONSOLE_ON_FAIL=False, FORCE_EMAIL_FALLBACK=False)
+class BatchEmailTests(TestCase):
+    """send_batch_email_with_fallback against a fake Brevo API."""
+
+    def setUp(self):
+        self.status = 201
+        self.brevo = FakeServer(self.brevo_reply)
+        self.addCleanup(self.brevo.stop)
+        override = override_settings(BREVO_API_URL=f"{self.brevo.url}/v3")
+        override.enable()
+        self.addCleanup(override.disable)
+        mail_dispatch._dispatcher = None  # Fresh breaker for every test
+
+    def brevo_reply(self, path, body):
+        if self.status >= 300:
+            return self.status, {'code': 'error', 'message': 'fake failure'}
+        return self.status, {'messageIds': [f"<m{i}@fake>" for i, _ in enumerate(body['messageVersions'])]}
+
+    def recipients(self):
+        return [
+            BatchRecipient('ann@example.com', 'Ann', {'NAME': 'Ann <3'}),
+            BatchRecipient('bob@example.com', '', {'NAME': 'Bob'}),
+            BatchRecipient('', 'Nobody', {'NAME': 'Nobody'}),  # No address: skipped
+        ]
+
+    def test_batch_payload_maps_recipients(self):
+        sent = send_batch_email_with_fallback(
+            "Hello {{ you }}", self.recipients(), backup_body="Hi {{ params.NAME }}, {{ not_a_param }}",
+        )
+
+        self.assertEqual(sent, 2)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(len(self.brevo.requests), 1)
+        path, payload = self.brevo.requests[0]
+        self.assertEqual(path, '/v3/smtp/email')
+        # Only {{ params.X }} stays a live tag; other braces are quoted
+        self.assertEqual(payload['subject'], "Hello {\u200b{ you }}")
+        self.assertEqual(payload['textContent'], "Hi {{ params.NAME }}, {\u200b{ not_a_param }}")
+        self.assertIn('{{ params.NAME_HTML }}', payload['htmlContent'])
+        self.assertNotIn('{{ not_a_param', payload['htmlContent'])
+        self.assertEqual(payload['messageVersions'], [
+            {'to': [{'email': 'ann@example.com', 'name': 'Ann'}],
+             'params': {'NAME': 'Ann <3', 'NAME_HTML': 'Ann &lt;3'}},
+            {'to': [{'email': 'bob@example.com'}], 'params': {'NAME': 'Bob', 'NAME_HTML': 'Bob'}},
+        ])
+
+    def test_template_batch_sends_template_id(self):
+        sent = send_batch_email_with_fallback("Verify", self.recipients()[:2], template_id=7)
+
+        self.assertEqual(sent, 2)
+        payload = self.brevo.requests[0][1]
+        self.assertEqual(payload['templateId'], 7)
+        self.assertNotIn('htmlContent', payload)
+        self.assertEqual(payload['messageVersions'][0]['params'], {'NAME': 'Ann <3'})
+
+    @override_settings(BREVO_BATCH_SIZE=1)
+    def test_one_request_per_chunk(self):
+        send_batch_email_with_fallback("Hi", self.recipients(), backup_body="Hi {{ params.NAME }}")
+
+        self.assertEqual([len(body['messageVersions']) for _, body in self.brevo.requests], [1, 1])
+
+    def test_failed_batch_falls_back_per_recipient(self):
+        self.status = 503
+
+        sent = send_batch_email_with_fallback("Hi", self.recipients(), backup_body="Hi {{ params.NAME }}")
+
+        self.assertEqual(sent, 2)
+        # Each recipient got their own message, with the params filled in locally
+        self.assertEqual(sorted((m.to[0], m.body) for m in mail.outbox), [
+            ('ann@example.com', 'Hi Ann <3'),
+            ('bob@example.com', 'Hi Bob'),
+        ])
+        self.assertEqual(mail_dispatch.get_dispatcher().stats['brevo'].snapshot()['failed'], 1)
+
+    def post_batches(self, count):
+        """`count` batch requests straight through the breaker; returns the errors raised."""
+        transport = BrevoBatchTransport()
+        payload = transport.build_payload(subject="Hi", html_content="<p>Hi</p>")
+        errors = []
+        for _ in range(count):
+            try:
+                mail_dispatch.get_dispatcher().call_primary(transport.post_chunk, payload, self.recipients()[:1])
+            except Exception as e:
+                errors.append(e)
+        return errors
+
+    def test_rejected_batch_does_not_open_the_breaker(self):
+        self.status = 400
+        threshold = mail_dispatch.get_dispatcher().breaker.failure_threshold
+
+        errors = self.post_batches(threshold + 1)
+
+        self.assertTrue(all(isinstance(e, BrevoBatchError) for e in errors))
+        self.assertEqual(mail_dispatch.get_dispatcher().breaker.state, 'CLOSED')
+        self.assertEqual(len(self.brevo.requests), threshold + 1)
+
+    def test_outage_opens_the_breaker(self):
+        self.status = 503
+        threshold = mail_dispatch.get_dispatcher().breaker.failure_threshold
+
+        errors = self.post_batches(threshold + 1)
+
+        self.assertEqual(mail_dispatch.get_dispatcher().breaker.state, 'OPEN')
+        # The last call skipped Brevo without a request
+        self.assertEqual(len(self.brevo.requests), threshold)
+        self.assertIsInstance(errors[-1], mail_dispatch.ProviderUnavailable)
+
+
+class PushReceiptTests(TestCase):
+    """Expo push tickets and receipt polling against a fake Expo API."""
+
+    def setUp(self):
+        self.receipts = {}
+        self.expo = FakeServer(self.expo_reply)
+        self.addCleanup(self.expo.stop)
+        self.dispatcher = PushDispatcher(api_url=self.expo.url)
+
+    def expo_reply(self, path, body):
+        if path == '/getReceipts':
+            return 200, {'data': {i: self.receipts[i] for i in body['ids'] if i in self.receipts}}
+        tickets = []
+        for message in body:
+            if message['to'].endswith('gone]'):
+                tickets.append({'status': 'error', 'message': 'not registered',
+                                'details': {'error': 'DeviceNotRegistered'}})
+            else:
+                tickets.append({'status': 'ok', 'id': f"ticket-{message['to']}"})
+        return 200, {'data': tickets}
+
+    def user(self, name):
+        return User.objects.create_user(
+            username=name, email=f"{name}@example.com", expo_push_token=f"ExponentPushToken[{name}]",
+        )
+
+    def ticket(self, user, ticket_id=None, status='OK', error=None, age=timedelta(minutes=30)):
+        ticket = PushTicket.objects.create(
+            user=user, token=user.expo_push_token, status=status, ticket_id=ticket_id, error=error,
+        )
+        PushTicket.objects.filter(pk=ticket.pk).update(created_at=timezone.now() - age)
+        return ticket
+
+    def test_post_batch_maps_tickets_in_order(self):
+        batch = [
+            PushMessage(1, 'ExponentPushToken[a]', 'Hi', 'Body', None),
+            PushMessage(2, 'ExponentPushToken[gone]', 'Hi', 'Body', {'doc': 3}),
+        ]
+
+        results = self.dispatcher.post_batch(batch)
+
+        self.assertEqual(results, [
+            ('OK', 'ticket-ExponentPushToken[a]', None, None),
+            ('ERROR', None, 'DeviceNotRegistered', 'not registered'),
+        ])
+        path, payload = self.expo.requests[0]
+        self.assertEqual(path, '/send')
+        self.assertEqual(payload[1]['data'], {'doc': 3})
+
+    def test_receipts_are_stored_and_dead_tokens_pruned(self):
+        ok, gone, waiting, rejected = self.user('ok'), self.user('gone'), self.user('waiting'), self.user('rejected')
+        delivered = self.ticket(ok, 't-ok')
+        failed = self.ticket(gone, 't-gone')
+        pending = self.ticket(waiting, 't-waiting')
+        self.ticket(rejected, status='ERROR', error='DeviceNotRegistered')  # Refused at send time
+        self.receipts = {
+            't-ok': {'status': 'ok'},
+            't-gone': {'status': 'error', 'details': {'error': 'DeviceNotRegistered'}},
+        }
+
+        summary = poll_receipts(dispatcher=self.dispatcher)
+
+        self.assertEqual(summary['checked'], 2)
+        self.assertEqual(summary['ok'], 1)
+        self.assertEqual(summary['errors'], 1)
+        self.assertEqual(summary['pending'], 1)
+        self.assertEqual(summary['tokens_pruned'], 2)
+        delivered.refresh_from_db()
+        failed.refresh_from_db()
+        pending.refresh_from_db()
+        self.assertEqual(delivered.receipt_status, 'OK')
+        self.assertEqual((failed.receipt_status, failed.receipt_error), ('ERROR', 'DeviceNotRegistered'))
+        self.assertIsNone(pending.receipt_status)
+        tokens = dict(User.objects.values_list('username', 'expo_push_token'))
+        self.assertEqual(tokens, {
+            'ok': 'ExponentPushToken[ok]', 'gone': None,
+            'waiting': 'ExponentPushToken[waiting]', 'rejected': None,
+        })
+
+    def test_only_tickets_in_the_receipt_window_are_polled(self):
+        user = self.user('u')
+        self.ticket(user, 't-new', age=timedelta(minutes=1))  # Expo may not have a receipt yet
+        self.ticket(user, 't-old', age=timedelta(hours=30))  # Expo has dropped the receipt
+        self.ticket(user, 't-due')
+
+        poll_receipts(dispatcher=self.dispatcher)
+
+        self.assertEqual([body['ids'] for _, body in self.expo.requests], [['t-due']])
+
+    def test_receipts_are_requested_in_batches(self):
+        user = self.user('u')
+        for i in range(5):
+            self.ticket(user, f"t-{i}")
+        self.receipts = {f"t-{i}": {'status': 'ok'} for i in range(5)}
+
+        with mock.patch('apps.core.push.RECEIPT_BATCH_SIZE', 2):
+            summary = poll_receipts(dispatcher=self.dispatcher)
+
+        self.assertEqual([len(body['ids']) for _, body in self.expo.requests], [2, 2, 1])
+        self.assertEqual(summary['ok'], 5)
+
+
+@override_settings(CSV_EXPORT_CHUNK_SIZE=2)
+class CsvExportTests(TestCase):
+    """stream_csv under the ASGI handler (how the app is deployed)."""
+
+    def setUp(self):
+        province = Province.objects.create(name='Gauteng')
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', role='ADMIN', is_staff=True)
+        owner = User.objects.create_user(username='owner', email='owner@example.com', first_name='Ann', last_name='Owner')
+        for i in range(5):
+            SpazaShop.objects.create(owner=owner, province=province, name=f"Shop {i}")
+
+    async def test_export_streams_chunks_asynchronously(self):
+        token = await sync_to_async(lambda: str(AccessToken.for_user(self.admin)))()
+
+        response = await self.async_client.get('/api/shops/export_csv/', headers={'authorization': f"Bearer {token}"})
+
+        self.assertEqual(response.status_code, 200)
+        # An async body is sent chunk by chunk; a sync one would be read into a list first
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        lines = b''.join(chunks).decode().splitlines()
+        self.assertEqual(lines[0], 'ID,Shop Name,Owner,Email,Address,Province,Verified')
+        self.assertEqual(len(lines), 6)
+        self.assertIn('Ann Owner,owner@example.com', lines[1])
+        # Header, then one chunk per CSV_EXPORT_CHUNK_SIZE rows
+        self.assertEqual(len(chunks), 4)
@@ -1,14 +1,13 @@
 # apps/core/utils.py
-import requests
-import json
 import logging
-import socket
-from django.core.mail import EmailMessage, get_connection
+from django.core.mail import EmailMessage
 from django.conf import settings
-from requests.exceptions import ReadTimeout, ConnectionError
 from PIL import Image
 from io import BytesIO
 from django.core.files.base import ContentFile
+from .brevo import BrevoBatchTransport, batch_bodies, html_params, render_params
+from .mail_dispatch import get_dispatcher
+from .push import PushMessage, get_push_dispatcher
 
 
 def resize_image_to_square(
@@ -50,7 +49,9 @@ logger = logging.getLogger(__name__)
 
 def send_expo_push_notification(user, title, body, data=None):
     """
-    Sends a push notification to the user's stored Expo Push Token.
+    Queues a push notification to the user's stored Expo Push Token.
+    Returns straight away; apps/core/push.py sends it in a batch and records
+    the result as a PushTicket.
     """
     token = getattr(user, 'expo_push_token', None)
     
@@ -63,27 +64,13 @@ def send_expo_push_notification(user, title, body, data=None):
         print(f"Invalid Expo Token for {user.email}")
         return
 
-    url = "https://exp.host/--/api/v2/push/send"
-    headers = {
-        "host": "exp.host",
-        "accept": "application/json",
-        "accept-encoding": "gzip, deflate",
-        "content-type": "application/json"
-    }
-    
-    payload = {
-        "to": token,
-        "title": title,
-        "body": body,
-        "sound": "default",
-        "data": data or {} # Extra data (like ticket ID) to handle taps later
-    }
-
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(payload))
-        print(f"Push sent to {user.email}: {response.status_code}")
-    except Exception as e:
-        print(f"Push notification failed: {e}")
+    get_push_dispatcher().enqueue(PushMessage(
+        user_id=user.pk,
+        token=token,
+        title=title,
+        body=body,
+        data=data or {} # Extra data (like ticket ID) to handle taps later
+    ))
 
 def send_email_with_fallback(subject, recipient_list, template_id=None, context_data=None, backup_body=None):
     """
@@ -91,82 +78,83 @@ def send_email_with_fallback(subject, recipient_list, template_id=None, context_
     If it fails due to timeout/connection issues, it falls back to:
     1. Console Logs (if USE_CONSOLE_ON_FAIL is True) - Allows Admin to see OTPs in Render logs.
     2. Backup SMTP (if configured) - e.g., a Gmail account.
+    While Brevo is known to be down, the circuit breaker in apps/core/mail_dispatch.py
+    skips it straight away instead of waiting for another timeout.
     """
     if context_data is None:
         context_data = {}
 
-    # 1. Try Primary Provider (Brevo)
-    try:
-        print(f"📧 [Email] Attempting to send '{subject}' via Brevo...")
-        msg = EmailMessage(
-            subject=subject, 
-            to=recipient_list,
-            from_email=settings.DEFAULT_FROM_EMAIL
-        )
-        if template_id:
-            msg.template_id = template_id
-            msg.merge_global_data = context_data
-        elif backup_body:
-             msg.body = backup_body
-        
-        msg.send()
-        print("✅ [Email] Sent successfully via Brevo.")
+    # 1. Primary message (Brevo)
+    msg = EmailMessage(
+        subject=subject, 
+        to=recipient_list,
+        from_email=settings.DEFAULT_FROM_EMAIL
+    )
+    if template_id:
+        msg.template_id = template_id
+        msg.merge_global_data = context_data
+    elif backup_body:
+         msg.body = backup_body
+
+    # 2. Backup content (plain text version of the template data)
+    if not backup_body:
+        backup_body = f"Subject: {subject}\n\n"
+        for key, value in context_data.items():
+            backup_body += f"{key}: {value}\n"
+        backup_body += "\n(Sent via System Backup)"
+    fallback = EmailMessage(subject=subject, body=backup_body, to=recipient_list)
+
+    print(f"📧 [Email] Attempting to send '{subject}' via Brevo...")
+    result = get_dispatcher().send(msg, fallback=fallback)
+
+    if result.status == 'SENT':
+        print(f"✅ [Email] Sent successfully via {result.provider}.")
         return True
+    print(f"❌ [Email] All providers failed: {result.error}")
+    return False
+
 
-    except (ReadTimeout, ConnectionError, socket.timeout, Exception) as e:
-        print(f"❌ [Email] Brevo Failed: {e}")
-        print("🔄 [Email] Switching to Fallback mechanism...")
-
-        # Construct backup content
-        if not backup_body:
-            backup_body = f"Subject: {subject}\n\n"
-            for key, value in context_data.items():
-                backup_body += f"{key}: {value}\n"
-            backup_body += "\n(Sent via System Backup)"
-
-        # 2. Check settings for Fallback Strategy
-        use_console = getattr(settings, 'USE_CONSOLE_ON_FAIL', False)
-        
-        if use_console:
-            # OPTION A: Print to Server Logs (Reliable for Dev/Admins)
-            print("\n" + "="*50)
-            print(f"⚠️  FALLBACK EMAIL LOG (Provider Down)  ⚠️")
-            print(f"To: {recipient_list}")
-            print(f"Subject: {subject}")
-            print("-" * 20)
-            print(backup_body)
-            print("="*50 + "\n")
-            return True
+def send_batch_email_with_fallback(subject, recipients, template_id=None, backup_body=None):
+    """
+    Same delivery guarantees as send_email_with_fallback, for many recipients.
+    `recipients` is a list of BatchRecipient(email, name, params); the body (or Brevo
+    template) can use {{ params.X }} merge tags; the rest of the body is sent as literal
+    text (HTML-escaped in the HTML part). Everything goes out as Brevo batch
+    requests, and only recipients whose batch failed are retried one by one
+    through send_email_with_fallback. Returns the number of recipients sent.
+    """
+    recipients = [r for r in recipients if r.email]
+    if not recipients:
+        return 0
+
+    retry = recipients
+    if BrevoBatchTransport.is_configured():
+        print(f"📧 [Email] Sending '{subject}' to {len(recipients)} recipients via Brevo batch...")
+        transport = BrevoBatchTransport()
+        if template_id:
+            payload = transport.build_payload(subject=subject, template_id=template_id)
+            batch = recipients
         else:
-            # OPTION B: Use Backup SMTP (e.g. Gmail)
+            # Brevo's batch endpoint needs htmlContent; a text-only payload is a 400
+            text_content, html_content = batch_bodies(backup_body or '')
+            payload = transport.build_payload(subject=subject, html_content=html_content, text_content=text_content)
+            batch = [r._replace(params=html_params(r.params)) for r in recipients]
+        retry = []
+        for chunk, originals in zip(transport.chunks(batch), transport.chunks(recipients)):
             try:
-                # Ensure these are set in settings.py or environment variables
-                backup_user = getattr(settings, 'EMAIL_BACKUP_USER', None)
-                backup_password = getattr(settings, 'EMAIL_BACKUP_PASSWORD', None)
-
-                if not backup_user or not backup_password:
-                    print("❌ [Email] No backup SMTP credentials found. Cannot send fallback email.")
-                    return False
-
-                backup_conn = get_connection(
-                    host='smtp.gmail.com', 
-                    port=587, 
-                    username=backup_user, 
-                    password=backup_password, 
-                    use_tls=True
-                )
-                
-                msg = EmailMessage(
-                    subject=f"[Backup] {subject}",
-                    body=backup_body,
-                    from_email=backup_user,
-                    to=recipient_list,
-                    connection=backup_conn
-                )
-                msg.send()
-                print("✅ [Email] Sent via Backup SMTP (Gmail).")
-                return True
-
-            except Exception as backup_error:
-                print(f"❌ [Email] Backup SMTP Failed: {backup_error}")
-                return False
\ No newline at end of file
+                get_dispatcher().call_primary(transport.post_chunk, payload, chunk)
+            except Exception as e:
+                print(f"❌ [Email] Brevo batch failed: {e}")
+                retry.extend(originals)
+
+    sent = len(recipients) - len(retry)
+    for r in retry:
+        if send_email_with_fallback(
+            subject,
+            [r.email],
+            template_id=template_id,
+            context_data=r.params,
+            backup_body=render_params(backup_body, r.params or {}),
+        ):
+            sent += 1
+    return sent
@@ -31,7 +31,8 @@ import io
 from apps.core.google_calendar import create_google_meet_event
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from django.contrib.auth import get_user_model
-from apps.core.utils import send_email_with_fallback, resize_image_to_square
+from apps.core.utils import send_email_with_fallback, send_batch_email_with_fallback, resize_image_to_square
+from apps.core.brevo import BatchRecipient
 from django.core.files.storage import default_storage
 import uuid
 
@@ -430,21 +431,27 @@ class JobApplicationViewSet(viewsets.ModelViewSet):
             
         apps_to_update = JobApplication.objects.filter(id__in=ids)
         
-        # ✅ Rejection Email Logic
+        # ✅ Rejection Email Logic (one batch per role instead of one request per applicant)
         if new_status == 'REJECTED':
-            for app in apps_to_update:
-                if app.status != 'REJECTED': 
-                    body = f"""Dear {app.first_name},
-                        Thank you for your interest in the {app.hiring_request.role_title} position at Spazaafy.
-                        We regret to inform you that we will not be proceeding with your application at this time.
-                        Regards, Spazaafy HR Team"""
-                    
-                    send_email_with_fallback(
-                        subject=f"Update on your application: {app.hiring_request.role_title}",
-                        recipient_list=[app.email],
-                        backup_body=body
+            by_role = {}
+            for app in apps_to_update.select_related('hiring_request'):
+                if app.status != 'REJECTED':
+                    by_role.setdefault(app.hiring_request.role_title, []).append(
+                        BatchRecipient(app.email, app.first_name, {'NAME': app.first_name})
                     )
 
+            for role_title, recipients in by_role.items():
+                body = f"""Dear {{{{ params.NAME }}}},
+                    Thank you for your interest in the {role_title} position at Spazaafy.
+                    We regret to inform you that we will not be proceeding with your application at this time.
+                    Regards, Spazaafy HR Team"""
+
+                send_batch_email_with_fallback(
+                    subject=f"Update on your application: {role_title}",
+                    recipients=recipients,
+                    backup_body=body
+                )
+
         apps_to_update.update(status=new_status)
         return Response({'detail': f'Updated {len(ids)} applications.'})
 
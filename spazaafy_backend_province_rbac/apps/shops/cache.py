@@ -0,0 +1,21 @@
+# apps/shops/cache.py
+"""
+Cached serialised responses for the public (verified shops) list/retrieve.
+Invalidated from the SpazaShop and User signals in models.py.
+"""
+from django.conf import settings
+from apps.core.cache import build_cache
+
+shop_cache = build_cache(
+    'shops',
+    backend=getattr(settings, 'SHOP_CACHE_BACKEND', 'local'),
+    timeout=getattr(settings, 'SHOP_CACHE_TTL', 300),
+    max_entries=getattr(settings, 'SHOP_CACHE_MAX_ENTRIES', 512),
+)
+
+# Owner fields that appear in SpazaShopSerializer output
+OWNER_FIELDS = {'first_name', 'last_name', 'phone', 'email'}
+
+
+def shop_group(shop_id):
+    return f"shop:{shop_id}"
@@ -0,0 +1,136 @@
+# apps/shops/clusters.py
+"""
+Server-side map clustering for `SpazaShopViewSet.clusters`.
+
+The world is cut into square lat/lng tiles of 360 / 2**zoom degrees (the same
+count per zoom level as map tiles), and each tile into CLUSTER_GRID x
+CLUSTER_GRID cells. The tiles a request is missing from the cache are
+computed together: one GROUP BY over the box they span, filtered through an
+index (`location && box` on PostGIS, `geocell IN (...)` otherwise), returns
+per non-empty cell the shop count, centroid and how many are verified, and
+the rows are split back into per-tile cache entries.
+
+Tiles are cached per (scope, zoom, x, y) in a generation group of a
+ReadThroughCache (apps/core/cache.py); any shop save/delete invalidates the
+group, so a zoomed-out province view is served from a handful of cached
+tiles. With the default per-process cache an invalidation only reaches the
+worker that handled the save (the others catch up at SHOP_CLUSTER_CACHE_TTL);
+set SHOP_CLUSTER_CACHE_BACKEND to a shared CACHES alias to invalidate all.
+"""
+import math
+from django.conf import settings
+from django.db.models import Avg, Count, F, FloatField, Func, IntegerField, Min, Q
+from django.db.models.functions import Floor
+from apps.core.cache import build_cache
+from .geo import geocells_for_box
+from .models import USE_GIS
+
+CLUSTER_GRID = 8
+MAX_ZOOM = 20
+# Requests may not span more tiles than this (keeps one query's GROUP BY bounded)
+MAX_TILES_PER_REQUEST = 64
+TILES_GROUP = 'tiles'
+
+cluster_cache = build_cache(
+    'shops:clusters',
+    backend=getattr(settings, 'SHOP_CLUSTER_CACHE_BACKEND', getattr(settings, 'SHOP_CACHE_BACKEND', 'local')),
+    timeout=getattr(settings, 'SHOP_CLUSTER_CACHE_TTL', 600),
+    max_entries=getattr(settings, 'SHOP_CLUSTER_CACHE_MAX_ENTRIES', 2048),
+)
+
+
+def tile_degrees(zoom):
+    return 360.0 / (2 ** zoom)
+
+
+def tiles_for_bbox(min_lng, min_lat, max_lng, max_lat, zoom):
+    """(x, y) of every tile the box touches."""
+    size = tile_degrees(zoom)
+    x0, x1 = math.floor((min_lng + 180) / size), math.floor((max_lng + 180) / size)
+    y0, y1 = math.floor((min_lat + 90) / size), math.floor((max_lat + 90) / size)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def invalidate_clusters():
+    """Called from SpazaShop save/delete signals; every cached tile stops being read."""
+    cluster_cache.invalidate(TILES_GROUP)
+
+
+def _coordinate_expressions():
+    if USE_GIS:
+        return (
+            Func(F('location'), function='ST_Y', output_field=FloatField()),
+            Func(F('location'), function='ST_X', output_field=FloatField()),
+        )
+    return F('latitude'), F('longitude')
+
+
+def _box_filter(min_lng, min_lat, max_lng, max_lat):
+    """Index-backed prefilter for shops in the box (the exact bounds are applied on top)."""
+    if USE_GIS:
+        from django.contrib.gis.geos import Polygon
+        box = Polygon.from_bbox((min_lng, min_lat, max_lng, max_lat))
+        box.srid = 4326
+        return Q(location__bboverlaps=box)
+    cells = geocells_for_box(min_lat, max_lat, min_lng, max_lng)
+    return Q(geocell__in=cells) if cells is not None else Q()
+
+
+def compute_tiles(qs, zoom, tiles):
+    """{(x, y): [{lat, lng, count, verified_ratio, shop_id?}]} for `tiles`, from one query."""
+    size = tile_degrees(zoom)
+    cell = size / CLUSTER_GRID
+    xs, ys = [x for x, _ in tiles], [y for _, y in tiles]
+    min_lng, max_lng = min(xs) * size - 180, (max(xs) + 1) * size - 180
+    min_lat, max_lat = min(ys) * size - 90, (max(ys) + 1) * size - 90
+    lat, lng = _coordinate_expressions()
+
+    rows = (
+        qs.filter(_box_filter(min_lng, min_lat, max_lng, max_lat))
+        .annotate(lat=lat, lng=lng)
+        .filter(lat__gte=min_lat, lat__lt=max_lat, lng__gte=min_lng, lng__lt=max_lng)
+        .annotate(
+            # Cell numbers counted from (-180, -90): cell // CLUSTER_GRID is the tile
+            gx=Floor((F('lng') + 180) / cell, output_field=IntegerField()),
+            gy=Floor((F('lat') + 90) / cell, output_field=IntegerField()),
+        )
+        .values('gx', 'gy')
+        .annotate(
+            count=Count('id'),
+            verified=Count('id', filter=Q(verified=True)),
+            lat_avg=Avg('lat'),
+            lng_avg=Avg('lng'),
+            first_id=Min('id'),
+        )
+        .order_by()
+    )
+    clusters = {tile: [] for tile in tiles}
+    for row in rows:
+        tile = (row['gx'] // CLUSTER_GRID, row['gy'] // CLUSTER_GRID)
+        if tile not in clusters:
+            continue  # Inside the box but in a tile that is already cached
+        cluster = {
+            'lat': round(row['lat_avg'], 5),
+            'lng': round(row['lng_avg'], 5),
+            'count': row['count'],
+            'verified_ratio': round(row['verified'] / row['count'], 2),
+        }
+        if row['count'] == 1:
+            cluster['shop_id'] = row['first_id']  # Lets the app open a single shop directly
+        clusters[tile].append(cluster)
+    return clusters
+
+
+def clusters_for_bbox(qs, scope, bbox, zoom):
+    """Read-through over the per-tile cache. `scope` separates differently filtered querysets."""
+    tiles = tiles_for_bbox(*bbox, zoom)
+    params = [{'scope': scope, 'zoom': zoom, 'x': x, 'y': y} for x, y in tiles]
+
+    def compute(missing):
+        computed = compute_tiles(qs, zoom, [(p['x'], p['y']) for p in missing])
+        return [computed[(p['x'], p['y'])] for p in missing]
+
+    clusters = []
+    for tile_clusters in cluster_cache.get_or_compute_many(TILES_GROUP, params, compute):
+        clusters.extend(tile_clusters)
+    return clusters
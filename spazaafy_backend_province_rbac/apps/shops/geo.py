@@ -0,0 +1,61 @@
+# apps/shops/geo.py
+"""
+Plain-Python geometry for when PostGIS is not available (USE_GIS=False).
+
+Shops are bucketed into a fixed lat/lng grid and the bucket is stored on
+SpazaShop.geocell (indexed). A radius search turns into:
+  1. a bounding box around the point,
+  2. the grid cells that box covers -> `geocell IN (...)` hits the index,
+  3. exact haversine only on the rows in those cells.
+"""
+import math
+
+EARTH_RADIUS_KM = 6371.0
+# ~5.5 km of latitude per cell; a 5 km search covers a 3x3 block of cells
+GEOCELL_DEGREES = 0.05
+# Past this many cells the IN list costs more than it saves; fall back to the box alone
+MAX_CELLS_PER_QUERY = 400
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = (math.sin(dlat / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2)
+    return 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a)) * EARTH_RADIUS_KM
+
+
+def geocell_index(lat, lng):
+    return math.floor(lat / GEOCELL_DEGREES), math.floor(lng / GEOCELL_DEGREES)
+
+
+def geocell_for(lat, lng):
+    """Grid cell key stored on SpazaShop.geocell, e.g. '-521:562'."""
+    if lat is None or lng is None:
+        return None
+    row, col = geocell_index(lat, lng)
+    return f"{row}:{col}"
+
+
+def bounding_box(lat, lng, radius_km):
+    """(min_lat, max_lat, min_lng, max_lng) that contains the whole circle."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    # Longitude degrees shrink towards the poles; widen the box accordingly
+    cos_lat = math.cos(math.radians(min(abs(lat) + dlat, 89.9)))
+    dlng = math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat))
+    return (
+        max(lat - dlat, -90.0), min(lat + dlat, 90.0),
+        max(lng - dlng, -180.0), min(lng + dlng, 180.0),
+    )
+
+
+def geocells_for_box(min_lat, max_lat, min_lng, max_lng):
+    """
+    Every cell key the box touches, or None if there are more than
+    MAX_CELLS_PER_QUERY (the caller then filters on the box only).
+    """
+    row_min, col_min = geocell_index(min_lat, min_lng)
+    row_max, col_max = geocell_index(max_lat, max_lng)
+    if (row_max - row_min + 1) * (col_max - col_min + 1) > MAX_CELLS_PER_QUERY:
+        return None
+    return [f"{row}:{col}" for row in range(row_min, row_max + 1) for col in range(col_min, col_max + 1)]
@@ -0,0 +1,218 @@
+# apps/shops/importer.py
+"""
+Bulk onboarding of shop owners + shops from a CSV/XLSX sheet.
+
+1. read_rows(): sheet -> list of dicts keyed by lower-case header.
+2. validate_rows(): checks every row against the whole file and the
+   database at once (one query for existing emails, one for provinces), and
+   returns the clean rows plus a per-row error report.
+3. import_rows(): bulk_create()s users, shops and verification tokens in
+   transactions of `batch_size` rows. A batch that fails rolls back on its
+   own and is reported; the others are kept.
+4. send_verification_emails(): the verification email for every created
+   owner, as Brevo batch requests with per-owner merge params (the same
+   template as self-registration), falling back per owner to backup SMTP.
+
+Imported owners start inactive with an unusable password: the email link
+activates the account, then they use "forgot password" (or Google sign-in).
+"""
+import csv
+import io
+from collections import Counter
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+from apps.accounts.models import EmailVerificationToken, User, VERIFY_EMAIL_TEMPLATE_ID
+from apps.core.brevo import BatchRecipient
+from apps.core.models import Province
+from apps.core.utils import send_batch_email_with_fallback
+from .geo import geocell_for
+from .models import SpazaShop, USE_GIS
+
+COLUMNS = ['email', 'first_name', 'last_name', 'phone', 'shop_name', 'address', 'province', 'latitude', 'longitude']
+REQUIRED_COLUMNS = {'email', 'shop_name', 'province'}
+
+
+class ImportFileError(ValueError):
+    """The file as a whole can't be imported (format, headers, size)."""
+
+
+def read_rows(fileobj, filename):
+    """[{column: str}] from a .csv or .xlsx upload. Row numbers are the sheet's (header = 1)."""
+    if filename.lower().endswith('.xlsx'):
+        try:
+            import openpyxl
+        except ImportError:
+            raise ImportFileError("XLSX import needs the openpyxl package; upload a CSV instead.")
+        sheet = openpyxl.load_workbook(fileobj, read_only=True, data_only=True).active
+        values = sheet.iter_rows(values_only=True)
+    else:
+        text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+        values = csv.reader(text)
+
+    header = next(values, None)
+    if not header:
+        raise ImportFileError("The file is empty.")
+    header = [str(h or '').strip().lower().replace(' ', '_') for h in header]
+    missing = REQUIRED_COLUMNS - set(header)
+    if missing:
+        raise ImportFileError(f"Missing column(s): {', '.join(sorted(missing))}.")
+
+    max_rows = getattr(settings, 'SHOP_IMPORT_MAX_ROWS', 20000)
+    rows = []
+    for number, cells in enumerate(values, start=2):
+        if not any(c not in (None, '') for c in cells):
+            continue  # Blank line
+        if len(rows) >= max_rows:
+            raise ImportFileError(f"Too many rows; split the file into sheets of at most {max_rows}.")
+        row = {col: ('' if cell is None else str(cell).strip()) for col, cell in zip(header, cells) if col in COLUMNS}
+        row['row'] = number
+        rows.append(row)
+    return rows
+
+
+def _coordinate(value, low, high):
+    if value == '':
+        return None
+    number = float(value)  # ValueError for text
+    if not low <= number <= high:
+        raise ValueError
+    return number
+
+
+def validate_rows(rows, province_id=None):
+    """
+    (valid rows, errors). Each error is {'row', 'email', 'errors': [...]}.
+    `province_id` limits a province admin's import to their own province.
+    """
+    emails = [row.get('email', '').lower() for row in rows]
+    seen_in_file = Counter(e for e in emails if e)
+    existing = set(
+        User.objects.annotate(email_lower=Lower('email'))
+        .filter(email_lower__in=list(seen_in_file)).values_list('email_lower', flat=True)
+    )
+    provinces = {name.lower(): pk for pk, name in Province.objects.values_list('id', 'name')}
+
+    valid, errors = [], []
+    for row, email in zip(rows, emails):
+        problems = []
+        try:
+            validate_email(email)
+        except ValidationError:
+            problems.append("Invalid or missing email.")
+        if seen_in_file[email] > 1:
+            problems.append("Email appears more than once in the file.")
+        if email in existing:
+            problems.append("A user with this email already exists.")
+        if not row.get('shop_name'):
+            problems.append("shop_name is required.")
+
+        province = provinces.get(row.get('province', '').lower())
+        if province is None:
+            problems.append(f"Unknown province '{row.get('province', '')}'.")
+        elif province_id and province != province_id:
+            problems.append("Province is outside your admin province.")
+
+        try:
+            lat = _coordinate(row.get('latitude', ''), -90, 90)
+            lng = _coordinate(row.get('longitude', ''), -180, 180)
+            if (lat is None) != (lng is None):
+                raise ValueError
+        except ValueError:
+            problems.append("latitude/longitude must both be given as decimal degrees (or both left empty).")
+            lat = lng = None
+
+        if problems:
+            errors.append({'row': row['row'], 'email': email, 'errors': problems})
+        else:
+            valid.append({**row, 'email': email, 'province_id': province, 'latitude': lat, 'longitude': lng})
+    return valid, errors
+
+
+def _create_batch(batch):
+    """Users, shops and tokens for one batch; returns the email rows for the created owners."""
+    unusable_password = make_password(None)
+    users = User.objects.bulk_create([
+        User(
+            username=row['email'], email=row['email'], password=unusable_password,
+            first_name=row.get('first_name', ''), last_name=row.get('last_name', ''), phone=row.get('phone', ''),
+            role=User.Roles.OWNER, is_active=False,
+        )
+        for row in batch
+    ])
+
+    shops = []
+    for user, row in zip(users, batch):
+        # bulk_create skips SpazaShop.save(), so the geocell is set here
+        shop = SpazaShop(
+            owner=user, name=row['shop_name'], address=row.get('address', ''),
+            province_id=row['province_id'], verified=False,
+            geocell=geocell_for(row['latitude'], row['longitude']),
+        )
+        if row['latitude'] is not None:
+            if USE_GIS:
+                from django.contrib.gis.geos import Point
+                shop.location = Point(row['longitude'], row['latitude'], srid=4326)
+            else:
+                shop.latitude, shop.longitude = row['latitude'], row['longitude']
+        shops.append(shop)
+    SpazaShop.objects.bulk_create(shops)
+
+    tokens = EmailVerificationToken.objects.bulk_create([EmailVerificationToken(user=user) for user in users])
+    return [
+        {'email': user.email, 'first_name': user.first_name, 'token': token.token}
+        for user, token in zip(users, tokens)
+    ]
+
+
+def import_rows(valid, batch_size=None):
+    """(created email rows, errors for rows in failed batches)."""
+    batch_size = batch_size or getattr(settings, 'SHOP_IMPORT_BATCH_SIZE', 500)
+    created, errors = [], []
+    for start in range(0, len(valid), batch_size):
+        batch = valid[start:start + batch_size]
+        try:
+            with transaction.atomic():
+                created.extend(_create_batch(batch))
+        except Exception as e:
+            # e.g. an email registered by someone else since validation
+            print(f"Shop import batch starting at row {batch[0]['row']} failed: {e}")
+            errors.extend({'row': row['row'], 'email': row['email'], 'errors': [f"Not imported: batch failed ({e})."]}
+                          for row in batch)
+    if created:
+        # bulk_create sends no signals; admin map clusters include unverified shops
+        from .clusters import invalidate_clusters
+        invalidate_clusters()
+    return created, errors
+
+
+VERIFICATION_SUBJECT = "Verify your Spazaafy account"
+# Backup SMTP body when Brevo (and so the template) is unavailable
+VERIFICATION_BACKUP_BODY = """Hi {{ params.NAME }},
+
+Your Spazaafy shop account has been created. Please verify your email address:
+{{ params.LINK }}
+
+Regards,
+Spazaafy Team"""
+
+
+def send_verification_emails(rows):
+    """Sends the verification emails for imported owners. Returns how many were sent."""
+    frontend_url = settings.FRONTEND_URL.rstrip('/')
+    recipients = [
+        BatchRecipient(row['email'], row['first_name'], {
+            'NAME': row['first_name'] if row['first_name'] else "User",
+            'LINK': f"{frontend_url}/verify-email/{row['token']}",
+        })
+        for row in rows
+    ]
+    sent = send_batch_email_with_fallback(
+        VERIFICATION_SUBJECT, recipients,
+        template_id=VERIFY_EMAIL_TEMPLATE_ID, backup_body=VERIFICATION_BACKUP_BODY,
+    )
+    print(f"Shop import: sent {sent} verification emails, {len(rows) - sent} failed.")
+    return sent
@@ -0,0 +1,49 @@
+# apps/shops/management/commands/import_shops.py
+
+import csv
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from apps.shops.importer import ImportFileError, import_rows, read_rows, send_verification_emails, validate_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk-onboards shop owners and their shops from a CSV or XLSX sheet (see apps/shops/importer.py).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file with email, shop_name, province, ... columns')
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'SHOP_IMPORT_BATCH_SIZE', 500),
+                            help='Rows created per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Validate only; create nothing')
+        parser.add_argument('--no-email', action='store_true',
+                            help="Don't send verification emails now (the daily reminder job will)")
+        parser.add_argument('--report', help='Write the per-row error report to this CSV file')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as f:
+                rows = read_rows(f, options['path'])
+        except (OSError, ImportFileError) as e:
+            raise CommandError(str(e))
+
+        valid, errors = validate_rows(rows)
+        self.stdout.write(f"{len(rows)} rows read: {len(valid)} valid, {len(errors)} with errors.")
+
+        created = []
+        if not options['dry_run'] and valid:
+            created, batch_errors = import_rows(valid, batch_size=options['batch_size'])
+            errors.extend(batch_errors)
+            self.stdout.write(self.style.SUCCESS(f"Created {len(created)} owners and shops."))
+            if created and not options['no_email']:
+                send_verification_emails(created)
+
+        errors.sort(key=lambda e: e['row'])
+        if options['report']:
+            with open(options['report'], 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['Row', 'Email', 'Errors'])
+                for error in errors:
+                    writer.writerow([error['row'], error['email'], ' '.join(error['errors'])])
+            self.stdout.write(f"Error report written to {options['report']}.")
+        else:
+            for error in errors:
+                self.stdout.write(self.style.ERROR(f"Row {error['row']} ({error['email']}): {' '.join(error['errors'])}"))
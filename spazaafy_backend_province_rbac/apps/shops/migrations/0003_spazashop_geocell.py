@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:24
+
+from django.db import migrations, models
+
+
+def fill_geocells(apps, schema_editor):
+    from apps.shops.geo import geocell_for
+    SpazaShop = apps.get_model('shops', 'SpazaShop')
+    shops = []
+    for shop in SpazaShop.objects.all().iterator(chunk_size=2000):
+        location = getattr(shop, 'location', None)
+        if location is not None:
+            shop.geocell = geocell_for(location.y, location.x)
+        else:
+            shop.geocell = geocell_for(getattr(shop, 'latitude', None), getattr(shop, 'longitude', None))
+        shops.append(shop)
+    SpazaShop.objects.bulk_update(shops, ['geocell'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0002_seed_provinces'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spazashop',
+            name='geocell',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.RunPython(fill_geocells, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    GiST index on location::geography so `nearby` can order by
+    `location::geography <-> point` (KNN) straight from the index.
+    """
+
+    dependencies = [
+        ('shops', '0003_spazashop_geocell'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS shops_spazashop_location_geog_gist '
+                'ON shops_spazashop USING GIST ((location::geography));',
+            reverse_sql='DROP INDEX IF EXISTS shops_spazashop_location_geog_gist;',
+        ),
+    ]
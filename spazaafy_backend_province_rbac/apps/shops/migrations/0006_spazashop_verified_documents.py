@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:40
+
+from collections import defaultdict
+from django.db import migrations, models
+
+# Frozen copy of DOCUMENT_TYPE_BITS (apps/shops/models.py) at this migration
+DOCUMENT_TYPE_BITS = {
+    "COR_REG": 1 << 0, "COA": 1 << 1, "TAX": 1 << 2, "ID_PERMIT": 1 << 3, "BUSINESS_LICENCE": 1 << 4,
+    "FIRE_SAFETY": 1 << 5, "PROOF_OF_PROPERTY": 1 << 6, "BANK_LETTER": 1 << 7, "OTHER": 1 << 8,
+}
+
+
+def backfill_verified_documents(apps, schema_editor):
+    SpazaShop = apps.get_model('shops', 'SpazaShop')
+    Document = apps.get_model('compliance', 'Document')
+    masks = defaultdict(int)
+    rows = Document.objects.filter(status='VERIFIED').values_list('shop_id', 'type').distinct()
+    for shop_id, doc_type in rows.iterator():
+        masks[shop_id] |= DOCUMENT_TYPE_BITS.get(doc_type, 0)
+    shops = [SpazaShop(id=shop_id, verified_documents=mask) for shop_id, mask in masks.items()]
+    SpazaShop.objects.bulk_update(shops, ['verified_documents'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0005_spazashop_updated_at'),
+        ('compliance', '0007_alter_document_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spazashop',
+            name='verified_documents',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_verified_documents, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,10 @@
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from apps.core.models import Province
-import math
+from .geo import geocell_for, haversine_km
 
 USE_GIS=False
 try:
@@ -11,6 +13,31 @@ try:
 except Exception:
     pass
 
+# Bit per compliance DocumentType in SpazaShop.verified_documents.
+# Stored in the database: only ever append new types, never renumber.
+DOCUMENT_TYPE_BITS = {
+    "COR_REG": 1 << 0,
+    "COA": 1 << 1,
+    "TAX": 1 << 2,
+    "ID_PERMIT": 1 << 3,
+    "BUSINESS_LICENCE": 1 << 4,
+    "FIRE_SAFETY": 1 << 5,
+    "PROOF_OF_PROPERTY": 1 << 6,
+    "BANK_LETTER": 1 << 7,
+    "OTHER": 1 << 8,
+}
+# These are the document TYPE codes required for verification
+REQUIRED_DOC_TYPES = {"COR_REG", "TAX", "COA"}
+REQUIRED_DOCUMENTS_MASK = sum(DOCUMENT_TYPE_BITS[t] for t in REQUIRED_DOC_TYPES)
+
+
+def documents_mask(doc_types):
+    mask = 0
+    for doc_type in doc_types:
+        mask |= DOCUMENT_TYPE_BITS.get(doc_type, 0)
+    return mask
+
+
 class SpazaShop(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='shops')
     province = models.ForeignKey(Province, on_delete=models.PROTECT, related_name='shops')
@@ -21,33 +48,128 @@ class SpazaShop(models.Model):
     else:
         latitude = models.FloatField(null=True, blank=True)
         longitude = models.FloatField(null=True, blank=True)
+    # Grid bucket of the coordinates (see geo.py), kept in sync on save()
+    geocell = models.CharField(max_length=32, null=True, blank=True, db_index=True, editable=False)
     verified = models.BooleanField(default=False)
+    # Bitmask (DOCUMENT_TYPE_BITS) of document types with at least one VERIFIED
+    # document; maintained by Document.save()/delete, rebuilt by recompute_shop_verification
+    verified_documents = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # ETag/Last-Modified validator for the shop endpoints (apps/core/conditional.py)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self): return self.name
 
+    @property
+    def coordinates(self):
+        """(lat, lng) or (None, None), whichever way the location is stored."""
+        if USE_GIS:
+            return (self.location.y, self.location.x) if self.location else (None, None)
+        return self.latitude, self.longitude
+
+    def save(self, *args, **kwargs):
+        self.geocell = geocell_for(*self.coordinates)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'geocell' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['geocell']
+        super().save(*args, **kwargs)
+
     def distance_km_from(self, lat, lng):
         if USE_GIS: return None
         if self.latitude is None or self.longitude is None: return None
-        R=6371.0
-        dlat=math.radians(lat - self.latitude); dlng=math.radians(lng - self.longitude)
-        a=(math.sin(dlat/2)**2 + math.cos(math.radians(self.latitude))*math.cos(math.radians(lat))*math.sin(dlng/2)**2)
-        return 2*math.atan2(math.sqrt(a), math.sqrt(1-a))*R
+        return haversine_km(self.latitude, self.longitude, lat, lng)
+
+    @property
+    def has_required_documents(self):
+        return self.verified_documents & REQUIRED_DOCUMENTS_MASK == REQUIRED_DOCUMENTS_MASK
 
     # --- ADD THIS NEW METHOD ---
     def check_and_update_verification(self):
         """
         Checks if all required documents are verified and updates the shop's
-        verification status accordingly.
+        verification status accordingly (a bit test, no document queries).
+        """
+        verified = self.has_required_documents
+        if verified != self.verified:
+            self.verified = verified
+            self.save(update_fields=['verified', 'updated_at'])
+
+    @classmethod
+    def sync_document_types(cls, shop_id, doc_types, instance=None):
         """
-        # These are the document TYPE codes required for verification
-        REQUIRED_DOC_TYPES = {"COR_REG", "TAX", "COA"}
-        
-        verified_docs = self.documents.filter(status='VERIFIED')
-        verified_doc_types = set(verified_docs.values_list('type', flat=True))
-        
-        if REQUIRED_DOC_TYPES.issubset(verified_doc_types):
-            self.verified = True
-        else:
-            self.verified = False
-        self.save()
\ No newline at end of file
+        Re-derives the verified_documents bits for doc_types (one EXISTS per
+        type) and the verified flag, under a row lock so concurrent document
+        changes on the same shop serialise. Call inside the document's
+        transaction. `instance`, if given, gets the new values too.
+        """
+        with transaction.atomic():
+            shop = cls.objects.select_for_update().filter(pk=shop_id).first()
+            if shop is None:
+                return  # Shop is being deleted
+            mask = shop.verified_documents
+            for doc_type in doc_types:
+                bit = DOCUMENT_TYPE_BITS.get(doc_type, 0)
+                if shop.documents.filter(type=doc_type, status='VERIFIED').exists():
+                    mask |= bit
+                else:
+                    mask &= ~bit
+            if mask != shop.verified_documents:
+                shop.verified_documents = mask
+                shop.verified = shop.has_required_documents
+                shop.save(update_fields=['verified_documents', 'verified', 'updated_at'])
+        if instance is not None:
+            instance.verified_documents = shop.verified_documents
+            instance.verified = shop.verified
+
+
+# ✅ Keep the in-memory nearby index (spatial_index.py), cached map
+# clusters (clusters.py) and cached public responses (cache.py) in step with edits.
+# All of it runs on commit: invalidating earlier would let a concurrent request
+# refill the caches with the old rows (e.g. a shop saved inside Document.save()'s
+# transaction), and a rolled-back change must not reach the index.
+@receiver(post_save, sender=SpazaShop)
+def update_shop_index(sender, instance, created=False, **kwargs):
+    from .spatial_index import shop_index
+    from .clusters import invalidate_clusters
+    from .cache import shop_cache, shop_group
+    shop_id, verified = instance.pk, instance.verified
+    lat, lng = instance.coordinates
+
+    def apply():
+        shop_index.upsert(shop_id, lat, lng, visible=verified and lat is not None and lng is not None)
+        invalidate_clusters()
+        if created and not verified:
+            return  # Not in any public response yet
+        shop_cache.invalidate('list', shop_group(shop_id))
+    transaction.on_commit(apply)
+
+
+@receiver(post_delete, sender=SpazaShop)
+def remove_from_shop_index(sender, instance, **kwargs):
+    from .spatial_index import shop_index
+    from .clusters import invalidate_clusters
+    from .cache import shop_cache, shop_group
+    shop_id = instance.pk
+
+    def apply():
+        shop_index.remove(shop_id)
+        invalidate_clusters()
+        shop_cache.invalidate('list', shop_group(shop_id))
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def refresh_cached_owner_shops(sender, instance, created=False, update_fields=None, **kwargs):
+    """
+    Owner name/phone/email are part of the shop payload: drop cached copies of
+    their shops and touch updated_at so the shops' ETags change too.
+    """
+    from django.utils import timezone
+    from .cache import shop_cache, shop_group, OWNER_FIELDS
+    if created or (update_fields and not OWNER_FIELDS.intersection(update_fields)):
+        return  # e.g. the last_login update on every login
+    shops = SpazaShop.objects.filter(owner_id=instance.pk)
+    shop_ids = list(shops.values_list('id', flat=True))
+    if shop_ids:
+        shops.update(updated_at=timezone.now())
+        transaction.on_commit(lambda: shop_cache.invalidate('list', *[shop_group(i) for i in shop_ids]))
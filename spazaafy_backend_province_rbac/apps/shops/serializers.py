@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import SpazaShop, Province
+from .models import SpazaShop, Province, USE_GIS
 
 # This is a dependency for the SpazaShopSerializer
 class ProvinceSerializer(serializers.ModelSerializer):
@@ -17,6 +17,13 @@ class SpazaShopSerializer(serializers.ModelSerializer):
     latitude = serializers.FloatField(write_only=True, required=False)
     longitude = serializers.FloatField(write_only=True, required=False)
 
+    # Only set by the nearby endpoint
+    distance_km = serializers.SerializerMethodField()
+
+    # Without GIS there is no PointField; emit the same EWKT string the frontend parses
+    if not USE_GIS:
+        location = serializers.SerializerMethodField()
+
     province = ProvinceSerializer(read_only=True)
     province_id = serializers.PrimaryKeyRelatedField(
         queryset=Province.objects.all(), source='province', write_only=True
@@ -40,20 +47,34 @@ class SpazaShopSerializer(serializers.ModelSerializer):
             'created_at',
             'latitude', # This field accepts latitude on updates
             'longitude', # This field accepts longitude on updates
+            'distance_km',
         ]
         read_only_fields = ['owner', 'verified', 'created_at', 'location']
 
         # ✅ FIX: Removed the incorrect read_only constraints
         extra_kwargs = {}
 
+    def get_distance_km(self, obj):
+        distance = getattr(obj, 'distance_km', None)
+        return round(distance, 3) if distance is not None else None
+
+    def get_location(self, obj):
+        if obj.latitude is None or obj.longitude is None:
+            return None
+        return f"SRID=4326;POINT ({obj.longitude} {obj.latitude})"
+
     # ✅ FIX: Moved the update method to the correct indentation level
     def update(self, instance, validated_data):
         latitude = validated_data.pop('latitude', None)
         longitude = validated_data.pop('longitude', None)
 
         if latitude is not None and longitude is not None:
-            from django.contrib.gis.geos import Point
-            # Note: A Point object takes longitude first, then latitude.
-            instance.location = Point(longitude, latitude, srid=4326)
+            if USE_GIS:
+                from django.contrib.gis.geos import Point
+                # Note: A Point object takes longitude first, then latitude.
+                instance.location = Point(longitude, latitude, srid=4326)
+            else:
+                instance.latitude = latitude
+                instance.longitude = longitude
 
         return super().update(instance, validated_data)
\ No newline at end of file
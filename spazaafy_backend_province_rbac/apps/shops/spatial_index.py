@@ -0,0 +1,260 @@
+# apps/shops/spatial_index.py
+"""
+Process-local spatial index over verified shop coordinates, for `nearby`.
+
+Points are stored as 3D unit vectors, so the straight-line (chord) distance
+between two of them is a monotonic function of their haversine distance:
+    great_circle_km = 2 * R * asin(chord / 2)
+A ball tree over those vectors therefore answers haversine radius and
+k-nearest queries exactly, with NumPy doing the per-leaf distance maths.
+
+Updates arrive through SpazaShop post_save/post_delete (see models.py): new
+or moved shops go into a small side buffer that is scanned brute force, and
+changed/deleted ids are masked out of the tree. Once the buffer passes
+SHOP_INDEX_MAX_PENDING the tree is rebuilt from the live data. Each worker
+process has its own copy, so it is also rebuilt after SHOP_INDEX_TTL seconds
+to pick up changes saved by other processes; callers re-filter the returned
+ids through their queryset, so a stale entry can never leak a shop.
+"""
+import heapq
+import math
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # The endpoint falls back to database queries without NumPy
+    np = None
+
+from django.conf import settings
+
+from .geo import EARTH_RADIUS_KM
+
+LEAF_SIZE = 32
+
+
+def _to_xyz(lat, lng):
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)], axis=-1)
+
+
+def _km_to_chord(km):
+    return 2.0 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2.0)
+
+
+def _chord_to_km(chord):
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0))
+
+
+class BallTree:
+    """Static ball tree over unit vectors. Nodes are flat arrays; leaves hold LEAF_SIZE points."""
+
+    def __init__(self, ids, xyz):
+        self.size = len(ids)
+        self._order = np.arange(self.size)
+        starts, ends, centers, radii, children = [], [], [], [], []
+        if self.size:
+            stack = [(0, self.size, -1, 0)]
+            while stack:
+                start, end, parent, side = stack.pop()
+                node = len(starts)
+                if parent >= 0:
+                    children[parent][side] = node
+                points = xyz[self._order[start:end]]
+                center = points.mean(axis=0)
+                starts.append(start)
+                ends.append(end)
+                centers.append(center)
+                radii.append(float(np.sqrt(((points - center) ** 2).sum(axis=1)).max()))
+                children.append([-1, -1])
+                if end - start > LEAF_SIZE:
+                    # Split on the axis with the widest spread, at the median
+                    axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+                    mid = (end - start) // 2
+                    part = np.argpartition(points[:, axis], mid)
+                    self._order[start:end] = self._order[start:end][part]
+                    stack.append((start + mid, end, node, 1))
+                    stack.append((start, start + mid, node, 0))
+        self.ids = np.asarray(ids, dtype=np.int64)[self._order]
+        self.xyz = xyz[self._order] if self.size else np.empty((0, 3))
+        self.starts, self.ends = starts, ends
+        # Plain tuples: per-node bound checks are cheaper in Python than tiny NumPy calls
+        self.centers = [tuple(c.tolist()) for c in centers]
+        self.radii = radii
+        self.children = children
+
+    def _gap(self, node, q):
+        """Lower bound on the chord distance from q to any point in the node (q is a tuple)."""
+        cx, cy, cz = self.centers[node]
+        dist = math.sqrt((cx - q[0]) ** 2 + (cy - q[1]) ** 2 + (cz - q[2]) ** 2)
+        return max(dist - self.radii[node], 0.0)
+
+    def within(self, q, max_chord):
+        """Yields (ids, chords) per leaf for points within max_chord of q."""
+        if not self.size:
+            return
+        qt = tuple(q.tolist())
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._gap(node, qt) > max_chord:
+                continue
+            left, right = self.children[node]
+            if left < 0:
+                s, e = self.starts[node], self.ends[node]
+                chords = np.sqrt(((self.xyz[s:e] - q) ** 2).sum(axis=1))
+                hit = chords <= max_chord
+                if hit.any():
+                    yield self.ids[s:e][hit], chords[hit]
+            else:
+                stack.extend((left, right))
+
+    def nearest(self, q, k, max_chord, excluded):
+        """Up to k (chord, id) pairs closest to q, best-first over node lower bounds."""
+        best = []  # max-heap via negated chord
+        if not self.size:
+            return best
+        qt = tuple(q.tolist())
+        frontier = [(self._gap(0, qt), 0)]
+        while frontier:
+            gap, node = heapq.heappop(frontier)
+            if gap > max_chord or (len(best) == k and gap > -best[0][0]):
+                break
+            left, right = self.children[node]
+            if left < 0:
+                s, e = self.starts[node], self.ends[node]
+                chords = np.sqrt(((self.xyz[s:e] - q) ** 2).sum(axis=1))
+                for chord, shop_id in zip(chords.tolist(), self.ids[s:e].tolist()):
+                    if chord > max_chord or shop_id in excluded:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-chord, shop_id))
+                    elif chord < -best[0][0]:
+                        heapq.heapreplace(best, (-chord, shop_id))
+            else:
+                for child in (left, right):
+                    heapq.heappush(frontier, (self._gap(child, qt), child))
+        return [(-c, i) for c, i in best]
+
+
+class ShopSpatialIndex:
+    def __init__(self, loader):
+        # loader() -> iterable of (shop_id, lat, lng) for every verified shop with coordinates
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._tree = None
+        self._built_at = 0.0
+        self._pending = {}     # shop_id -> (lat, lng) added/moved since the last build
+        self._removed = set()  # ids in the tree that are stale (moved, unverified or deleted)
+
+    @property
+    def enabled(self):
+        return np is not None and getattr(settings, 'SHOP_SPATIAL_INDEX', True)
+
+    def invalidate(self):
+        with self._lock:
+            self._tree = None
+
+    def _build(self):
+        rows = list(self._loader())
+        ids = [r[0] for r in rows]
+        xyz = _to_xyz([r[1] for r in rows], [r[2] for r in rows]) if rows else np.empty((0, 3))
+        self._tree = BallTree(ids, xyz)
+        self._tree_ids = set(ids)
+        self._built_at = time.monotonic()
+        self._pending = {}
+        self._removed = set()
+
+    def _snapshot(self):
+        with self._lock:
+            ttl = getattr(settings, 'SHOP_INDEX_TTL', 300)
+            if self._tree is None or time.monotonic() - self._built_at > ttl:
+                self._build()
+            return self._tree, dict(self._pending), set(self._removed)
+
+    # --- Incremental updates (signals) ---
+
+    def upsert(self, shop_id, lat, lng, visible):
+        """Record a saved shop. `visible` is False for unverified shops or missing coordinates."""
+        with self._lock:
+            if self._tree is None:
+                return  # Next query builds from the database anyway
+            if shop_id in self._tree_ids:
+                self._removed.add(shop_id)
+            self._pending.pop(shop_id, None)
+            if visible:
+                self._pending[shop_id] = (lat, lng)
+            if len(self._pending) > getattr(settings, 'SHOP_INDEX_MAX_PENDING', 256):
+                self._tree = None
+
+    def remove(self, shop_id):
+        with self._lock:
+            if self._tree is None:
+                return
+            if shop_id in self._tree_ids:
+                self._removed.add(shop_id)
+            self._pending.pop(shop_id, None)
+
+    # --- Queries ---
+
+    def _pending_hits(self, pending, q, max_chord):
+        if not pending:
+            return [], np.empty(0)
+        ids = list(pending)
+        xyz = _to_xyz([pending[i][0] for i in ids], [pending[i][1] for i in ids])
+        chords = np.sqrt(((xyz - q) ** 2).sum(axis=1))
+        hit = chords <= max_chord
+        return [i for i, h in zip(ids, hit.tolist()) if h], chords[hit]
+
+    def within(self, lat, lng, radius_km):
+        """[(shop_id, distance_km)] within radius_km, nearest first."""
+        tree, pending, removed = self._snapshot()
+        q = _to_xyz(lat, lng)
+        max_chord = _km_to_chord(radius_km)
+        ids, chords = [], []
+        for leaf_ids, leaf_chords in tree.within(q, max_chord):
+            if removed:
+                keep = np.array([i not in removed for i in leaf_ids.tolist()], dtype=bool)
+                leaf_ids, leaf_chords = leaf_ids[keep], leaf_chords[keep]
+            ids.extend(leaf_ids.tolist())
+            chords.append(leaf_chords)
+        extra_ids, extra_chords = self._pending_hits(pending, q, max_chord)
+        ids.extend(extra_ids)
+        chords.append(extra_chords)
+        if not ids:
+            return []
+        results = list(zip(ids, _chord_to_km(np.concatenate(chords)).tolist()))
+        results.sort(key=lambda r: (r[1], r[0]))
+        return results
+
+    def nearest(self, lat, lng, k, max_km=None):
+        """Up to k [(shop_id, distance_km)], nearest first, optionally capped at max_km."""
+        tree, pending, removed = self._snapshot()
+        q = _to_xyz(lat, lng)
+        max_chord = _km_to_chord(max_km) if max_km is not None else 2.0
+        # Masked ids are skipped inside the search so they don't use up k slots
+        found = tree.nearest(q, k, max_chord, removed)
+        extra_ids, extra_chords = self._pending_hits(pending, q, max_chord)
+        found.extend(zip(extra_chords.tolist(), extra_ids))
+        found.sort()
+        found = found[:k]
+        if not found:
+            return []
+        km = _chord_to_km(np.array([c for c, _ in found])).tolist()
+        return [(i, d) for (_, i), d in zip(found, km)]
+
+
+def _load_verified_shops():
+    from .models import SpazaShop, USE_GIS
+    shops = SpazaShop.objects.filter(verified=True)
+    if USE_GIS:
+        for shop_id, location in shops.exclude(location=None).values_list('id', 'location').iterator(chunk_size=5000):
+            yield shop_id, location.y, location.x
+    else:
+        rows = shops.exclude(latitude=None).exclude(longitude=None).values_list('id', 'latitude', 'longitude')
+        yield from rows.iterator(chunk_size=5000)
+
+
+shop_index = ShopSpatialIndex(_load_verified_shops)
@@ -1,23 +1,38 @@
-import csv
-from django.http import HttpResponse
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import SpazaShop, USE_GIS
+from .geo import bounding_box, geocells_for_box
+from .spatial_index import shop_index
+from .cache import shop_cache, shop_group
+from .importer import import_rows, read_rows, send_verification_emails, validate_rows
+from .clusters import clusters_for_bbox, tiles_for_bbox, MAX_TILES_PER_REQUEST, MAX_ZOOM
+from apps.core.pagination import encode_cursor, decode_cursor, InvalidCursor
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
 from .serializers import SpazaShopSerializer
 from apps.core.permissions import ProvinceScopedMixin
+from apps.core.conditional import ConditionalGetMixin
+from apps.core.exports import stream_csv, full_name
+from apps.core.jobs import enqueue
 
 # ✅ 1. Import necessary modules for geocoding
 from django.conf import settings
 import googlemaps
 
-class SpazaShopViewSet(ProvinceScopedMixin, viewsets.ModelViewSet):
-    queryset = SpazaShop.objects.all()
+# Page size for nearby when only a cursor is given, and the most one page may hold
+NEARBY_DEFAULT_K = 50
+NEARBY_MAX_K = 200
+
+class SpazaShopViewSet(ConditionalGetMixin, ProvinceScopedMixin, viewsets.ModelViewSet):
+    queryset = SpazaShop.objects.select_related('owner', 'province')
     serializer_class = SpazaShopSerializer
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve', 'nearby']:
+        if self.action in ['list', 'retrieve', 'nearby', 'clusters']:
             return [permissions.AllowAny()]
+        if self.action in ['cache_stats', 'bulk_import']:
+            return [permissions.IsAdminUser()]
         return [permissions.IsAuthenticated()]
 
     def get_queryset(self):
@@ -33,47 +48,245 @@ class SpazaShopViewSet(ProvinceScopedMixin, viewsets.ModelViewSet):
         
         return qs.filter(verified=True)
 
+    def sees_public_listing(self):
+        """True when get_queryset() is the verified-shops listing (consumers, anonymous)."""
+        user = self.request.user
+        if not user.is_authenticated:
+            return True
+        role = getattr(user, 'role', None)
+        return not ((user.is_staff and role == 'ADMIN') or role == 'OWNER')
+
+
+    # ✅ The public listing is the same for every anonymous/consumer request, so
+    # serve it from shop_cache (invalidated by the signals in models.py).
+    # ETags come from the validators cached with each body (ConditionalGetMixin);
+    # compute() goes past the mixin straight to the plain DRF list/retrieve.
+    def list(self, request, *args, **kwargs):
+        if not self.sees_public_listing():
+            return super().list(request, *args, **kwargs)
+        compute = lambda: list(super(ConditionalGetMixin, self).list(request, *args, **kwargs).data)
+        return self._cached_conditional(shop_cache, 'list', compute)
 
+    def retrieve(self, request, *args, **kwargs):
+        if not self.sees_public_listing():
+            return super().retrieve(request, *args, **kwargs)
+        # Http404 propagates out of compute(), so misses are never cached
+        compute = lambda: dict(super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs).data)
+        return self._cached_conditional(shop_cache, shop_group(kwargs['pk']), compute)
+
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        """Endpoint: /api/shops/cache_stats/ - hit/miss counters of this worker's public shop cache."""
+        return Response(shop_cache.stats())
 
     @action(detail=False, methods=['get'])
     def nearby(self, request):
+        """
+        Shops within radius_km of lat/lng, nearest first, each with distance_km.
+        Pass k (or limit) to get pages of k shops: the response is then
+        {results, next_cursor}; send next_cursor back as `cursor` for the next page.
+        Without k/cursor the full list is returned, as before.
+        """
         try:
             lat = float(request.query_params.get('lat'))
             lng = float(request.query_params.get('lng'))
         except (TypeError, ValueError):
             return Response({'detail': 'lat and lng query parameters are required and must be numbers.'}, status=400)
         
-        radius_km = float(request.query_params.get('radius_km', 25))
+        try:
+            radius_km = float(request.query_params.get('radius_km', 25))
+            k = request.query_params.get('k') or request.query_params.get('limit')
+            k = min(int(k), NEARBY_MAX_K) if k else None
+        except ValueError:
+            return Response({'detail': 'radius_km and k must be numbers.'}, status=400)
+        if k is not None and k < 1:
+            return Response({'detail': 'k must be at least 1.'}, status=400)
+
+        cursor = request.query_params.get('cursor')
+        after = None
+        if cursor:
+            try:
+                after = tuple(decode_cursor(cursor))
+                if len(after) != 2:
+                    raise InvalidCursor("Invalid cursor")
+            except InvalidCursor:
+                return Response({'detail': 'Invalid cursor.'}, status=400)
+        paginate = k is not None or cursor is not None
+        if paginate and k is None:
+            k = NEARBY_DEFAULT_K
+
+        # Each path returns [(sort_key, shop)] in order, k + 1 long at most so
+        # we know whether there is another page. sort_key is what the cursor holds.
         qs = self.get_queryset()
+        if shop_index.enabled and self.sees_public_listing():
+            ranked = self._nearby_from_index(qs, lat, lng, radius_km, k, after)
+        elif USE_GIS:
+            ranked = self._nearby_from_postgis(qs, lat, lng, radius_km, k, after)
+        else:
+            ranked = self._nearby_from_grid(qs, lat, lng, radius_km, k, after)
 
-        if USE_GIS:
-            from django.contrib.gis.measure import D
-            from django.contrib.gis.geos import Point
-            pt = Point(lng, lat, srid=4326)
-            qs = qs.filter(location__distance_lte=(pt, D(km=radius_km)))
-            return Response(self.get_serializer(qs, many=True).data)
-        
-        within = []
-        for s in qs.iterator():
+        next_cursor = None
+        if k is not None and len(ranked) > k:
+            ranked = ranked[:k]
+            last_key, last_shop = ranked[-1]
+            next_cursor = encode_cursor([last_key, last_shop.id])
+
+        data = self.get_serializer([shop for _, shop in ranked], many=True).data
+        if not paginate:
+            return Response(data)
+        return Response({'results': data, 'next_cursor': next_cursor})
+
+    def _nearby_from_index(self, qs, lat, lng, radius_km, k, after):
+        """Consumer map: answer from the in-memory index, then load just those shops."""
+        if k is not None and after is None:
+            hits = shop_index.nearest(lat, lng, k + 1, max_km=radius_km)
+        else:
+            hits = shop_index.within(lat, lng, radius_km)
+            if after is not None:
+                hits = [h for h in hits if (h[1], h[0]) > after]
+            if k is not None:
+                hits = hits[:k + 1]
+        shops = qs.filter(id__in=[shop_id for shop_id, _ in hits]).select_related('owner', 'province')
+        by_id = {shop.id: shop for shop in shops}
+        ranked = []
+        for shop_id, distance in hits:
+            if shop_id in by_id:
+                by_id[shop_id].distance_km = distance
+                ranked.append((distance, by_id[shop_id]))
+        return ranked
+
+    def _nearby_from_postgis(self, qs, lat, lng, radius_km, k, after):
+        """KNN ordering with PostGIS `<->` on geography (metres, index-assisted)."""
+        from django.contrib.gis.measure import D
+        from django.contrib.gis.geos import Point
+        pt = Point(lng, lat, srid=4326)
+        table = SpazaShop._meta.db_table
+        qs = qs.filter(location__distance_lte=(pt, D(km=radius_km))).annotate(
+            knn_m=RawSQL(
+                f'"{table}"."location"::geography <-> ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography',
+                (lng, lat), output_field=FloatField(),
+            )
+        )
+        if after is not None:
+            qs = qs.filter(Q(knn_m__gt=after[0]) | Q(knn_m=after[0], id__gt=after[1]))
+        qs = qs.select_related('owner', 'province').order_by('knn_m', 'id')
+        if k is not None:
+            qs = qs[:k + 1]
+        ranked = []
+        for shop in qs:
+            shop.distance_km = shop.knn_m / 1000.0
+            ranked.append((shop.knn_m, shop))
+        return ranked
+
+    def _nearby_from_grid(self, qs, lat, lng, radius_km, k, after):
+        """
+        Without GIS: only rows in the grid cells around the point (indexed),
+        inside the bounding box; exact haversine runs on those candidates alone.
+        """
+        min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+        candidates = qs.filter(
+            latitude__range=(min_lat, max_lat),
+            longitude__range=(min_lng, max_lng),
+        ).select_related('owner', 'province')
+        cells = geocells_for_box(min_lat, max_lat, min_lng, max_lng)
+        if cells is not None:
+            candidates = candidates.filter(geocell__in=cells)
+
+        ranked = []
+        for s in candidates.iterator():
             d = s.distance_km_from(lat, lng)
-            if d is not None and d <= radius_km:
-                within.append(s)
-        return Response(self.get_serializer(within, many=True).data)
+            if d is not None and d <= radius_km and (after is None or (d, s.id) > after):
+                s.distance_km = d
+                ranked.append((d, s))
+        ranked.sort(key=lambda r: (r[0], r[1].id))
+        return ranked[:k + 1] if k is not None else ranked
     
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """
+        Endpoint: /api/shops/clusters/?bbox=min_lng,min_lat,max_lng,max_lat&zoom=10
+        Pre-aggregated map clusters (count, centroid, verified ratio) for the
+        visible box, cached per tile. See clusters.py.
+        """
+        try:
+            min_lng, min_lat, max_lng, max_lat = [float(v) for v in request.query_params.get('bbox', '').split(',')]
+            zoom = int(request.query_params.get('zoom'))
+        except (TypeError, ValueError):
+            return Response({'detail': 'bbox (min_lng,min_lat,max_lng,max_lat) and zoom are required.'}, status=400)
+        if not (0 <= zoom <= MAX_ZOOM) or min_lng > max_lng or min_lat > max_lat:
+            return Response({'detail': 'Invalid bbox or zoom.'}, status=400)
+        min_lng, max_lng = max(min_lng, -180.0), min(max_lng, 179.999999)
+        min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 89.999999)
+        bbox = (min_lng, min_lat, max_lng, max_lat)
+        if len(tiles_for_bbox(*bbox, zoom)) > MAX_TILES_PER_REQUEST:
+            return Response({'detail': 'Box too large for this zoom level; zoom in or use a lower zoom.'}, status=400)
+
+        # Cached tiles are only shared between requests that see the same shops
+        user = request.user
+        if self.sees_public_listing():
+            scope = 'public'
+        elif getattr(user, 'role', None) == 'OWNER':
+            scope = f'owner{user.pk}'
+        else:
+            scope = f'admin{user.province_id or "all"}'
+
+        clusters = clusters_for_bbox(self.get_queryset(), scope, bbox, zoom)
+        return Response({'zoom': zoom, 'clusters': clusters})
+
+    @action(detail=False, methods=['post'])
+    def bulk_import(self, request):
+        """
+        Endpoint: POST /api/shops/bulk_import/ (multipart: file, dry_run, batch_size)
+        Onboards owners + shops from a CSV/XLSX sheet; returns a per-row error report.
+        Province admins can only import into their own province.
+        """
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({'detail': 'Upload a CSV or XLSX file as "file".'}, status=400)
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+        try:
+            batch_size = int(request.data.get('batch_size') or settings.SHOP_IMPORT_BATCH_SIZE)
+            rows = read_rows(upload, upload.name)
+        except ValueError as e:  # Includes ImportFileError
+            return Response({'detail': str(e)}, status=400)
+
+        valid, errors = validate_rows(rows, province_id=request.user.province_id)
+        created = []
+        if not dry_run and valid:
+            created, batch_errors = import_rows(valid, batch_size=max(batch_size, 1))
+            errors.extend(batch_errors)
+            if created:
+                # ✅ Emails go out in the background, rate-limited, after the rows are committed
+                enqueue(send_verification_emails, created)
+
+        errors.sort(key=lambda e: e['row'])
+        return Response({
+            'rows': len(rows),
+            'valid': len(valid),
+            'created': len(created),
+            'dry_run': dry_run,
+            'errors': errors,
+        })
+
     @action(detail=False, methods=['get'])
     def export_csv(self, request):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="spaza_shops.csv"'
-        writer = csv.writer(response)
-        writer.writerow(['ID', 'Shop Name', 'Owner', 'Email', 'Address', 'Province', 'Verified'])
-        for shop in self.get_queryset():
-            writer.writerow([
-                shop.id,
-                shop.name,
-                shop.owner.get_full_name() if shop.owner else 'N/A',
-                shop.owner.email if shop.owner else 'N/A',
-                shop.address,
-                shop.province.name if shop.province else 'N/A',
-                shop.verified
-            ])
-        return response
\ No newline at end of file
+        # ✅ Streamed from one values() query; owner/province come from JOINs
+        def row(shop):
+            has_owner = shop['owner_id'] is not None
+            return [
+                shop['id'],
+                shop['name'],
+                full_name(shop['owner__first_name'], shop['owner__last_name']) if has_owner else 'N/A',
+                shop['owner__email'] if has_owner else 'N/A',
+                shop['address'],
+                shop['province__name'] if shop['province__name'] is not None else 'N/A',
+                shop['verified'],
+            ]
+
+        return stream_csv(
+            self.get_queryset(), 'spaza_shops.csv',
+            ['ID', 'Shop Name', 'Owner', 'Email', 'Address', 'Province', 'Verified'],
+            ['id', 'name', 'owner_id', 'owner__first_name', 'owner__last_name', 'owner__email',
+             'address', 'province__name', 'verified'],
+            row=row,
+        )
\ No newline at end of file
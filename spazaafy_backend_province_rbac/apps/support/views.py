@@ -3,18 +3,35 @@ from rest_framework.response import Response
 from .models import Ticket, Message, AssistanceRequest, TechTicket, TechMessage
 from .serializers import TicketSerializer, MessageSerializer, AssistanceRequestSerializer, AssistanceRequestModelSerializer, TechTicketSerializer, TechMessageSerializer
 from apps.core.permissions import ProvinceScopedMixin
+from apps.core.conditional import ConditionalGetMixin
 from .models import mark_ticket_as_read
 from apps.shops.models import SpazaShop
 from django.conf import settings
 from rest_framework.decorators import action
 from apps.core.utils import send_expo_push_notification, send_email_with_fallback # ✅ Import utility
-from django.db.models import Count 
+from django.db.models import Count, Max, Q
 from django.utils import timezone
 
 # ... TicketViewSet and MessageViewSet remain unchanged ...
-class TicketViewSet(ProvinceScopedMixin, viewsets.ModelViewSet):
+class TicketViewSet(ConditionalGetMixin, ProvinceScopedMixin, viewsets.ModelViewSet):
     queryset = Ticket.objects.all()
     serializer_class = TicketSerializer
+    # retrieve() marks the ticket as read, so it must always run
+    conditional_actions = ('list',)
+
+    def get_validators(self, queryset):
+        # mark_ticket_as_read() saves only the unread flags (updated_at is left alone
+        # so lists keep their order), so the flags are part of the validator.
+        # The rows also embed the creator's details and the shop name: renaming
+        # either must change the ETag too.
+        stats = queryset.order_by().aggregate(
+            count=Count('id'), latest=Max('updated_at'),
+            users_latest=Max('user__updated_at'), shops_latest=Max('shop__updated_at'),
+            unread_creator=Count('id', filter=Q(unread_for_creator=True)),
+            unread_assignee=Count('id', filter=Q(unread_for_assignee=True)),
+        )
+        latest = stats.pop('latest')
+        return (tuple(sorted((k, str(v)) for k, v in stats.items())), str(latest)), latest
 
     def get_permissions(self):
         if self.action in ['create','list','retrieve']: return [permissions.IsAuthenticated()]
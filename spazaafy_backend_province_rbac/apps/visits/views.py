@@ -1,8 +1,6 @@
-import csv
 import uuid 
 from datetime import timedelta
 from django.utils import timezone
-from django.http import HttpResponse
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -10,6 +8,7 @@ from django.utils import timezone
 from .models import SiteVisit, SiteVisitForm, SiteVisitStatus
 from .serializers import SiteVisitSerializer, SiteVisitFormSerializer
 from apps.core.permissions import ProvinceScopedMixin
+from apps.core.exports import stream_csv, full_name, choice_label
 
 
 class SiteVisitViewSet(ProvinceScopedMixin, viewsets.ModelViewSet):
@@ -70,23 +69,25 @@ class SiteVisitViewSet(ProvinceScopedMixin, viewsets.ModelViewSet):
     # ✅ THIS IS THE CORRECTED EXPORT FUNCTION FOR VISITS
     @action(detail=False, methods=['get'])
     def export_csv(self, request):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="site_visits.csv"'
-        writer = csv.writer(response)
-        
+        # Correct fields for each visit row (streamed; shop/inspector via JOINs)
+        def row(visit):
+            return [
+                visit['id'],
+                visit['shop__name'] if visit['shop__name'] is not None else 'N/A',
+                choice_label(SiteVisitStatus, visit['status']),
+                visit['requested_datetime'].strftime('%Y-%m-%d %H:%M'),
+                full_name(visit['inspector__first_name'], visit['inspector__last_name'])
+                if visit['inspector_id'] is not None else 'Not Assigned',
+            ]
+
         # Correct headers for visits
-        writer.writerow(['ID', 'Shop Name', 'Status', 'Requested Date', 'Inspector'])
-        
-        # Correct fields for each visit object
-        for visit in self.get_queryset():
-            writer.writerow([
-                visit.id,
-                visit.shop.name if visit.shop else 'N/A',
-                visit.get_status_display(),
-                visit.requested_datetime.strftime('%Y-%m-%d %H:%M'),
-                visit.inspector.get_full_name() if visit.inspector else 'Not Assigned'
-            ])
-        return response
+        return stream_csv(
+            self.get_queryset(), 'site_visits.csv',
+            ['ID', 'Shop Name', 'Status', 'Requested Date', 'Inspector'],
+            ['id', 'shop__name', 'status', 'requested_datetime',
+             'inspector_id', 'inspector__first_name', 'inspector__last_name'],
+            row=row,
+        )
     
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAdminUser])
     def generate_share_code(self, request, pk=None):
@@ -164,6 +164,12 @@ ANYMAIL = {
 # 3. Keep your default sender
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@spazaafy.com')
 
+# 4. Batch sends (apps/core/brevo.py): many recipients per Brevo API call
+BREVO_BATCH_SEND = os.getenv('BREVO_BATCH_SEND', 'True').lower() == 'true'
+BREVO_API_URL = os.environ.get('BREVO_API_URL', 'https://api.brevo.com/v3') # Point at a fake server in tests
+BREVO_BATCH_SIZE = int(os.environ.get('BREVO_BATCH_SIZE', '1000')) # Brevo's messageVersions limit
+BREVO_TIMEOUT = int(os.environ.get('BREVO_TIMEOUT', '30'))
+
 # ✅ Fallback Settings
 # If True, failed emails will just print to the Render/Terminal logs (100% reliable for Dev)
 # If False, you must provide EMAIL_BACKUP_USER and EMAIL_BACKUP_PASSWORD below
@@ -172,7 +178,49 @@ USE_CONSOLE_ON_FAIL = True
 # Optional: Real Gmail Backup (if you set USE_CONSOLE_ON_FAIL = False)
 EMAIL_BACKUP_USER = os.environ.get('EMAIL_BACKUP_USER', '')
 EMAIL_BACKUP_PASSWORD = os.environ.get('EMAIL_BACKUP_PASSWORD', '')
-
+EMAIL_BACKUP_HOST = os.environ.get('EMAIL_BACKUP_HOST', 'smtp.gmail.com')
+EMAIL_BACKUP_PORT = int(os.environ.get('EMAIL_BACKUP_PORT', '587'))
+EMAIL_BACKUP_TIMEOUT = int(os.environ.get('EMAIL_BACKUP_TIMEOUT', '20'))
+
+# Circuit breaker (apps/core/mail_dispatch.py): skip Brevo for COOLDOWN seconds
+# after THRESHOLD consecutive failures
+EMAIL_BREAKER_THRESHOLD = int(os.environ.get('EMAIL_BREAKER_THRESHOLD', '3'))
+EMAIL_BREAKER_COOLDOWN = int(os.environ.get('EMAIL_BREAKER_COOLDOWN', '60'))
+
+# --- Background Jobs (apps/core/jobs.py) ---
+# Jobs that run at the same time per process (e.g. CRM campaign sends)
+BACKGROUND_JOB_CONCURRENCY = int(os.environ.get('BACKGROUND_JOB_CONCURRENCY', '2'))
+# Worker threads that jobs fan their individual sends out to
+BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS', '8'))
+# Bulk mail commands (verification reminders/backfill): sender threads and max emails per second
+BULK_EMAIL_WORKERS = int(os.environ.get('BULK_EMAIL_WORKERS', '8'))
+BULK_EMAIL_RATE = float(os.environ.get('BULK_EMAIL_RATE', '20'))
+# Rows fetched per server-side cursor round trip by the streaming CSV exports (apps/core/exports.py)
+CSV_EXPORT_CHUNK_SIZE = int(os.environ.get('CSV_EXPORT_CHUNK_SIZE', '2000'))
+
+# --- Expo Push (apps/core/push.py) ---
+EXPO_PUSH_API_URL = os.environ.get('EXPO_PUSH_API_URL', 'https://exp.host/--/api/v2/push') # Point at a fake server in tests
+EXPO_ACCESS_TOKEN = os.environ.get('EXPO_ACCESS_TOKEN') # Only needed if enhanced push security is on
+EXPO_PUSH_BATCH_SIZE = int(os.environ.get('EXPO_PUSH_BATCH_SIZE', '100')) # Expo's per-request limit
+EXPO_PUSH_LINGER = float(os.environ.get('EXPO_PUSH_LINGER', '0.5')) # Seconds to wait for more messages to batch
+EXPO_PUSH_TIMEOUT = int(os.environ.get('EXPO_PUSH_TIMEOUT', '10'))
+
+# --- Nearby shops index (apps/shops/spatial_index.py) ---
+SHOP_SPATIAL_INDEX = os.getenv('SHOP_SPATIAL_INDEX', 'True').lower() == 'true'
+SHOP_INDEX_TTL = int(os.environ.get('SHOP_INDEX_TTL', '300')) # Rebuild to pick up edits made by other workers
+SHOP_INDEX_MAX_PENDING = int(os.environ.get('SHOP_INDEX_MAX_PENDING', '256')) # Signal updates before a rebuild
+# Public shop list/retrieve responses (apps/shops/cache.py): 'local' = per-process LRU,
+# or the name of a CACHES alias (e.g. a Redis cache) to share entries between workers
+SHOP_CACHE_BACKEND = os.environ.get('SHOP_CACHE_BACKEND', 'local')
+SHOP_CACHE_TTL = int(os.environ.get('SHOP_CACHE_TTL', '300'))
+SHOP_CACHE_MAX_ENTRIES = int(os.environ.get('SHOP_CACHE_MAX_ENTRIES', '512'))
+SHOP_CLUSTER_CACHE_TTL = int(os.environ.get('SHOP_CLUSTER_CACHE_TTL', '600')) # Per-tile map clusters (apps/shops/clusters.py)
+# Same choice for the cluster tiles; only a shared alias lets a save invalidate them in every worker
+SHOP_CLUSTER_CACHE_BACKEND = os.environ.get('SHOP_CLUSTER_CACHE_BACKEND', SHOP_CACHE_BACKEND)
+SHOP_CLUSTER_CACHE_MAX_ENTRIES = int(os.environ.get('SHOP_CLUSTER_CACHE_MAX_ENTRIES', '2048'))
+# Bulk shop onboarding (apps/shops/importer.py): rows per transaction and per file
+SHOP_IMPORT_BATCH_SIZE = int(os.environ.get('SHOP_IMPORT_BATCH_SIZE', '500'))
+SHOP_IMPORT_MAX_ROWS = int(os.environ.get('SHOP_IMPORT_MAX_ROWS', '20000'))
 
 
 # --- Frontend URL ---
@@ -201,6 +249,17 @@ AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.{AWS_S3_REGION_NAME}.amazo
 
 MEDIA_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/'
 
+# S3-compatible stand-in (e.g. MinIO at http://localhost:9000) for local development
+AWS_S3_ENDPOINT_URL = os.getenv('AWS_S3_ENDPOINT_URL') or None
+if AWS_S3_ENDPOINT_URL:
+    AWS_S3_ADDRESSING_STYLE = 'path'
+    AWS_S3_CUSTOM_DOMAIN = None
+    MEDIA_URL = f"{AWS_S3_ENDPOINT_URL.rstrip('/')}/{AWS_STORAGE_BUCKET_NAME}/"
+
+# Direct-to-S3 document uploads (apps/compliance/uploads.py)
+DOCUMENT_UPLOAD_MAX_BYTES = int(os.getenv('DOCUMENT_UPLOAD_MAX_BYTES', str(10 * 1024 * 1024)))
+DOCUMENT_UPLOAD_URL_EXPIRES = int(os.getenv('DOCUMENT_UPLOAD_URL_EXPIRES', '900')) # Seconds
+
 STORAGES = {
     "default": {
         "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
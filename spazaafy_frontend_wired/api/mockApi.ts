@@ -626,8 +626,26 @@ const shops = {
     return toShop(data);
   },
   async exportCsv() { await requestAndDownloadCsv('/shops/export_csv/', 'spaza_shops.csv'); },
+  // Admin: onboard owners + shops from a CSV/XLSX sheet; returns a per-row error report
+  async bulkImport(file: File, options: { dryRun?: boolean; batchSize?: number } = {}): Promise<{
+    rows: number; valid: number; created: number; dry_run: boolean;
+    errors: { row: number; email: string; errors: string[] }[];
+  }> {
+    const form = new FormData();
+    form.append('file', file, file.name);
+    if (options.dryRun) form.append('dry_run', 'true');
+    if (options.batchSize) form.append('batch_size', String(options.batchSize));
+    return requestWithFile('/shops/bulk_import/', { method: 'POST', body: form });
+  },
 };
 
+// Hex SHA-256 of a file, or null where Web Crypto is unavailable (e.g. plain-http dev servers)
+async function sha256Hex(file: File): Promise<string | null> {
+  if (typeof crypto === 'undefined' || !crypto.subtle) return null;
+  const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
 const documents = {
   async list(): Promise<ShopDocument[]> {
     const data = await request<any[]>('/compliance/documents/');
@@ -642,18 +660,36 @@ const documents = {
       lng?: number;       // New
       accuracy?: number;  // New
   }) {
-    const form = new FormData();
-    form.append('shop', shopId); 
-    form.append('type', payload.type);
-    form.append('file', payload.file, payload.file.name);
-    if (payload.expiry_date) { form.append('expiry_date', payload.expiry_date); }
+    // ✅ Direct-to-S3: 1) get a presigned POST, 2) upload the file to S3, 3) confirm
+    // The file's hash lets the server recognise a file this shop already uploaded (step 2 is then skipped)
+    // and is signed into the presigned POST, so S3 rejects the upload if the bytes don't match it
+    const sha256 = await sha256Hex(payload.file);
+    const presigned = await request<{ url: string; fields: Record<string, string>; upload_token: string; max_bytes: number; duplicate?: boolean }>(
+      '/compliance/documents/presign_upload/',
+      { method: 'POST', body: JSON.stringify({ type: payload.type, filename: payload.file.name, ...(sha256 ? { sha256 } : {}) }) }
+    );
+    if (!presigned.duplicate) {
+      if (payload.file.size > presigned.max_bytes) {
+        throw new Error(`File is too large (max ${Math.round(presigned.max_bytes / (1024 * 1024))} MB).`);
+      }
 
-    // ✅ NEW: Append location keys if they exist
-    if (payload.lat !== undefined) form.append('upload_lat', String(payload.lat));
-    if (payload.lng !== undefined) form.append('upload_lng', String(payload.lng));
-    if (payload.accuracy !== undefined) form.append('upload_accuracy', String(payload.accuracy));
+      const form = new FormData();
+      Object.entries(presigned.fields).forEach(([key, value]) => form.append(key, value));
+      form.append('file', payload.file, payload.file.name); // Must be the last field
+      const s3 = await fetch(presigned.url, { method: 'POST', body: form });
+      if (!s3.ok) { throw new Error(`Upload failed (${s3.status}). Please try again.`); }
+    }
 
-    const json = await requestWithFile<any>('/compliance/documents/', { method: 'POST', body: form });
+    const json = await request<any>('/compliance/documents/confirm_upload/', {
+      method: 'POST',
+      body: JSON.stringify({
+        upload_token: presigned.upload_token,
+        upload_lat: payload.lat,
+        upload_lng: payload.lng,
+        upload_accuracy: payload.accuracy,
+        expiry_date: payload.expiry_date || null,
+      }),
+    });
     return toDocument(json);
   },
 
@@ -666,6 +702,51 @@ const documents = {
   },
   
   async exportCsv() { await requestAndDownloadCsv('/compliance/documents/export_csv/', 'documents.csv'); },
+
+  async storageReport() {
+    return request<{ documents: number; stored_objects: number; referenced_bytes: number; stored_bytes: number; saved_bytes: number }>(
+      '/compliance/documents/storage_report/'
+    );
+  },
+
+  // Admin triage: PENDING documents in review order, one keyset page at a time
+  async queue(cursor?: string | null, options: { pageSize?: number; type?: string } = {}) {
+    const params = new URLSearchParams();
+    if (cursor) params.set('cursor', cursor);
+    if (options.pageSize) params.set('page_size', String(options.pageSize));
+    if (options.type) params.set('type', options.type);
+    const data = await request<{ results: any[]; next_cursor: string | null; pending_count?: number }>(
+      `/compliance/documents/queue/?${params.toString()}`
+    );
+    return {
+      results: data.results.map((doc: any) => ({
+        ...toDocument(doc),
+        ownerName: doc.owner_name,
+        ownerEmail: doc.owner_email,
+        province: doc.province,
+        missingRequired: doc.missing_required,
+      })),
+      nextCursor: data.next_cursor,
+      pendingCount: data.pending_count,
+    };
+  },
+  async bulkReview(decisions: { id: string; action: 'verify' | 'reject'; notes?: string; rejectionReason?: string; expiryDate?: string }[]) {
+    return request<{ verified: number; rejected: number; shops_updated: number; errors: { id: number; error: string }[] }>(
+      '/compliance/documents/bulk_review/',
+      {
+        method: 'POST',
+        body: JSON.stringify({
+          decisions: decisions.map(d => ({
+            id: Number(d.id),
+            action: d.action,
+            notes: d.notes,
+            rejection_reason: d.rejectionReason,
+            expiry_date: d.expiryDate,
+          })),
+        }),
+      }
+    );
+  },
 };
 
 const SITE_VISIT_API_MAP: Record<string, string> = {
@@ -868,6 +949,15 @@ const crm = {
             body: JSON.stringify({ template_id: templateId, recipients })
         });
     },
+    async getSendStatus(jobId: string) {
+        return request(`/core/crm/send_status/?job_id=${jobId}`);
+    },
+    async resumeSend(jobId: string, force = false) {
+        return request('/core/crm/resume_send/', {
+            method: 'POST',
+            body: JSON.stringify({ job_id: jobId, force })
+        });
+    },
     async updateCampaignStatus(id: string, status: string) {
         return request(`/core/crm/${id}/`, {
             method: 'PATCH',
@@ -875,8 +965,9 @@ const crm = {
         });
     },
     
-    async getTemplateAnalytics(templateId: string) {
-        return request(`/core/crm/template_analytics/?template_id=${templateId}`);
+    async getTemplateAnalytics(templateId: string, cursor?: string) {
+        const cursorParam = cursor ? `&cursor=${encodeURIComponent(cursor)}` : '';
+        return request(`/core/crm/template_analytics/?template_id=${templateId}${cursorParam}`);
     },
 
     async updateTemplate(id: string, data: any) {
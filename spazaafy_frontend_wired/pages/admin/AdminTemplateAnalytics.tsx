@@ -15,6 +15,7 @@ const AdminTemplateAnalytics: React.FC = () => {
     const { templateId } = useParams<{ templateId: string }>();
     const [data, setData] = useState<any>(null);
     const [loading, setLoading] = useState(true);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     useEffect(() => {
         const fetchStats = async () => {
@@ -31,6 +32,19 @@ const AdminTemplateAnalytics: React.FC = () => {
         fetchStats();
     }, [templateId]);
 
+    const loadMoreLogs = async () => {
+        if (!templateId || !data?.next_cursor) return;
+        setLoadingMore(true);
+        try {
+            const res = await mockApi.crm.getTemplateAnalytics(templateId, data.next_cursor);
+            setData((prev: any) => ({ ...prev, logs: [...prev.logs, ...res.logs], next_cursor: res.next_cursor }));
+        } catch (e) {
+            console.error(e);
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     if (loading) return <div className="p-8">Loading Analytics...</div>;
     if (!data) return <div className="p-8 text-red-500">No data found</div>;
 
@@ -139,7 +153,7 @@ const AdminTemplateAnalytics: React.FC = () => {
             </div>
 
             {/* Recent Logs Table */}
-            <Card title="Recent Activity Log (Last 50)">
+            <Card title="Recent Activity Log">
                 <div className="overflow-x-auto">
                     <table className="w-full text-left text-sm text-gray-600 dark:text-gray-300">
                         <thead className="bg-gray-50 dark:bg-gray-700/50 text-xs uppercase font-medium text-gray-500">
@@ -178,6 +192,17 @@ const AdminTemplateAnalytics: React.FC = () => {
                     {logs.length === 0 && (
                         <div className="p-8 text-center text-gray-400">No emails have been sent for this template yet.</div>
                     )}
+                    {data.next_cursor && (
+                        <div className="p-4 text-center">
+                            <button
+                                onClick={loadMoreLogs}
+                                disabled={loadingMore}
+                                className="text-sm font-medium text-blue-600 hover:underline disabled:opacity-50"
+                            >
+                                {loadingMore ? 'Loading...' : 'Load older activity'}
+                            </button>
+                        </div>
+                    )}
                 </div>
             </Card>
         </div>